@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Transaction
+from .models import IngestionJob, QuarantinedNote, TaxMonthlyResult, Transaction
 
 
 @admin.register(Transaction)
@@ -7,3 +7,22 @@ class TransactionAdmin(admin.ModelAdmin):
     list_display = ('date', 'ticker', 'category', 'liquid_value')
     list_filter = ('category', 'date')
     search_fields = ('ticker', 'asset_class')
+
+
+@admin.register(IngestionJob)
+class IngestionJobAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'asset_type', 'status', 'processed_files', 'total_files', 'imported_count', 'created_at')
+    list_filter = ('status',)
+
+
+@admin.register(TaxMonthlyResult)
+class TaxMonthlyResultAdmin(admin.ModelAdmin):
+    list_display = ('month', 'pool', 'sales_total', 'result', 'exempt_result', 'loss_balance', 'tax_due')
+    list_filter = ('pool',)
+
+
+@admin.register(QuarantinedNote)
+class QuarantinedNoteAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'reason', 'seconds', 'error', 'created_at')
+    list_filter = ('reason',)
+    search_fields = ('filename', 'content_hash')
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BrokerageAnalyzerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'brokerage_analyzer'
+
+    def ready(self):
+        import brokerage_analyzer.signals  # noqa
@@ -0,0 +1,62 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from brokerage_analyzer.src.infrastructure.note_generator import GROUND_TRUTH_FILE, NoteGenerator
+from brokerage_analyzer.src.use_cases.parser_benchmark import PARSERS, compare_results, run_benchmark
+
+
+class Command(BaseCommand):
+    help = ("Measures notes/s, p95 latency, peak RSS and accuracy of each parser configuration and of "
+            "DataAggregator over a synthetic corpus, and writes the results as JSON")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', help="Folder written by generate_brokerage_notes (default: a temporary one)")
+        parser.add_argument('--notes', type=int, default=200, help="Size of the temporary corpus")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--parsers', nargs='+', choices=list(PARSERS), default=list(PARSERS))
+        parser.add_argument('--workers', type=int, default=1, help="DataAggregator process pool size")
+        parser.add_argument('--output', default='parser_benchmark.json')
+        parser.add_argument('--baseline', help="Earlier results file to compare against")
+
+    def handle(self, *args, **options):
+        corpus = options['corpus']
+        if corpus and not os.path.isfile(os.path.join(corpus, GROUND_TRUTH_FILE)):
+            raise CommandError(f"No {GROUND_TRUTH_FILE} in {corpus}")
+
+        tmp_dir = None
+        if not corpus:
+            corpus = tmp_dir = tempfile.mkdtemp()
+            NoteGenerator(seed=options['seed']).generate(corpus, options['notes'])
+        try:
+            results = run_benchmark(corpus, options['parsers'], options['workers'])
+        finally:
+            if tmp_dir:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+
+        self.stdout.write(f"{results['corpus']['notes']} notes, {results['corpus']['pages']} pages")
+        for name, r in results['parsers'].items():
+            self.stdout.write(
+                f"{name:>10}: {r['notes_per_second']:.1f} notes/s, p95 {r['p95_ms']:.1f} ms, "
+                f"peak RSS {r['peak_rss_mb']:.0f} MB (+{r['rss_growth_mb']:.0f}), exact {r['exact']:.1%}"
+            )
+        r = results['aggregator']
+        self.stdout.write(
+            f"aggregator: {r['notes_per_second']:.1f} notes/s with {r['workers']} worker(s), "
+            f"peak RSS {r['peak_rss_mb']:.0f} MB (+{r['rss_growth_mb']:.0f}), workers {r['peak_worker_rss_mb']:.0f} MB"
+        )
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            self.stdout.write(f"\nvs {options['baseline']}:")
+            for metric, before, now, change in compare_results(results, baseline):
+                self.stdout.write(f"{metric}: {before} -> {now} ({change:+.1%})")
+
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
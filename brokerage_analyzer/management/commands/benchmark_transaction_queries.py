@@ -0,0 +1,115 @@
+import random
+import statistics
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import Count, Sum
+
+from brokerage_analyzer.models import Transaction
+from brokerage_analyzer.src.use_cases.ingestion import NATURAL_KEY, UPSERT_FIELDS
+
+TICKERS = ['PETR4', 'VALE3', 'ITSA4', 'BBAS3', 'HGLG11', 'KNRI11', 'MXRF11', 'BOVA11', 'IVVB11', 'WIN', 'WDO']
+CATEGORIES = {'HGLG11': 'FIIs', 'KNRI11': 'FIIs', 'MXRF11': 'FIIs', 'BOVA11': 'ETFs', 'IVVB11': 'ETFs',
+              'WIN': 'Futures - WIN', 'WDO': 'Futures - WDO'}
+
+
+class Command(BaseCommand):
+    help = ("Fills the Transaction table with synthetic rows inside a transaction that is rolled back, "
+            "then prints query plans and latencies of the brokerage access paths")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per query (median is reported)")
+        parser.add_argument('--database', default='default', help="Database alias (e.g. a PostgreSQL DATABASE_URL)")
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        vendor = connections[alias].vendor
+        self.stdout.write(f"{vendor}: {options['rows']:,} rows")
+
+        with transaction.atomic(using=alias):
+            self.populate(alias, options['rows'])
+            for name, queryset in self.queries(alias):
+                self.report(alias, name, queryset, options['repeat'])
+            self.report_upsert(alias, options['repeat'])
+
+            # Leave the database as it was
+            transaction.set_rollback(True, using=alias)
+
+    def populate(self, alias, rows):
+        rnd = random.Random(0)
+        start = time.perf_counter()
+        first_day = date(2015, 1, 1)
+        batch = []
+        for i in range(rows):
+            ticker = rnd.choice(TICKERS)
+            value = Decimal(rnd.randint(-500000, 500000)) / 100
+            batch.append(Transaction(
+                date=first_day + timedelta(days=rnd.randint(0, 3650)),
+                category=CATEGORIES.get(ticker, 'Stocks'),
+                asset_class=f"{ticker} - {'C' if value < 0 else 'V'}",
+                ticker=ticker,
+                liquid_value=value,
+                buy_value=-value if value < 0 else 0,
+                sell_value=value if value > 0 else 0,
+                filename=f"nota_{i}.pdf",
+                source_hash=f"{i:064x}",
+            ))
+            if len(batch) == 10_000:
+                Transaction.objects.using(alias).bulk_create(batch)
+                batch = []
+        Transaction.objects.using(alias).bulk_create(batch)
+
+        with connections[alias].cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write(f"populated in {time.perf_counter() - start:.1f}s\n")
+
+    def queries(self, alias):
+        transactions = Transaction.objects.using(alias)
+        some_day = date(2020, 6, 15)
+        return [
+            ("dashboard: latest 50", transactions.order_by('-date')[:50]),
+            ("dashboard: totals by category",
+             transactions.order_by().values('category').annotate(total=Sum('liquid_value'))),
+            ("category over a month",
+             transactions.filter(category='Stocks', date__range=(some_day, some_day + timedelta(days=30)))
+             .order_by().values('category').annotate(total=Sum('liquid_value'))),
+            ("(date, ticker) groups of one day",
+             transactions.filter(date=some_day).order_by().values('date', 'ticker').annotate(n=Count('id'))),
+            ("re-import lookup by source hash",
+             transactions.filter(source_hash__in=[f"{i:064x}" for i in range(0, 100_000, 1000)])),
+        ]
+
+    def report(self, alias, name, queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(queryset.all())
+            timings.append((time.perf_counter() - start) * 1000)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{name}: {statistics.median(timings):.2f} ms"))
+        self.stdout.write(queryset.explain())
+        self.stdout.write("")
+
+    def report_upsert(self, alias, repeat):
+        """Times bulk_create(update_conflicts=True) of 1000 rows that already exist."""
+        existing = list(Transaction.objects.using(alias).order_by('pk')[:1000])
+        timings = []
+        for _ in range(repeat):
+            upserts = [
+                Transaction(date=t.date, ticker=t.ticker, category=t.category, source_hash=t.source_hash,
+                            asset_class=t.asset_class, liquid_value=t.liquid_value, buy_value=t.buy_value,
+                            sell_value=t.sell_value, filename=t.filename)
+                for t in existing
+            ]
+            start = time.perf_counter()
+            Transaction.objects.using(alias).bulk_create(
+                upserts, update_conflicts=True, unique_fields=NATURAL_KEY, update_fields=UPSERT_FIELDS
+            )
+            timings.append((time.perf_counter() - start) * 1000)
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"upsert of 1000 existing rows: {statistics.median(timings):.2f} ms"
+        ))
@@ -0,0 +1,41 @@
+import glob
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from brokerage_analyzer.src.use_cases.strategy_comparison import FIELDS, compare_strategies
+
+
+class Command(BaseCommand):
+    help = "Compares the fast and layout text extraction strategies over a folder of brokerage note PDFs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help="Folder with brokerage note PDFs (searched recursively)")
+        parser.add_argument('--show-diffs', action='store_true', help="List every field that disagrees")
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        if not os.path.isdir(directory):
+            raise CommandError(f"Not a directory: {directory}")
+
+        file_paths = sorted(glob.glob(os.path.join(directory, '**', '*.pdf'), recursive=True))
+        if not file_paths:
+            raise CommandError(f"No PDF files found in {directory}")
+
+        report = compare_strategies(file_paths)
+        total = report['files']
+        reference = report['reference']
+
+        self.stdout.write(f"{total} files")
+        for strategy, seconds in report['timings'].items():
+            self.stdout.write(f"{strategy:>8}: {seconds:.2f}s ({seconds / total * 1000:.1f} ms/file)")
+
+        for strategy, counts in report['agreement'].items():
+            speedup = report['timings'][reference] / max(report['timings'][strategy], 1e-9)
+            self.stdout.write(f"\n{strategy} vs {reference}: {speedup:.1f}x faster")
+            for field in FIELDS:
+                self.stdout.write(f"{field:>8}: {counts[field]}/{total} ({counts[field] / total:.1%})")
+
+        if options['show_diffs']:
+            for filename, strategy, field, got, expected in report['disagreements']:
+                self.stdout.write(f"{filename}: {field} {strategy}={got!r} {reference}={expected!r}")
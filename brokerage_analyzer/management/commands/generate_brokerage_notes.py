@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from brokerage_analyzer.src.infrastructure.note_generator import GROUND_TRUTH_FILE, NoteGenerator
+
+
+class Command(BaseCommand):
+    help = "Writes synthetic SINACOR-style brokerage notes (stocks and WIN/WDO futures) with their ground truth"
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help="Output folder (created if missing)")
+        parser.add_argument('--count', type=int, default=100)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--futures-ratio', type=float, default=0.3, help="Share of futures notes")
+        parser.add_argument('--max-pages', type=int, default=3, help="Longest stock note, in pages")
+
+    def handle(self, *args, **options):
+        generator = NoteGenerator(seed=options['seed'], futures_ratio=options['futures_ratio'],
+                                  max_pages=options['max_pages'])
+        truth = generator.generate(options['directory'], options['count'])
+        futures = sum(e['kind'] == 'futures' for e in truth)
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(truth)} notes ({futures} futures, {sum(e['pages'] for e in truth)} pages) written to "
+            f"{options['directory']}, ground truth in {GROUND_TRUTH_FILE}"
+        ))
@@ -0,0 +1,55 @@
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from brokerage_analyzer.forms import UploadNotesForm
+from brokerage_analyzer.src.infrastructure import pdf_parser
+from brokerage_analyzer.src.use_cases.directory_import import CHECKPOINT_FILE, DirectoryImport
+
+
+class Command(BaseCommand):
+    help = ("Imports every brokerage note PDF under a directory in batches across worker processes, "
+            "checkpointing finished files so an interrupted run resumes where it stopped")
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help="Folder with the PDFs (walked recursively)")
+        parser.add_argument('--asset-type', default='Fundos e Acoes',
+                            choices=[value for value, _ in UploadNotesForm.ASSET_TYPES])
+        parser.add_argument('--batch-size', type=int, default=500, help="Files parsed and saved per batch")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Parsing processes (default: BROKERAGE_PARSE_WORKERS)")
+        parser.add_argument('--checkpoint', help=f"Checkpoint file (default: <directory>/{CHECKPOINT_FILE})")
+        parser.add_argument('--retry-failed', action='store_true',
+                            help="Parse again the files that failed before (releasing them from the quarantine)")
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        if not os.path.isdir(directory):
+            raise CommandError(f"Not a directory: {directory}")
+        if options['verbosity'] < 2:
+            # One INFO line per note would drown the batch progress
+            logging.getLogger(pdf_parser.__name__).setLevel(logging.WARNING)
+
+        job = DirectoryImport(
+            directory, options['asset_type'], batch_size=options['batch_size'],
+            workers=options['workers'] or settings.BROKERAGE_PARSE_WORKERS,
+            checkpoint_path=options['checkpoint'], retry_failed=options['retry_failed'],
+        )
+        if len(job.checkpoint):
+            self.stdout.write(f"Resuming: {len(job.checkpoint)} files in the checkpoint {job.checkpoint.path}")
+
+        start = time.perf_counter()
+
+        def progress(totals):
+            rate = totals['files'] / (time.perf_counter() - start)
+            self.stdout.write(f"Batch {totals['batches']}: {totals['files']} files ({rate:.1f}/s), "
+                              f"{totals['imported']} imported, {totals['updated']} updated, {totals['failed']} failed")
+
+        totals = job.run(progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"{totals['files']} files imported in {totals['seconds']}s ({totals['skipped']} already done, "
+            f"{totals['failed']} failed): {totals['imported']} transactions imported, {totals['updated']} updated"
+        ))
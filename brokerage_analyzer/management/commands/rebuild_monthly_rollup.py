@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from brokerage_analyzer.src.infrastructure import export_cache, rollup
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the (year, month, category) MonthlyRollup from the Transaction table and verifies it"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify-only', action='store_true',
+                            help="Only compare the stored rollup with a fresh aggregation")
+
+    def handle(self, *args, **options):
+        if not options['verify_only']:
+            count = rollup.rebuild()
+            export_cache.bump_version()
+            self.stdout.write(f"Rebuilt {count} rollup rows")
+
+        mismatches = rollup.verify()
+        for key, expected, stored in mismatches:
+            self.stdout.write(f"{key}: expected {expected}, stored {stored}")
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} rollup rows out of date (run without --verify-only to rebuild)")
+
+        self.stdout.write(self.style.SUCCESS("Monthly rollup is consistent"))
@@ -0,0 +1,28 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from brokerage_analyzer.models import TaxLedgerState
+from brokerage_analyzer.src.infrastructure import export_cache
+from brokerage_analyzer.src.use_cases import tax_ledger
+
+
+class Command(BaseCommand):
+    help = "Recomputes the income-tax ledger (positions and monthly results), by default over the whole history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='from_month', help="First month to recompute (YYYY-MM)")
+
+    def handle(self, *args, **options):
+        from_month = None
+        if options['from_month']:
+            try:
+                from_month = datetime.strptime(options['from_month'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError(f"Invalid month: {options['from_month']} (expected YYYY-MM)")
+
+        written = tax_ledger.recompute(from_month)
+        if from_month is None:
+            TaxLedgerState.objects.filter(pk=1).update(dirty_from=None)
+        export_cache.bump_version()
+        self.stdout.write(self.style.SUCCESS(f"{written} monthly results written"))
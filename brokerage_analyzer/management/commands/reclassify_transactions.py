@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from brokerage_analyzer.src.infrastructure.instrument_registry import get_registry
+from brokerage_analyzer.src.use_cases.reclassification import pending_changes, reclassify_transactions
+
+
+class Command(BaseCommand):
+    help = "Re-applies the instrument registry (data/instruments.json) to the categories of stored transactions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only list the tickers that would move")
+
+    def handle(self, *args, **options):
+        registry = get_registry()
+        self.stdout.write(f"Instrument registry version {registry.version}")
+
+        changes = pending_changes(registry)
+        for ticker, category in sorted(changes.items()):
+            self.stdout.write(f"{ticker} -> {category}")
+        if not changes:
+            self.stdout.write(self.style.SUCCESS("All transactions already match the registry"))
+            return
+        if options['dry_run']:
+            return
+
+        updated = reclassify_transactions(registry, changes)
+        self.stdout.write(self.style.SUCCESS(f"{updated} transactions reclassified"))
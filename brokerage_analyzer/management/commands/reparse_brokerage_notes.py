@@ -0,0 +1,36 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from brokerage_analyzer.src.infrastructure import pdf_parser
+from brokerage_analyzer.src.use_cases.reparse import apply_changes, reparse_texts
+
+
+class Command(BaseCommand):
+    help = ("Re-runs the note heuristics over the stored extracted texts (no PDF needed) and rebuilds the "
+            "transactions whose notes changed")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only count the notes that would change")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Texts read and compared per batch")
+
+    def handle(self, *args, **options):
+        if options['verbosity'] < 2:
+            # One INFO line per note would dominate the run time
+            logging.getLogger(pdf_parser.__name__).setLevel(logging.WARNING)
+
+        start = time.perf_counter()
+        count, changed, partial = reparse_texts(chunk_size=options['chunk_size'])
+        seconds = time.perf_counter() - start
+        rate = count / seconds if seconds else 0
+        self.stdout.write(f"{count} stored texts re-parsed in {seconds:.2f}s ({rate:.0f} notes/s), "
+                          f"{len(changed)} changed")
+        if partial:
+            self.stdout.write(self.style.WARNING(
+                f"{partial} partial texts skipped (extraction stopped early): re-import their PDFs to re-parse them"))
+        if not changed or options['dry_run']:
+            return
+
+        deleted, saved = apply_changes(changed)
+        self.stdout.write(self.style.SUCCESS(f"{deleted} transactions replaced by {saved}"))
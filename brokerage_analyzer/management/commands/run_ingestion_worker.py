@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from brokerage_analyzer.src.use_cases.ingestion import claim_next_job, run_job
+
+
+class Command(BaseCommand):
+    help = "Runs queued brokerage note ingestion jobs (local worker, no external broker)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the queue and exit instead of polling")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds between queue checks")
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(f"Job {job.pk}: {job.total_files} files ({job.asset_type})")
+            job = run_job(job)
+            if job.status == job.STATUS_DONE:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Job {job.pk}: {job.imported_count} imported, {job.skipped_count} already imported (updated)"
+                ))
+            else:
+                self.stdout.write(self.style.ERROR(f"Job {job.pk} failed: {job.error}"))
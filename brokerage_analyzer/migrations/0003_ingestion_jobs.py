@@ -0,0 +1,47 @@
+# Generated by Django 4.2.27 on 2026-10-17 00:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brokerage_analyzer', '0002_parse_cache_source_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('asset_type', models.CharField(max_length=50)),
+                ('status', models.CharField(choices=[('pending', 'Pendente'), ('running', 'Processando'), ('done', 'Concluído'), ('failed', 'Falhou')], db_index=True, default='pending', max_length=20)),
+                ('total_files', models.PositiveIntegerField(default=0)),
+                ('processed_files', models.PositiveIntegerField(default=0)),
+                ('imported_count', models.PositiveIntegerField(default=0)),
+                ('skipped_count', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='IngestionFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('content', models.BinaryField(blank=True, default=b'')),
+                ('status', models.CharField(choices=[('pending', 'Pendente'), ('done', 'Processado'), ('failed', 'Falhou')], default='pending', max_length=20)),
+                ('error', models.TextField(blank=True, default='')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='files', to='brokerage_analyzer.ingestionjob')),
+            ],
+            options={
+                'ordering': ['pk'],
+            },
+        ),
+    ]
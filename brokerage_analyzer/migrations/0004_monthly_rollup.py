@@ -0,0 +1,46 @@
+# Generated by Django 4.2.27 on 2026-10-17 00:44
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+
+def build_rollup(apps, schema_editor):
+    Transaction = apps.get_model('brokerage_analyzer', 'Transaction')
+    MonthlyRollup = apps.get_model('brokerage_analyzer', 'MonthlyRollup')
+    rows = (
+        Transaction.objects.order_by()
+        .annotate(year=ExtractYear('date'), month=ExtractMonth('date'))
+        .values('year', 'month', 'category')
+        .annotate(transaction_count=Count('id'), buy_total=Sum('buy_value'), sell_total=Sum('sell_value'),
+                  liquid_total=Sum('liquid_value'))
+    )
+    MonthlyRollup.objects.bulk_create([MonthlyRollup(**row) for row in rows])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brokerage_analyzer', '0003_ingestion_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('category', models.CharField(max_length=50)),
+                ('transaction_count', models.IntegerField(default=0)),
+                ('buy_total', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('sell_total', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('liquid_total', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+            ],
+            options={
+                'ordering': ['year', 'month', 'category'],
+                'unique_together': {('year', 'month', 'category')},
+            },
+        ),
+        migrations.RunPython(build_rollup, migrations.RunPython.noop),
+    ]
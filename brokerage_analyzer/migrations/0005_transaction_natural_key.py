@@ -0,0 +1,66 @@
+# Generated by Django 4.2.27 on 2026-10-17 00:45
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+KEY = ('date', 'ticker', 'category', 'source_hash')
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Collapses rows that share the new natural key before the constraint is added.
+    Rows with a source hash are re-imports of the same files and are dropped;
+    legacy rows without one come from separate uploads and are summed into one row.
+    The monthly rollup is then rebuilt, since counts (and dropped re-imports) changed.
+    """
+    Transaction = apps.get_model('brokerage_analyzer', 'Transaction')
+    MonthlyRollup = apps.get_model('brokerage_analyzer', 'MonthlyRollup')
+
+    duplicates = (
+        Transaction.objects.order_by().values(*KEY)
+        .annotate(rows=Count('id'), keep=Min('id'), liquid=Sum('liquid_value'), buy=Sum('buy_value'),
+                  sell=Sum('sell_value'))
+        .filter(rows__gt=1)
+    )
+    if not duplicates.exists():
+        return
+
+    for group in duplicates:
+        rows = Transaction.objects.filter(**{k: group[k] for k in KEY})
+        if not group['source_hash']:
+            filenames = sorted(set(rows.values_list('filename', flat=True)))
+            rows.filter(id=group['keep']).update(
+                liquid_value=group['liquid'], buy_value=group['buy'], sell_value=group['sell'],
+                filename=", ".join(filenames)[:255]
+            )
+        rows.exclude(id=group['keep']).delete()
+
+    MonthlyRollup.objects.all().delete()
+    totals = (
+        Transaction.objects.order_by()
+        .annotate(year=ExtractYear('date'), month=ExtractMonth('date'))
+        .values('year', 'month', 'category')
+        .annotate(transaction_count=Count('id'), buy_total=Sum('buy_value'), sell_total=Sum('sell_value'),
+                  liquid_total=Sum('liquid_value'))
+    )
+    MonthlyRollup.objects.bulk_create([MonthlyRollup(**row) for row in totals])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brokerage_analyzer', '0004_monthly_rollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['category', 'date'], name='transaction_category_date'),
+        ),
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.UniqueConstraint(fields=('date', 'ticker', 'category', 'source_hash'), name='transaction_natural_key'),
+        ),
+    ]
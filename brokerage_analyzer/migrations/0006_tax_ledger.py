@@ -0,0 +1,75 @@
+# Generated by Django 4.2.27 on 2026-10-17 00:55
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def mark_history_dirty(apps, schema_editor):
+    """Existing transactions are computed by the first ledger refresh."""
+    Transaction = apps.get_model('brokerage_analyzer', 'Transaction')
+    TaxLedgerState = apps.get_model('brokerage_analyzer', 'TaxLedgerState')
+    first = Transaction.objects.aggregate(first=Min('date'))['first']
+    TaxLedgerState.objects.create(pk=1, dirty_from=first.replace(day=1) if first else None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brokerage_analyzer', '0005_transaction_natural_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaxLedgerState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dirty_from', models.DateField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='buy_quantity',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='sell_quantity',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='TaxPosition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ticker', models.CharField(max_length=20)),
+                ('month', models.DateField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('total_cost', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+            ],
+            options={
+                'ordering': ['ticker', 'month'],
+                'unique_together': {('ticker', 'month')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TaxMonthlyResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('pool', models.CharField(choices=[('swing', 'Operações comuns'), ('day_trade', 'Day trade'), ('fii', 'FIIs')], max_length=20)),
+                ('sales_total', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('stock_sales_total', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('result', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('exempt_result', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('loss_offset', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('taxable_result', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('loss_balance', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('tax_due', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('unquantified_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['month', 'pool'],
+                'unique_together': {('month', 'pool')},
+            },
+        ),
+        migrations.RunPython(mark_history_dirty, migrations.RunPython.noop),
+    ]
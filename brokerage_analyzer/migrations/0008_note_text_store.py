@@ -0,0 +1,30 @@
+# Generated by Django 4.2.27 on 2026-10-17 01:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brokerage_analyzer', '0007_data_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoteText',
+            fields=[
+                ('content_hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('asset_type', models.CharField(max_length=50)),
+                ('strategy', models.CharField(max_length=20)),
+                ('text', models.BinaryField(blank=True, default=b'')),
+                ('text_length', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='note_texts',
+            field=models.ManyToManyField(blank=True, related_name='transactions', to='brokerage_analyzer.notetext'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.27 on 2026-10-17 01:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brokerage_analyzer', '0008_note_text_store'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuarantinedNote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+                ('filename', models.CharField(max_length=255)),
+                ('reason', models.CharField(choices=[('timeout', 'Tempo esgotado'), ('memory', 'Limite de memória'), ('crash', 'Processo encerrado'), ('error', 'Erro')], max_length=20)),
+                ('error', models.TextField(blank=True, default='')),
+                ('seconds', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
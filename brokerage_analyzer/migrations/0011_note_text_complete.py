@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brokerage_analyzer', '0010_ingestion_job_heartbeat'),
+    ]
+
+    operations = [
+        # Texts stored so far may stop where incremental extraction did: they count as partial
+        migrations.AddField(
+            model_name='notetext',
+            name='complete',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='notetext',
+            name='complete',
+            field=models.BooleanField(default=True),
+        ),
+    ]
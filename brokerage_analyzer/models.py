@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 
 class Transaction(models.Model):
@@ -17,15 +18,264 @@ class Transaction(models.Model):
 
     # Values
     liquid_value = models.DecimalField(max_digits=15, decimal_places=2)
+    # Trade values of the ticker's purchases and sales with their pro rata share of the note's fees
+    # (the settlement on its side when the note has no trade lines to split)
     buy_value = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     sell_value = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    # Quantities read from the note's trade lines (0 when unknown), used for the average cost
+    buy_quantity = models.PositiveIntegerField(default=0)
+    sell_quantity = models.PositiveIntegerField(default=0)
 
     # Metadata
     filename = models.CharField(max_length=255)
+    # SHA-256 of the source PDF (or digest of the sorted hashes when aggregated from several files)
+    source_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    # Stored text of the notes the row was built from, so it can be re-parsed without the PDFs
+    note_texts = models.ManyToManyField('NoteText', blank=True, related_name='transactions')
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['date']
+        constraints = [
+            # Natural key: imports upsert on it instead of appending duplicates.
+            # Its index (date, ticker, ...) also serves date ordering and the (date, ticker) grouping.
+            models.UniqueConstraint(fields=['date', 'ticker', 'category', 'source_hash'],
+                                    name='transaction_natural_key'),
+        ]
+        indexes = [
+            models.Index(fields=['category', 'date'], name='transaction_category_date'),
+        ]
 
     def __str__(self):
         return f"{self.date} - {self.ticker} ({self.liquid_value})"
+
+
+class MonthlyRollup(models.Model):
+    """
+    Transaction totals per (year, month, category), kept up to date incrementally
+    (see src/infrastructure/rollup.py) so the dashboard and the Excel summaries
+    never scan the Transaction table.
+    """
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    category = models.CharField(max_length=50)
+
+    transaction_count = models.IntegerField(default=0)
+    buy_total = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    sell_total = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    liquid_total = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['year', 'month', 'category']
+        unique_together = [('year', 'month', 'category')]
+
+    def __str__(self):
+        return f"{self.month:02d}/{self.year} - {self.category} ({self.liquid_total})"
+
+
+class TaxPosition(models.Model):
+    """
+    Quantity and total acquisition cost (average cost = total_cost / quantity)
+    of a ticker at the end of each month in which it moved. Written by the tax
+    ledger (src/use_cases/tax_ledger.py); a recomputation resumes from the
+    positions of the month before the earliest affected one.
+    """
+    ticker = models.CharField(max_length=20)
+    month = models.DateField()  # First day of the month
+    quantity = models.IntegerField(default=0)
+    total_cost = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['ticker', 'month']
+        unique_together = [('ticker', 'month')]
+
+    def __str__(self):
+        return f"{self.ticker} {self.month:%m/%Y}: {self.quantity} ({self.total_cost})"
+
+
+class TaxMonthlyResult(models.Model):
+    """
+    Monthly income-tax (IR) computation of one pool of operations: realized
+    result, exemption, loss carryforward and tax due. Written by the tax ledger.
+    """
+    POOL_SWING = 'swing'
+    POOL_DAY_TRADE = 'day_trade'
+    POOL_FII = 'fii'
+    POOL_CHOICES = [
+        (POOL_SWING, 'Operações comuns'),
+        (POOL_DAY_TRADE, 'Day trade'),
+        (POOL_FII, 'FIIs'),
+    ]
+
+    month = models.DateField()  # First day of the month
+    pool = models.CharField(max_length=20, choices=POOL_CHOICES)
+
+    sales_total = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    stock_sales_total = models.DecimalField(max_digits=18, decimal_places=2, default=0)  # For the R$ 20k exemption
+    result = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    exempt_result = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    loss_offset = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    taxable_result = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    loss_balance = models.DecimalField(max_digits=18, decimal_places=2, default=0)  # Carried to the next months
+    tax_due = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    # Sales (or buys) without quantities, whose result could not be computed
+    unquantified_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['month', 'pool']
+        unique_together = [('month', 'pool')]
+
+    def __str__(self):
+        return f"{self.month:%m/%Y} - {self.get_pool_display()} (IR {self.tax_due})"
+
+
+class TaxLedgerState(models.Model):
+    """Single row: earliest month whose tax computation is out of date (None when current)."""
+    dirty_from = models.DateField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Tax ledger dirty from {self.dirty_from}" if self.dirty_from else "Tax ledger up to date"
+
+
+class DataVersion(models.Model):
+    """
+    Single row: change counter of the brokerage data, bumped by every import
+    and Transaction change. Cached reports are keyed by it.
+    """
+    version = models.PositiveIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    @property
+    def key(self) -> str:
+        """Version plus change time, so a recreated database never matches reports cached for an old one."""
+        return f"{self.version}-{self.changed_at:%Y%m%d%H%M%S%f}"
+
+    def __str__(self):
+        return f"Data version {self.version} ({self.changed_at})"
+
+
+class ParsedNoteCache(models.Model):
+    """
+    Parsed notes of a PDF, keyed by the SHA-256 of its bytes.
+    Lets repeated uploads of the same file skip CorrePy/pdfminer entirely.
+    """
+    content_hash = models.CharField(max_length=64, unique=True)
+    notes = models.JSONField(default=list)  # Output of pdf_parser.serialize_notes
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.content_hash[:12]} ({len(self.notes)} notes)"
+
+
+class NoteText(models.Model):
+    """
+    Text the fallback heuristics read from a brokerage note PDF, keyed by the
+    SHA-256 of its bytes and stored zlib-compressed (see
+    src/infrastructure/note_text_store.py). Lets improved heuristics be re-run
+    over past imports without the original files.
+    """
+    content_hash = models.CharField(max_length=64, primary_key=True)
+    filename = models.CharField(max_length=255)  # The date heuristic falls back to it
+    asset_type = models.CharField(max_length=50)  # As chosen on upload, needed to classify the notes again
+    # pdf_parser.STRATEGY_*: 'correpy' notes have no text, '' marks a file imported from the parse cache without one
+    strategy = models.CharField(max_length=20)
+    text = models.BinaryField(blank=True, default=b'')
+    text_length = models.PositiveIntegerField(default=0)  # Uncompressed, in characters
+    # False when incremental extraction stopped before the last page: the heuristics cannot be re-run on it
+    complete = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.strategy}, {self.content_hash[:12]})"
+
+
+class QuarantinedNote(models.Model):
+    """
+    A PDF whose parse failed, timed out or exceeded the memory limit of the
+    parse sandbox. Uploads of the same bytes are reported as failed without
+    being parsed again; deleting the row releases the file. Timeouts and
+    crashes expire (see src/infrastructure/quarantine.py).
+    """
+    REASON_CHOICES = [
+        ('timeout', 'Tempo esgotado'),
+        ('memory', 'Limite de memória'),
+        ('crash', 'Processo encerrado'),
+        ('error', 'Erro'),
+    ]
+
+    content_hash = models.CharField(max_length=64, unique=True)
+    filename = models.CharField(max_length=255)
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    error = models.TextField(blank=True, default='')
+    seconds = models.FloatField(null=True, blank=True)  # Time spent before the failure
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.filename} ({self.reason})"
+
+
+class IngestionJob(models.Model):
+    """
+    A batch of uploaded brokerage notes waiting to be (or being) imported by the
+    run_ingestion_worker management command.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pendente'),
+        (STATUS_RUNNING, 'Processando'),
+        (STATUS_DONE, 'Concluído'),
+        (STATUS_FAILED, 'Falhou'),
+    ]
+
+    asset_type = models.CharField(max_length=50)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+
+    # Progress
+    total_files = models.PositiveIntegerField(default=0)
+    processed_files = models.PositiveIntegerField(default=0)
+    imported_count = models.PositiveIntegerField(default=0)
+    # Rows rebuilt in place of stored ones (files already imported), reported as 'updated'
+    skipped_count = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # Bumped by the worker running the job after each file
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Job {self.pk} ({self.status}, {self.processed_files}/{self.total_files})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+
+class IngestionFile(models.Model):
+    """One uploaded PDF of an IngestionJob. The bytes are cleared once the job is done or failed."""
+    STATUS_CHOICES = [
+        ('pending', 'Pendente'),
+        ('done', 'Processado'),
+        ('failed', 'Falhou'),
+    ]
+
+    job = models.ForeignKey(IngestionJob, on_delete=models.CASCADE, related_name='files')
+    name = models.CharField(max_length=255)
+    content = models.BinaryField(blank=True, default=b'')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    error = models.TextField(blank=True, default='')
+
+    class Meta:
+        ordering = ['pk']
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
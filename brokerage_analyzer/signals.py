@@ -0,0 +1,47 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .models import Transaction
+from .src.infrastructure import export_cache, rollup
+from .src.use_cases import tax_ledger
+
+
+@receiver(pre_save, sender=Transaction)
+def remember_rollup_values(sender, instance, **kwargs):
+    """
+    Keeps the stored version of an edited Transaction, so post_save can move its
+    amounts out of the old (year, month, category) rollup row.
+    """
+    instance._rollup_previous = None
+    if instance.pk:
+        instance._rollup_previous = Transaction.objects.filter(pk=instance.pk).first()
+
+
+@receiver(post_save, sender=Transaction)
+def update_rollup_on_save(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous is not None:
+        rollup.apply([previous], sign=-1)
+    rollup.apply([instance])
+
+
+@receiver(post_delete, sender=Transaction)
+def update_rollup_on_delete(sender, instance, **kwargs):
+    rollup.apply([instance], sign=-1)
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+def mark_tax_ledger_dirty(sender, instance, **kwargs):
+    """The tax ledger is recomputed from the earliest month the change touched (old or new date)."""
+    dates = [Transaction._meta.get_field('date').to_python(instance.date)]
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous is not None:
+        dates.append(previous.date)
+    tax_ledger.mark_dirty(min(dates))
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+def bump_data_version(sender, instance, **kwargs):
+    """Reports cached for the previous data version are no longer served."""
+    export_cache.bump_version()
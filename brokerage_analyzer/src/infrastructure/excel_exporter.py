@@ -1,142 +1,166 @@
 
-import pandas as pd
-from typing import List, Dict
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict, Iterable
 
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, Side
 
-class ExcelExporter:
-    def __init__(self, records: List[Dict]):
-        self.records = records
+CURRENCY_FORMAT = 'R$ #,##0.00'
 
-    def to_excel(self, file_path: str):
-        if not self.records:
-            print("No data to export.")
-            return
+# Sheet layouts: (header, width, currency?) per column
+STOCK_COLUMNS = [('Date', 15, False), ('AssetClass', 25, False), ('BuyValue', 15, True),
+                 ('SellValue', 15, True), ('LiquidValue', 15, True), ('Filename', 30, False)]
+FUTURES_COLUMNS = [('Date', 15, False), ('AssetClass', 25, False), ('LiquidValue', 18, True), ('Filename', 30, False)]
+TAX_COLUMNS = [('Year', None, False), ('Month', None, False), ('Category', 20, False), ('Total Compras', 18, True),
+               ('Total Vendas', 18, True), ('Resultado Líquido', 18, True)]
+TAX_LEDGER_COLUMNS = [('Year', None, False), ('Month', None, False), ('Apuração', 18, False), ('Vendas', 18, True),
+                      ('Vendas de Ações', 18, True), ('Resultado', 18, True), ('Isento', 18, True),
+                      ('Prejuízo Compensado', 20, True), ('Base de Cálculo', 18, True), ('Prejuízo a Compensar', 20, True),
+                      ('IR Devido', 15, True), ('Sem Quantidade', 15, False)]
+FUTURES_SUMMARY_COLUMNS = [('Category', 25, False), ('Year', None, False), ('Month', None, False),
+                           ('LiquidValue', 18, True)]
 
-        df = pd.DataFrame(self.records)
-        df['Date'] = pd.to_datetime(df['Date'])
 
-        # 1. Detailed Report
-        # Ensure we have all columns
-        cols = ['Date', 'Category', 'AssetClass', 'LiquidValue', 'BuyValue', 'SellValue', 'Filename']
-        for c in cols:
-            if c not in df.columns:
-                df[c] = None
+def is_futures(category) -> bool:
+    return str(category).startswith('Futuros') or str(category).startswith('Futures')
 
-        # 2. Monthly Summary Preparation
-        df['Year'] = df['Date'].dt.year
-        df['Month'] = df['Date'].dt.month
 
-        # Formatting Helpers
-        currency_format = 'R$ #,##0.00'
+class ExcelExporter:
+    """
+    Streams brokerage records into an .xlsx using openpyxl's write-only mode.
+
+    Records are consumed once (any iterable of dicts, e.g. a generator over DB
+    chunks): each row goes straight to its category sheet and is folded into
+    the "Resumo IR" / "Resumo Futuros" totals, so memory stays bounded by the
+    number of (year, month, category) groups rather than by the row count.
+    Number formats come from a shared named style instead of a second pass
+    over every cell.
+
+    monthly_totals: optional precomputed (year, month, category, buy, sell,
+    liquid) rows, e.g. from the MonthlyRollup table; when given, the summary
+    sheets are written from them instead of from the records.
+
+    tax_results: optional (year, month, pool, sales, stock sales, result,
+    exempt, loss offset, taxable, loss balance, tax due, unquantified) rows
+    from the tax ledger, written to an "Apuração IR" sheet.
+    """
+
+    def __init__(self, records: Iterable[Dict], monthly_totals: Iterable[tuple] = None,
+                 tax_results: Iterable[tuple] = None):
+        self.records = records
+        self.monthly_totals = monthly_totals
+        self.tax_results = tax_results
+        self._currency_cells = {}
 
-        def apply_format(worksheet, col_idx, format_str):
-            for row in worksheet.iter_rows(min_row=2, max_col=col_idx, min_col=col_idx):
-                for cell in row:
-                    cell.number_format = format_str
+    def to_excel(self, file_path):
+        wb = Workbook(write_only=True)
 
-        # Write to Excel
-        with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
+        currency = NamedStyle(name='currency', number_format=CURRENCY_FORMAT)
+        header = NamedStyle(name='header', font=Font(bold=True), alignment=Alignment(horizontal='center'),
+                            border=Border(*[Side(style='thin')] * 4))
+        wb.add_named_style(currency)
+        wb.add_named_style(header)
 
-            # --- SEPARATE SHEETS PER CATEGORY ---
-            categories = sorted(df['Category'].unique())
+        sheets = {}
+        tax_summary = defaultdict(lambda: [0.0, 0.0, 0.0])  # (Year, Month, Category) -> Compras, Vendas, Líquido
+        futures_summary = defaultdict(float)  # (Category, Year, Month) -> LiquidValue
 
-            # Helper to apply currency format
-            # Order: Stocks, FIIs, ETFs, Futures, Others
+        for record in self.records:
+            category = record.get('Category')
+            ref_date = record.get('Date')
 
-            for cat in categories:
+            if category not in sheets:
                 # Sanitize sheet name
-                sheet_name = str(cat).replace('/', '-').replace('\\', '-')[:30]
-
-                # Filter for this category
-                cat_df = df[df['Category'] == cat].copy()
-
-                if str(cat).startswith('Futuros') or str(cat).startswith('Futures'):
-                    # Futures logic: Display simpler columns
-                    display_cols = ['Date', 'AssetClass', 'LiquidValue', 'Filename']
-                    cat_df = cat_df[display_cols]
-                    cat_df.to_excel(writer, index=False, sheet_name=sheet_name)
-
-                    ws = writer.sheets[sheet_name]
-                    apply_format(ws, 3, currency_format)  # Column 3 = LiquidValue
-
-                    ws.column_dimensions['A'].width = 15
-                    ws.column_dimensions['B'].width = 25
-                    ws.column_dimensions['C'].width = 18
-                    ws.column_dimensions['D'].width = 30
+                sheet_name = str(category).replace('/', '-').replace('\\', '-')[:30]
+                columns = FUTURES_COLUMNS if is_futures(category) else STOCK_COLUMNS
+                sheets[category] = (self._create_sheet(wb, sheet_name, columns), columns)
+
+            ws, columns = sheets[category]
+            ws.append(self._row(ws, [record.get(name) for name, _, _ in columns], columns))
+
+            # --- SUMMARIES, folded in the same pass ---
+            if self.monthly_totals is not None:
+                continue
+            if is_futures(category):
+                futures_summary[(category, ref_date.year, ref_date.month)] += record.get('LiquidValue') or 0
+            else:
+                totals = tax_summary[(ref_date.year, ref_date.month, category)]
+                totals[0] += record.get('BuyValue') or 0
+                totals[1] += record.get('SellValue') or 0
+                totals[2] += record.get('LiquidValue') or 0
+
+        if not sheets:
+            print("No data to export.")
+            return
 
+        if self.monthly_totals is not None:
+            for year, month, category, buy, sell, liquid in self.monthly_totals:
+                if is_futures(category):
+                    futures_summary[(category, year, month)] += float(liquid)
                 else:
-                    # Stocks/FIIs/ETFs
-                    display_cols = ['Date', 'AssetClass', 'BuyValue', 'SellValue', 'LiquidValue', 'Filename']
-                    cat_df = cat_df[display_cols]
-
-                    cat_df.to_excel(writer, index=False, sheet_name=sheet_name)
-
-                    # Format this sheet
-                    ws = writer.sheets[sheet_name]
-                    # Cols: A=Date, B=Asset, C=Buy, D=Sell, E=Liquid, F=File
-                    apply_format(ws, 3, currency_format)  # BuyValue  (C)
-                    apply_format(ws, 4, currency_format)  # SellValue (D)
-                    apply_format(ws, 5, currency_format)  # LiquidValue (E)
-
-                    # Resize
-                    ws.column_dimensions['A'].width = 15
-                    ws.column_dimensions['B'].width = 25
-                    ws.column_dimensions['C'].width = 15
-                    ws.column_dimensions['D'].width = 15
-                    ws.column_dimensions['E'].width = 15
-                    ws.column_dimensions['F'].width = 30
-
-            # --- SUMMARY SHEET (TAX) ---
-            # Exclude Futures for typical Taxable Assets summary
-
-            tax_df = df[~df['Category'].str.startswith('Futuros', na=False) &
-                        ~df['Category'].str.startswith('Futures', na=False)].copy()
-
-            if not tax_df.empty:
-                # Aggregate by Year, Month, Category
-                tax_summary = tax_df.groupby(['Year', 'Month', 'Category'])[
-                    ['BuyValue', 'SellValue', 'LiquidValue']].sum().reset_index()
-
-                # Add explicit columns for Tax Report context:
-                # 1. Total Sold (Sales)
-                # 2. Total Bought (Purchases)
-                # 3. Net Result (Cash Flow)
-
-                tax_summary.rename(
-                    columns={
-                        'SellValue': 'Total Vendas',
-                        'BuyValue': 'Total Compras',
-                        'LiquidValue': 'Resultado Líquido'},
-                    inplace=True)
-
-                sheet_name_tax = 'Resumo IR'
-                tax_summary.to_excel(writer, index=False, sheet_name=sheet_name_tax)
-
-                ws_tax = writer.sheets[sheet_name_tax]
-                # Columns: Year, Month, Category, Total Compras, Total Vendas, Resultado Líquido
-
-                apply_format(ws_tax, 4, currency_format)  # Compras
-                apply_format(ws_tax, 5, currency_format)  # Vendas
-                apply_format(ws_tax, 6, currency_format)  # Resultado
-
-                ws_tax.column_dimensions['C'].width = 20
-                ws_tax.column_dimensions['D'].width = 18
-                ws_tax.column_dimensions['E'].width = 18
-                ws_tax.column_dimensions['F'].width = 18
-
-            # --- SUMMARY SHEET (FUTURES) ---
-            fut_df = df[df['Category'].str.startswith('Futuros', na=False) |
-                        df['Category'].str.startswith('Futures', na=False)].copy()
-            if not fut_df.empty:
-                fut_summary = fut_df.groupby(['Category', 'Year', 'Month'])['LiquidValue'].sum().reset_index()
-                fut_summary.sort_values(by=['Category', 'Year', 'Month'], inplace=True)
-
-                sheet_name_fut = 'Resumo Futuros'
-                fut_summary.to_excel(writer, index=False, sheet_name=sheet_name_fut)
-
-                ws_fut = writer.sheets[sheet_name_fut]
-                apply_format(ws_fut, 4, currency_format)  # LiquidValue (D)
-                ws_fut.column_dimensions['A'].width = 25
-                ws_fut.column_dimensions['D'].width = 18
-
+                    tax_summary[(year, month, category)] = [float(buy), float(sell), float(liquid)]
+
+        # Category sheets in alphabetical order, as before
+        for index, category in enumerate(sorted(sheets, key=str)):
+            ws = sheets[category][0]
+            wb.move_sheet(ws.title, offset=index - wb.index(ws))
+
+        # --- SUMMARY SHEET (TAX) ---
+        # Exclude Futures for typical Taxable Assets summary
+        if tax_summary:
+            ws_tax = self._create_sheet(wb, 'Resumo IR', TAX_COLUMNS)
+            for key in sorted(tax_summary):
+                ws_tax.append(self._row(ws_tax, list(key) + tax_summary[key], TAX_COLUMNS))
+
+        # --- SUMMARY SHEET (FUTURES) ---
+        if futures_summary:
+            ws_fut = self._create_sheet(wb, 'Resumo Futuros', FUTURES_SUMMARY_COLUMNS)
+            for key in sorted(futures_summary):
+                ws_fut.append(self._row(ws_fut, list(key) + [futures_summary[key]], FUTURES_SUMMARY_COLUMNS))
+
+        # --- TAX LEDGER SHEET ---
+        if self.tax_results is not None:
+            ws_ledger = self._create_sheet(wb, 'Apuração IR', TAX_LEDGER_COLUMNS)
+            for row in self.tax_results:
+                ws_ledger.append(self._row(ws_ledger, [float(v) if isinstance(v, Decimal) else v for v in row],
+                                           TAX_LEDGER_COLUMNS))
+
+        wb.save(file_path)
         print(f"Data exported to {file_path}")
+
+    def _create_sheet(self, wb, title: str, columns):
+        """Creates a write-only sheet; widths must be set before the first row is appended."""
+        ws = wb.create_sheet(title=title)
+        for index, (name, width, _) in enumerate(columns):
+            letter = chr(ord('A') + index)
+            if width:
+                ws.column_dimensions[letter].width = width
+
+        cells = []
+        for name, _, _ in columns:
+            cell = WriteOnlyCell(ws, value=name)
+            cell.style = 'header'
+            cells.append(cell)
+        ws.append(cells)
+
+        # One styled cell per currency column, reused for every row: append() serializes
+        # the row immediately, so the cell can be refilled for the next one.
+        self._currency_cells[ws] = {}
+        for index, (_, _, is_currency) in enumerate(columns):
+            if is_currency:
+                cell = WriteOnlyCell(ws)
+                cell.style = 'currency'
+                self._currency_cells[ws][index] = cell
+        return ws
+
+    def _row(self, ws, values, columns):
+        """Puts currency values in the sheet's styled cells; other values are written as-is."""
+        currency_cells = self._currency_cells[ws]
+        row = list(values)
+        for index, cell in currency_cells.items():
+            if row[index] is not None:
+                cell.value = row[index]
+                row[index] = cell
+        return row
@@ -0,0 +1,76 @@
+import glob
+import os
+import tempfile
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from brokerage_analyzer.models import DataVersion
+
+PREFIX = 'report-'
+
+
+def bump_version():
+    """Marks the brokerage data as changed: reports cached for earlier versions are no longer served."""
+    DataVersion.objects.get_or_create(pk=1)
+    DataVersion.objects.filter(pk=1).update(version=F('version') + 1, changed_at=timezone.now())
+
+
+def current_version() -> DataVersion:
+    return DataVersion.objects.get_or_create(pk=1)[0]
+
+
+class ExportCache:
+    """
+    Generated report files on disk, one per (data version key, format).
+
+    A report is written to a temporary file in the cache directory and
+    atomically renamed into place, so concurrent requests never see a partial
+    file; storing a report removes the ones cached for older versions. A slow
+    request that finishes after the data changed again never deletes the
+    reports of the newer version.
+    """
+
+    def __init__(self, directory: str = None):
+        self.directory = directory or settings.BROKERAGE_EXPORT_CACHE_DIR
+
+    def path(self, key: str, report_format: str) -> str:
+        return os.path.join(self.directory, f"{PREFIX}{key}.{report_format}")
+
+    def get(self, key: str, report_format: str):
+        """Path of the cached report, or None when it has not been generated yet."""
+        path = self.path(key, report_format)
+        return path if os.path.isfile(path) else None
+
+    def store(self, key: str, report_format: str, write) -> str:
+        """Calls write(file_object) to generate the report and caches it; returns its path."""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            path = self.path(key, report_format)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        self.prune(key)
+        return path
+
+    def prune(self, key: str):
+        """Deletes the reports of versions older than key (by change time, so it also holds across a recreated database)."""
+        changed_at = _changed_at(key)
+        for path in glob.glob(os.path.join(self.directory, f"{PREFIX}*")):
+            cached_key = os.path.basename(path)[len(PREFIX):].rpartition('.')[0]
+            if _changed_at(cached_key) < changed_at:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+
+def _changed_at(key: str) -> str:
+    """Fixed-width change time part of a DataVersion.key, comparable as text."""
+    return key.rpartition('-')[2]
@@ -0,0 +1,58 @@
+import json
+import os
+
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+class ImportCheckpoint:
+    """
+    Append-only record (JSON lines) of the files a directory import has
+    finished: relative path, size, mtime, SHA-256 and status.
+
+    Entries are appended and fsynced only after their batch is committed, so
+    after a crash at most one batch is imported again (save_batch replaces the
+    rows built from its files, so that is harmless). A file whose path, size
+    and mtime match an entry is skipped without being read; renamed or copied
+    files are skipped by hash, within a batch as well as across batches.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.by_path = {}
+        self.hashes = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Partial last line of an interrupted write
+                    self.by_path[entry['path']] = entry
+                    self.hashes[entry['hash']] = entry['status']
+
+    def __len__(self):
+        return len(self.by_path)
+
+    def unchanged(self, path: str, size: int, mtime_ns: int, retry_failed: bool = False) -> bool:
+        """True when path was already processed and has not been modified since."""
+        entry = self.by_path.get(path)
+        return (entry is not None and entry['size'] == size and entry['mtime_ns'] == mtime_ns
+                and not (retry_failed and entry['status'] == STATUS_FAILED))
+
+    def seen(self, content_hash: str, retry_failed: bool = False) -> bool:
+        status = self.hashes.get(content_hash)
+        return status is not None and not (retry_failed and status == STATUS_FAILED)
+
+    def record(self, entries):
+        """entries: dicts with path, size, mtime_ns, hash and status."""
+        entries = list(entries)
+        if not entries:
+            return
+        with open(self.path, 'a') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + '\n')
+                self.by_path[entry['path']] = entry
+                self.hashes[entry['hash']] = entry['status']
+            f.flush()
+            os.fsync(f.fileno())
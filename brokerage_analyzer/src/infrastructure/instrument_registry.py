@@ -0,0 +1,68 @@
+import json
+import os
+import re
+from functools import lru_cache
+
+REGISTRY_FILE = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, 'data', 'instruments.json')
+
+FUTURES_PREFIX = 'Futures - '
+
+# B3 ticker shapes used for instruments missing from the data file
+OPTION_RE = re.compile(r'[A-Z]{4}[A-X]\d{2,3}E?(?:W\d)?')  # PETRD350, VALEP62E, BOVAA120W2
+BDR_RE = re.compile(r'[A-Z0-9]{4}3[2-59]')  # AAPL34, MELI34, ROXO34
+FUTURE_RE = re.compile(r'(?P<root>[A-Z]{3})(?:[FGHJKMNQUVXZ]\d{2})?')  # WIN, WINJ24, WDOF25
+
+
+class InstrumentRegistry:
+    """
+    Ticker -> category reference data (ETFs, FIIs, Stocks, BDRs, Options,
+    Futures - <root>, Others).
+
+    Explicit entries come from a versioned data file; tickers missing from it
+    are classified by their B3 shape (options series, BDR suffixes 32-35/39,
+    units and funds ending in 11, shares ending in 3-6). Results are memoized,
+    so each distinct ticker is classified once per process.
+    """
+
+    def __init__(self, version, instruments: dict, futures=()):
+        self.version = version
+        self.futures = frozenset(futures)
+        self._categories = dict(instruments)
+
+    @classmethod
+    def from_file(cls, path: str = REGISTRY_FILE) -> 'InstrumentRegistry':
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        instruments = {ticker: category for category, tickers in data['categories'].items() for ticker in tickers}
+        return cls(data['version'], instruments, data.get('futures', ()))
+
+    def classify(self, ticker: str) -> str:
+        ticker = ticker.strip().upper()
+        category = self._categories.get(ticker)
+        if category is None:
+            category = self._categories[ticker] = self._classify_by_shape(ticker)
+        return category
+
+    def _classify_by_shape(self, ticker: str) -> str:
+        # Fractional market lots (PETR4F) are the same instrument
+        if ticker.endswith('F') and ticker[-2:-1].isdigit():
+            return self.classify(ticker[:-1])
+
+        future = FUTURE_RE.fullmatch(ticker)
+        if future and future.group('root') in self.futures:
+            return f"{FUTURES_PREFIX}{future.group('root')}"
+        if OPTION_RE.fullmatch(ticker):
+            return 'Options'
+        if BDR_RE.fullmatch(ticker):
+            return 'BDRs'
+        if ticker.endswith('11'):
+            return 'FIIs'  # FIIs typically end in 11
+        if ticker[-1:] in ('3', '4', '5', '6'):
+            return 'Stocks'
+        return 'Others'
+
+
+@lru_cache(maxsize=None)
+def get_registry(path: str = REGISTRY_FILE) -> InstrumentRegistry:
+    """The registry loaded from path, read once per process."""
+    return InstrumentRegistry.from_file(path)
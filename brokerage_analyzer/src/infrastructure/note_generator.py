@@ -0,0 +1,237 @@
+import json
+import os
+import random
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+GROUND_TRUTH_FILE = 'ground_truth.json'
+
+CENT = Decimal('0.01')
+STOCK_TICKERS = {
+    'PETR4': ('PETROBRAS', 'PN', 38), 'VALE3': ('VALE', 'ON', 65), 'ITSA4': ('ITAUSA', 'PN', 10),
+    'BBAS3': ('BRASIL', 'ON', 27), 'WEGE3': ('WEG', 'ON', 40), 'HGLG11': ('CSHG LOG', 'CI', 160),
+    'KNRI11': ('KINEA RENDA', 'CI', 150), 'MXRF11': ('MAXI RENDA', 'CI', 10), 'BOVA11': ('ISHARES BOVA', 'CI', 125),
+    'IVVB11': ('ISHARES SP500', 'CI', 300),
+}
+# Points -> R$ per contract, and a typical quote
+FUTURES = {'WIN': (Decimal('0.20'), 128000), 'WDO': (Decimal('10.00'), 5000)}
+MONTH_CODES = 'FGHJKMNQUVXZ'
+
+LINE_HEIGHT = 11
+TOP, BOTTOM = 800, 50
+
+
+def _brl(value: Decimal) -> str:
+    """1234.5 -> '1.234,50' (absolute value, as printed on the notes)."""
+    text = f"{abs(value):,.2f}"
+    return text.replace(',', '_').replace('.', ',').replace('_', '.')
+
+
+def _dc(value: Decimal) -> str:
+    return 'D' if value < 0 else 'C'
+
+
+def _business_day(rnd, start: date, days: int) -> date:
+    day = start + timedelta(days=rnd.randint(0, days))
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return day
+
+
+def _settlement(day: date, offset: int) -> date:
+    while offset:
+        day += timedelta(days=1)
+        if day.weekday() < 5:
+            offset -= 1
+    return day
+
+
+class NoteGenerator:
+    """
+    Writes synthetic SINACOR-style brokerage notes with reportlab and keeps the
+    values every note should parse to (ground truth, in the fields compared by
+    strategy_comparison: date, value, sign and ticker).
+
+    Stock notes ("1-BOVESPA" trades of one ticker) and WIN/WDO day-trade
+    futures notes are generated; long notes spill their trades over several
+    pages and print the "Resumo Financeiro" / "Líquido para" summary on the
+    last one, as the real notes do. The same seed always yields the same corpus.
+    """
+
+    def __init__(self, seed: int = 0, futures_ratio: float = 0.3, max_pages: int = 3):
+        self.rnd = random.Random(seed)
+        self.futures_ratio = futures_ratio
+        self.max_pages = max_pages
+
+    def generate(self, directory: str, count: int) -> list:
+        """Writes count notes plus ground_truth.json into directory; returns the ground truth entries."""
+        os.makedirs(directory, exist_ok=True)
+        truth = []
+        for number in range(1, count + 1):
+            if self.rnd.random() < self.futures_ratio:
+                entry = self.futures_note(directory, number)
+            else:
+                entry = self.stock_note(directory, number)
+            truth.append(entry)
+
+        with open(os.path.join(directory, GROUND_TRUTH_FILE), 'w') as f:
+            json.dump(truth, f, indent=1)
+        return truth
+
+    def stock_note(self, directory: str, number: int) -> dict:
+        rnd = self.rnd
+        trade_date = _business_day(rnd, date(2020, 1, 2), 5 * 365)
+        ticker = rnd.choice(sorted(STOCK_TICKERS))
+        name, kind, price = STOCK_TICKERS[ticker]
+        op = rnd.choice('CV')
+        pages = rnd.randint(1, self.max_pages)
+
+        trades = []
+        gross = Decimal(0)
+        quantities = 0
+        for _ in range(rnd.randint(1, 4) if pages == 1 else 60 * (pages - 1) + rnd.randint(1, 10)):
+            quantity = rnd.randint(1, 20) * (1 if price > 50 else 10)
+            unit = (Decimal(price) * Decimal(rnd.uniform(0.9, 1.1))).quantize(CENT)
+            gross += unit * quantity
+            quantities += quantity
+            trades.append(f"1-BOVESPA {op} VISTA {name} {ticker} {kind} {quantity} {_brl(unit)} "
+                          f"{_brl(unit * quantity)} {'D' if op == 'C' else 'C'}")
+
+        settlement_fee = (gross * Decimal('0.00025')).quantize(CENT, ROUND_HALF_UP)
+        emoluments = (gross * Decimal('0.00005')).quantize(CENT, ROUND_HALF_UP)
+        operations = -gross if op == 'C' else gross
+        net = operations - settlement_fee - emoluments
+
+        summary = [
+            "Resumo dos Negócios",
+            "Debêntures 0,00",
+            f"Vendas à vista {_brl(gross if op == 'V' else Decimal(0))}",
+            f"Compras à vista {_brl(gross if op == 'C' else Decimal(0))}",
+            f"Valor das operações {_brl(gross)}",
+            "Resumo Financeiro",
+            "Clearing",
+            f"Valor líquido das operações {_brl(operations)} {_dc(operations)}",
+            f"Taxa de liquidação {_brl(settlement_fee)} D",
+            "Taxa de Registro 0,00 D",
+            f"Total CBLC {_brl(operations - settlement_fee)} {_dc(operations - settlement_fee)}",
+            "Bolsa",
+            f"Emolumentos {_brl(emoluments)} D",
+            f"Total Bovespa / Soma {_brl(emoluments)} D",
+            "Custos Operacionais",
+            "Corretagem 0,00 D",
+            "ISS (SÃO PAULO) 0,00 D",
+            "I.R.R.F. s/ operações, base R$0,00 0,00",
+            "Total Custos / Despesas 0,00 D",
+            f"Líquido para {_settlement(trade_date, 2):%d/%m/%Y} {_brl(net)} {_dc(net)}",
+        ]
+        header = ["Negócios realizados",
+                  "Q Negociação C/V Tipo mercado Prazo Especificação do título Obs. (*) Quantidade Preço / Ajuste "
+                  "Valor Operação / Ajuste D/C"]
+        entry = self._write(directory, number, trade_date, header, trades, summary, net, ticker, 'stock')
+        entry['bought' if op == 'C' else 'sold'] = quantities
+        return entry
+
+    def futures_note(self, directory: str, number: int) -> dict:
+        rnd = self.rnd
+        trade_date = _business_day(rnd, date(2020, 1, 2), 5 * 365)
+        contract = rnd.choice(sorted(FUTURES))
+        multiplier, quote = FUTURES[contract]
+        step = 5 if contract == 'WIN' else Decimal('0.5')
+        expiry = _settlement(trade_date, 20)
+        code = f"{contract}{MONTH_CODES[expiry.month - 1]}{expiry:%y}"
+
+        trades = []
+        adjustment = Decimal(0)
+        for _ in range(rnd.randint(1, 5)):
+            quantity = rnd.randint(1, 10)
+            buy = Decimal(quote) + step * rnd.randint(-200, 200)
+            sell = buy + step * rnd.randint(-60, 60)
+            result = (sell - buy) * multiplier * quantity
+            adjustment += result
+            trades.append(f"C {code} {expiry:%d/%m/%Y} {quantity} {_brl(buy)} DAY TRADE {_brl(Decimal(0))} D 0,00")
+            trades.append(f"V {code} {expiry:%d/%m/%Y} {quantity} {_brl(sell)} DAY TRADE {_brl(result)} "
+                          f"{_dc(result)} 0,00")
+        if adjustment == 0:
+            adjustment = multiplier * step
+            trades.append(f"V {code} {expiry:%d/%m/%Y} 1 {_brl(Decimal(quote))} DAY TRADE {_brl(adjustment)} C 0,00")
+
+        fees = (Decimal('0.25') * len(trades)).quantize(CENT)
+        irrf = max(adjustment * Decimal('0.01'), Decimal(0)).quantize(CENT, ROUND_HALF_UP)
+        net = adjustment - fees - irrf
+
+        summary = [
+            "Venda disponível 0,00 Compra disponível 0,00 Venda Opções 0,00 Compra Opções 0,00",
+            "Valor dos negócios 0,00",
+            f"IRRF 0,00 IRRF Day Trade (proj.) {_brl(irrf)} Taxa operacional 0,00",
+            f"Taxa registro BM&F 0,00 Taxas BM&F (emol+f.gar) {_brl(fees)}",
+            "Outros Custos 0,00 ISS 0,00 Ajuste de posição 0,00",
+            f"Ajuste day trade {_brl(adjustment)} {_dc(adjustment)}",
+            f"Total das despesas {_brl(fees + irrf)} D",
+            f"Total Conta Normal {_brl(net)} {_dc(net)}",
+            f"Líquido para {_settlement(trade_date, 1):%d/%m/%Y} {_brl(net)} {_dc(net)}",
+        ]
+        header = ["C/V Mercadoria Vencimento Quantidade Preço/Ajuste Tipo Negócio Vlr de Operação/Ajuste D/C "
+                  "Taxa Operacional"]
+        return self._write(directory, number, trade_date, header, trades, summary, net, contract, 'futures')
+
+    def _write(self, directory, number, trade_date, header, trades, summary, net, ticker, kind) -> dict:
+        filename = f"nota_{number:06d}_{trade_date:%d-%m-%Y}.pdf"
+        c = canvas.Canvas(os.path.join(directory, filename), pagesize=A4)
+        c.setTitle(f"Nota de corretagem {number}")
+
+        page = 1
+        lines = list(trades)
+        while True:
+            y = self._page_header(c, number, page, trade_date) - LINE_HEIGHT
+            for line in header:
+                c.drawString(40, y, line)
+                y -= LINE_HEIGHT
+            while lines and y > BOTTOM:
+                c.drawString(40, y, lines.pop(0))
+                y -= LINE_HEIGHT
+            if not lines and y - LINE_HEIGHT * len(summary) > BOTTOM:
+                break
+            c.showPage()
+            page += 1
+            if not lines:
+                # The summary did not fit: it gets a page of its own
+                y = self._page_header(c, number, page, trade_date)
+                break
+
+        for line in summary:
+            y -= LINE_HEIGHT
+            c.drawString(40, y, line)
+        c.showPage()
+        c.save()
+
+        net = net.quantize(CENT)
+        return {
+            'filename': filename,
+            'kind': kind,
+            'pages': page,
+            'date': trade_date.isoformat(),
+            'value': float(abs(net)),
+            'sign': _dc(net),
+            'ticker': ticker,
+            'bought': 0,
+            'sold': 0,
+        }
+
+    def _page_header(self, c, number: int, page: int, trade_date: date) -> float:
+        """Draws the SINACOR page header and returns the y of its last line."""
+        c.setFont('Helvetica', 8)
+        lines = [
+            "NOTA DE CORRETAGEM",
+            f"Nr. nota {number}  Folha {page}  Data pregão {trade_date:%d/%m/%Y}",
+            "CORRETORA DE TITULOS E VALORES MOBILIARIOS S.A.",
+            "Av. Brigadeiro Faria Lima, 3600 - São Paulo - SP  Tel. (11) 3000-0000",
+            "Cliente 123456 INVESTIDOR SINTETICO  C.P.F./C.N.P.J/C.V.M./C.O.B. 000.000.000-00",
+        ]
+        y = TOP
+        for line in lines:
+            c.drawString(40, y, line)
+            y -= LINE_HEIGHT
+        return y + LINE_HEIGHT
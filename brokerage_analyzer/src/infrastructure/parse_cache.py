@@ -0,0 +1,26 @@
+from brokerage_analyzer.models import ParsedNoteCache
+
+
+class DatabaseParseCache:
+    """
+    Persistent parse cache backed by the ParsedNoteCache table.
+    Maps the SHA-256 of a PDF to its serialized notes (see pdf_parser.serialize_notes).
+    """
+
+    def get_many(self, hashes) -> dict:
+        return dict(
+            ParsedNoteCache.objects.filter(content_hash__in=list(hashes)).values_list('content_hash', 'notes')
+        )
+
+    def set_many(self, mapping: dict):
+        ParsedNoteCache.objects.bulk_create(
+            [ParsedNoteCache(content_hash=h, notes=notes) for h, notes in mapping.items()],
+            ignore_conflicts=True
+        )
+
+    def update_many(self, mapping: dict):
+        """Like set_many, replacing the notes already stored (after a re-parse)."""
+        ParsedNoteCache.objects.bulk_create(
+            [ParsedNoteCache(content_hash=h, notes=notes) for h, notes in mapping.items()],
+            update_conflicts=True, unique_fields=['content_hash'], update_fields=['notes']
+        )
@@ -0,0 +1,112 @@
+import time
+from functools import lru_cache
+from multiprocessing import get_all_start_methods, get_context
+
+try:
+    import resource
+except ImportError:  # Windows: no address-space limit
+    resource = None
+
+from brokerage_analyzer.src.infrastructure.pdf_parser import PdfParser, serialize_notes
+
+REASON_TIMEOUT = 'timeout'
+REASON_MEMORY = 'memory'
+REASON_CRASH = 'crash'
+REASON_ERROR = 'error'
+# A timeout or a killed process (e.g. by the host's OOM killer) may not happen again on a less loaded machine;
+# the address-space limit and parser exceptions repeat for the same bytes
+TRANSIENT_REASONS = (REASON_TIMEOUT, REASON_CRASH)
+
+
+class ParseFailure(Exception):
+    """A sandboxed parse that did not complete. reason: one of the REASON_* values."""
+
+    def __init__(self, reason: str, message: str, seconds: float = None):
+        super().__init__(message)
+        self.reason = reason
+        self.seconds = seconds
+
+
+@lru_cache(maxsize=None)
+def _context():
+    """
+    Children are forked from a forkserver that has already imported the parser
+    (CorrePy, pdfminer), so starting one costs a fork, not an import, and never
+    forks a threaded web or pool process. Elsewhere they are spawned.
+    """
+    if 'forkserver' in get_all_start_methods():
+        context = get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+        return context
+    return get_context('spawn')
+
+
+def _parse_in_child(conn, data: bytes, filename: str, memory_bytes: int):
+    """Child entry point: parses one PDF under the address-space limit and sends back the outcome."""
+    if memory_bytes and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    try:
+        notes, strategy, text, complete = PdfParser().parse_with_text(data, filename)
+        conn.send(('ok', (serialize_notes(notes), strategy, text, complete)))
+    except MemoryError:
+        conn.send((REASON_MEMORY, f"address space limit of {memory_bytes // (1024 * 1024)} MB reached"))
+    except Exception as e:
+        conn.send((REASON_ERROR, f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+class ParseSandbox:
+    """
+    Parses each PDF in its own child process, so a note that hangs CorrePy or
+    pdfminer, exhausts memory or crashes the interpreter only costs that file.
+
+    timeout: wall-clock seconds before the child is killed (0 = no limit).
+    memory_mb: RLIMIT_AS of the child, in MB (0 = no limit).
+    retries: further attempts after a transient failure (timeout or crash).
+    """
+
+    def __init__(self, timeout: float = 120, memory_mb: int = 2048, retries: int = 1):
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.retries = retries
+
+    def parse(self, data: bytes, filename: str) -> tuple:
+        """
+        Same result as PdfParser.parse_with_text, with the notes serialized:
+        (notes, strategy, text, complete). Raises ParseFailure when the child times out,
+        runs out of memory, raises or dies, after retrying transient failures.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                return self._parse_once(data, filename)
+            except ParseFailure as e:
+                if e.reason not in TRANSIENT_REASONS or attempt == self.retries:
+                    raise
+
+    def _parse_once(self, data: bytes, filename: str) -> tuple:
+        context = _context()
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=_parse_in_child, daemon=True,
+                                  args=(sender, data, filename, self.memory_mb * 1024 * 1024))
+        start = time.perf_counter()
+        process.start()
+        sender.close()
+        try:
+            if not receiver.poll(self.timeout or None):
+                raise ParseFailure(REASON_TIMEOUT, f"parse timed out after {self.timeout}s", time.perf_counter() - start)
+            try:
+                status, payload = receiver.recv()
+            except EOFError:
+                process.join()
+                raise ParseFailure(REASON_CRASH, f"parser process died (exit code {process.exitcode})",
+                                   time.perf_counter() - start)
+        finally:
+            if process.is_alive():
+                process.kill()
+            process.join()
+            receiver.close()
+
+        if status != 'ok':
+            raise ParseFailure(status, payload, time.perf_counter() - start)
+        return payload
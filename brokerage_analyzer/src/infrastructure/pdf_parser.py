@@ -1,10 +1,13 @@
 
+import hashlib
 import io
 import logging
 import re
 import os
 from datetime import datetime, date
 from decimal import Decimal
+from functools import lru_cache
+from typing import NamedTuple
 
 # Try to import correpy but be robust
 try:
@@ -19,9 +22,13 @@ except ImportError:
 # Try to import pdfminer
 try:
     from pdfminer.high_level import extract_text
-    from pdfminer.layout import LAParams
+    from pdfminer.layout import LAParams, LTChar, LTContainer
+    from pdfminer.converter import TextConverter
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
 except ImportError:
     extract_text = None
+    TextConverter = object
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -33,208 +40,659 @@ class MockFinancialSummary:
 
 
 class MockNote:
-    def __init__(self, ref_date: date, val: float, observation: str = ""):
+    def __init__(self, ref_date: date, val: float, observation: str = "", bought: int = 0, sold: int = 0,
+                 buy_value: float = 0.0, sell_value: float = 0.0):
         self.reference_date = ref_date
         self.financial_summary = MockFinancialSummary(val)
         self.observation = observation
+        # Quantities of the note's ticker read from its trade lines (0 when unknown)
+        self.bought = bought
+        self.sold = sold
+        # Cost of the ticker's purchases and proceeds of its sales: trade values with their share of the fees
+        self.buy_value = buy_value
+        self.sell_value = sell_value
+
+
+def read_pdf_bytes(source) -> bytes:
+    """
+    Reads a PDF given as a path, bytes or a file-like object.
+    Django UploadedFiles are read chunk by chunk straight from the upload.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return f.read()
+    if hasattr(source, 'chunks'):
+        return b''.join(source.chunks())
+    return source.read()
+
+
+def source_name(source) -> str:
+    """File name of a PDF source ('' for raw bytes)."""
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.basename(source)
+    return os.path.basename(getattr(source, 'name', '') or '')
+
+
+def file_sha256(file_path: str) -> str:
+    """Returns the SHA-256 hex digest of the file contents."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def note_quantities(note) -> tuple:
+    """
+    (bought, sold, buy value, sell value) of the note's ticker, the values
+    being 0 when the note cannot be split by side. MockNote carries them;
+    CorrePy notes list their trades instead, summed here for the ticker of the
+    observation (every trade when there is none), with the fees shared out as
+    in side_values. Fractional-market codes (PETR4F) count as their ticker.
+    """
+    trades = getattr(note, 'transactions', None)
+    if trades is None:
+        return (getattr(note, 'bought', 0), getattr(note, 'sold', 0),
+                getattr(note, 'buy_value', 0.0), getattr(note, 'sell_value', 0.0))
+
+    ticker = (getattr(note, 'observation', '') or '').split(' - ')[0]
+    bought = sold = 0
+    bought_value = sold_value = buys = sells = Decimal(0)
+    for trade in trades:
+        value = Decimal(trade.amount) * Decimal(trade.unit_price)
+        is_buy = str(getattr(trade.transaction_type, 'value', trade.transaction_type)).lower() == 'buy'
+        if is_buy:
+            buys += value
+        else:
+            sells += value
+        code = (trade.security.ticker or '').upper()
+        if ticker and code not in (ticker, f"{ticker}F"):
+            continue
+        if is_buy:
+            bought += int(trade.amount)
+            bought_value += value
+        else:
+            sold += int(trade.amount)
+            sold_value += value
+
+    totals = TradeTotals(bought, sold, bought_value, sold_value, buys, sells)
+    buy_value, sell_value = side_values(totals, note.financial_summary.net_settlement_value)
+    return bought, sold, float(buy_value), float(sell_value)
+
+
+def serialize_notes(notes) -> list:
+    """
+    Converts BrokerageNote/MockNote objects into plain dicts (JSON and pickle friendly).
+    Only the fields consumed by DataAggregator are kept.
+    """
+    serialized = []
+    for note in notes:
+        try:
+            ref_date = note.reference_date
+            bought, sold, buy_value, sell_value = note_quantities(note)
+            serialized.append({
+                'reference_date': ref_date.isoformat() if ref_date else None,
+                'net_settlement_value': float(note.financial_summary.net_settlement_value),
+                'observation': getattr(note, 'observation', '') or '',
+                'bought': bought,
+                'sold': sold,
+                'buy_value': buy_value,
+                'sell_value': sell_value,
+            })
+        except AttributeError as e:
+            logger.warning(f"Skipping note without settlement data: {e}")
+    return serialized
+
+
+def deserialize_notes(data: list) -> list:
+    """Rebuilds MockNote objects from the output of serialize_notes."""
+    notes = []
+    for item in data:
+        ref_date = date.fromisoformat(item['reference_date']) if item['reference_date'] else None
+        notes.append(MockNote(ref_date, item['net_settlement_value'], item['observation'],
+                              item.get('bought', 0), item.get('sold', 0),
+                              item.get('buy_value', 0.0), item.get('sell_value', 0.0)))
+    return notes
+
+
+# Precompiled patterns for the fallback heuristics.
+# Token kinds recognised by NoteScanner, in priority order. Alternatives start with a
+# literal wherever possible so the regex engine can skip ahead on its prefix charset;
+# ticker candidates and operation letters are captured in lookaheads (or checked in
+# Python) so they never consume characters another token kind may need.
+SCANNER_TOKENS = [
+    ('liquid', r'L(?is:[IÍ\.]?.?QUIDO\s*)(?=(?P<liquid>(?i:PARA)))'
+               r'|l(?is:[IÍ\.]?.?QUIDO\s*)(?=(?P<liquid_l>(?i:PARA)))'),
+    ('bovespa', r'BOVESPA(?= (?:1 )?(?P<bovespa>[CV]))'),
+    ('bovespa_c', r'BOVESPA(?= (?:1 )?(?P<bovespa>C))'),
+    ('future', r'W(?=(?P<future>IN|DO)[A-Z]\d{2})'),
+    ('ticker', r'\b(?=(?P<ticker>[A-Z]{4}(?=[A-Z0-9]{0,3}\d)[A-Z0-9]{1,4})\b)'),
+    ('run', r'(?P<run>[\d\.,]+)(?=\s*(?P<sign>[CDcd]))'),
+    # The leading word boundary of "\bC\b" / "\bV\b" is checked in NoteScanner.scan
+    ('op_c', r'C\b(?P<op_c>)'),
+    ('op_v', r'V\b(?P<op_v>)'),
+]
+LIQUID_DATE_RE = re.compile(r'\d{2}/\d{2}/\d{4}')
+MONEY_RE = re.compile(r'(\d{1,3}(?:\.\d{3})*,\d{2})\s*([CD])')
+CURRENCY_RE = re.compile(r'R\$\s*([\d\.,]+)')
+FILENAME_DATE_RE = re.compile(r'(\d{2}-\d{2}-\d{4})')
+# "1-BOVESPA C VISTA PETR4 ON 100 35,00 3.500,00 D": operation, specification, quantity, price, value
+TRADE_RE = re.compile(r'BOVESPA\s+(?P<op>[CV])\b(?P<spec>[^\n]*?)\s(?P<quantity>\d{1,3}(?:\.\d{3})+|\d+)'
+                      r'\s+\d{1,3}(?:\.\d{3})*,\d{2,}\s+(?P<value>\d{1,3}(?:\.\d{3})*,\d{2})\s*[CD]')
+OPERATIONS_RE = re.compile(r'Valor das opera\S+\s+(\d{1,3}(?:\.\d{3})*,\d{2})', re.I)
+
+
+@lru_cache(maxsize=None)
+def _scanner_pattern(kinds: frozenset):
+    """Alternation of the token kinds still needed, compiled once per combination."""
+    return re.compile('|'.join(snippet for kind, snippet in SCANNER_TOKENS if kind in kinds))
+
+
+def _brl_decimal(text: str) -> Decimal:
+    return Decimal(text.replace('.', '').replace(',', '.'))
+
+
+class TradeTotals(NamedTuple):
+    bought: int  # Quantities of the ticker
+    sold: int
+    bought_value: Decimal  # Trade value of the ticker's purchases / sales
+    sold_value: Decimal
+    buys: Decimal  # Trade value of every purchase / sale of the note
+    sells: Decimal
+
+    @property
+    def gross(self) -> Decimal:
+        return self.buys + self.sells
+
+
+def trade_quantities(text: str, ticker: str) -> TradeTotals:
+    """Totals of the trade lines of a stock note, for ticker and for the whole note."""
+    bought = sold = 0
+    bought_value = sold_value = buys = sells = Decimal(0)
+    for m in TRADE_RE.finditer(text):
+        value = _brl_decimal(m.group('value'))
+        is_buy = m.group('op') == 'C'
+        if is_buy:
+            buys += value
+        else:
+            sells += value
+        if ticker and re.search(rf'\b{ticker}\b', m.group('spec')):
+            quantity = int(m.group('quantity').replace('.', ''))
+            if is_buy:
+                bought += quantity
+                bought_value += value
+            else:
+                sold += quantity
+                sold_value += value
+    return TradeTotals(bought, sold, bought_value, sold_value, buys, sells)
+
+
+def side_values(totals: TradeTotals, liquid) -> tuple:
+    """
+    (buy value, sell value) of the ticker: the trade values of its purchases
+    plus, and of its sales minus, their pro rata share (by trade value) of the
+    note's fees, i.e. of what the settlement lacks from sales minus purchases.
+    (0, 0) when the note has no trade values to split.
+    """
+    if not totals.gross:
+        return Decimal(0), Decimal(0)
+    fees = totals.sells - totals.buys - Decimal(str(liquid))
+    buy_value = totals.bought_value + fees * totals.bought_value / totals.gross
+    sell_value = totals.sold_value - fees * totals.sold_value / totals.gross
+    return buy_value.quantize(Decimal('0.01')), sell_value.quantize(Decimal('0.01'))
+
+
+def _is_word_char(text: str, i: int) -> bool:
+    """Same definition of a word character as the regex engine uses for \\b."""
+    return i >= 0 and (text[i].isalnum() or text[i] == '_')
+
+
+class ScanResult:
+    def __init__(self):
+        self.liquid = None  # (date_str or None, value_str, sign) after the first "Líquido para"
+        self.future = ""  # WIN/WDO if a futures code is present
+        self.ticker = ""  # First ticker candidate containing a digit
+        self.has_c = False  # Standalone "C" found
+        self.has_v = False  # Standalone "V" found
+        self.bovespa_c = False  # "BOVESPA C" / "BOVESPA 1 C" found
+        self.bovespa_v = False
+
+
+class NoteScanner:
+    """
+    Single-pass tokenizer over the extracted note text.
+
+    The text is swept once, front to back. Each search resumes where the previous
+    token ended, using a precompiled alternation of only the token kinds that are
+    still unresolved (e.g. ticker candidates stop being searched once the first one
+    is found, signed numbers are only searched after "Líquido para"). The sweep stops
+    as soon as nothing is left to resolve.
+    """
+
+    def scan(self, text: str) -> ScanResult:
+        result = ScanResult()
+        liquid_end = None
+        threshold = None  # numbers must end past this position (after the date, if any)
+        date_str = None
+        fallback = None  # first number after the marker, ignoring the date
+
+        pos = 0
+        while True:
+            kinds = set()
+            if liquid_end is None:
+                kinds.add('liquid')
+            elif result.liquid is None:
+                kinds.add('run')
+            if not result.future:
+                kinds.add('future')
+                if not result.ticker:
+                    kinds.add('ticker')
+                if not result.bovespa_c:
+                    kinds.add('bovespa_c' if result.bovespa_v else 'bovespa')
+                if not result.has_c:
+                    kinds.add('op_c')
+                if not result.has_v:
+                    kinds.add('op_v')
+            if not kinds:
+                break
+
+            m = _scanner_pattern(frozenset(kinds)).search(text, pos)
+            if not m:
+                break
+            pos = m.end()
+
+            # lastgroup is the innermost named group matched, i.e. the token kind
+            kind = m.lastgroup
+            if kind == 'sign':
+                start, run, sign = m.start(), m.group('run'), m.group('sign')
+                end = start + len(run)
+                # A number glued to the date ("18/03/20243.501,23 D") is read from the threshold on
+                if fallback is None and end > liquid_end:
+                    fallback = (run[max(0, liquid_end - start):], sign)
+                if end > threshold:
+                    result.liquid = (date_str, run[max(0, threshold - start):], sign)
+            elif kind in ('liquid', 'liquid_l'):
+                liquid_end = threshold = m.end(kind)
+                # A date is only taken when it directly follows the marker
+                date_match = LIQUID_DATE_RE.match(text, liquid_end)
+                if date_match:
+                    date_str, threshold = date_match.group(0), date_match.end()
+            elif kind == 'bovespa':
+                if m.group('bovespa') == 'C':
+                    result.bovespa_c = True
+                else:
+                    result.bovespa_v = True
+            elif kind == 'future':
+                result.future = 'W' + m.group('future')
+            elif kind == 'ticker':
+                result.ticker = m.group('ticker')
+            elif kind in ('op_c', 'op_v') and not _is_word_char(text, m.start() - 1):
+                if kind == 'op_c':
+                    result.has_c = True
+                else:
+                    result.has_v = True
+
+        if liquid_end is not None and result.liquid is None and fallback:
+            result.liquid = (None,) + fallback
+
+        return result
+
+
+# Fallback text extraction strategies
+STRATEGY_FAST = 'fast'      # raw text runs, no layout analysis
+STRATEGY_LAYOUT = 'layout'  # pdfminer layout analysis (LAParams)
+STRATEGIES = (STRATEGY_FAST, STRATEGY_LAYOUT)
+STRATEGY_CORREPY = 'correpy'  # Recorded for notes CorrePy parsed (no fallback text)
+
+
+class RawTextConverter(TextConverter):
+    """
+    TextConverter for laparams=None: characters are written in content-stream
+    order, without grouping them into lines and boxes. A newline is inserted
+    when the baseline changes and a space when there is a visible gap, which is
+    all the note heuristics need.
+    """
+
+    def receive_layout(self, ltpage) -> None:
+        last = None
+
+        def render(item) -> None:
+            nonlocal last
+            if isinstance(item, LTChar):
+                if last is not None:
+                    if abs(item.y0 - last.y0) > min(item.height, last.height) / 2:
+                        self.write_text("\n")
+                    elif item.x0 - last.x1 > item.width / 2 and last.get_text() != " ":
+                        self.write_text(" ")
+                self.write_text(item.get_text())
+                last = item
+            elif isinstance(item, LTContainer):
+                for child in item:
+                    render(child)
+
+        render(ltpage)
+        self.write_text("\n\f")
 
 
 class PdfParser:
-    def parse_file(self, file_path: str):
+    def __init__(self, incremental: bool = True, strategy: str = STRATEGY_FAST, correpy: bool = True):
+        """
+        incremental: extract the fallback text page by page (summary page first) and
+                     stop as soon as the settlement value, date and asset are known.
+                     With False the whole document is extracted in one go.
+        strategy: fallback text extraction. 'fast' skips layout analysis and only
+                  retries with 'layout' when it yields no note; 'layout' always
+                  runs the full pdfminer layout analysis.
+        correpy: try CorrePy before the fallback heuristics (False goes straight to the fallback).
         """
-        Parses a brokerage note PDF file and returns a list of BrokerageNote-like objects.
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown extraction strategy: {strategy}")
+        self.incremental = incremental
+        self.strategy = strategy
+        self.correpy = correpy
+
+    def parse_file(self, source, filename: str = None):
+        """
+        Parses a brokerage note PDF and returns a list of BrokerageNote-like objects.
+        source may be a path, bytes or a file-like object; it is read once and the
+        same buffer is shared by CorrePy and the fallback strategies.
         Returns empty list if parsing fails.
         """
+        return self.parse_with_text(source, filename)[0]
+
+    def parse_with_text(self, source, filename: str = None) -> tuple:
+        """
+        Same as parse_file, returning (notes, strategy, text, complete): the
+        extraction that produced the notes ('correpy', 'fast' or 'layout'), the
+        text the heuristics read ('' when CorrePy parsed the note, it reads the
+        PDF itself) and whether that text covers every page (False after an
+        incremental early exit).
+        """
         notes = []
+        data = read_pdf_bytes(source)
+        filename = filename or source_name(source)
 
         # 1. Try CorrePy (only if likely standard Note, skip if specific known failure cases? No, try generally)
-        if ParserFactory:
+        if ParserFactory and self.correpy:
             try:
-                # Capture stderr to avoid noise if it fails
-                with open(file_path, 'rb') as f:
-                    content = io.BytesIO(f.read())
-
-                parser = ParserFactory(brokerage_note=content)
+                parser = ParserFactory(brokerage_note=io.BytesIO(data))
                 notes = parser.parse()
                 if notes:
-                    logger.info(f"Parsed {len(notes)} notes from {file_path} using CorrePy")
-                    return notes
+                    logger.info(f"Parsed {len(notes)} notes from {filename} using CorrePy")
+                    return notes, STRATEGY_CORREPY, '', True
+            except MemoryError:
+                raise  # Out of memory is not a parse failure: the caller (e.g. a sandbox) must see it
             except Exception:
                 pass
 
         # 2. Fallback
-        return self._parse_fallback(file_path)
+        return self._fallback_with_text(data, filename)
+
+    def _parse_fallback(self, source, filename: str = None):
+        return self._fallback_with_text(source, filename)[0]
 
-    def _parse_fallback(self, file_path: str):
+    def _fallback_with_text(self, source, filename: str = None) -> tuple:
         if not extract_text:
             logger.warning("pdfminer not available for fallback parsing.")
-            return []
+            return [], '', '', True
 
+        filename = filename or source_name(source)
         try:
-            # Extract text
-            text = extract_text(file_path, laparams=LAParams())
-
-            # Method A: Specific "LÍQUIDO PARA" Extraction (Futures & Stocks)
-            # 1. Clean Text
-            clean_text = text.replace('□', '.')
-
-            # 2. Try strict regex
-            # Captures date (optional) and value based on "Líquido para" pattern
-            liquid_regex = re.search(
-                r'L[IÍ\.]?.?QUIDO\s*PARA.*?(\d{2}/\d{2}/\d{4})?.*?([\d\.,]+)\s*([CD])',
-                clean_text,
-                re.IGNORECASE | re.DOTALL)
-
-            val = Decimal(0)
-            ref_date = None
-            observation = ""
-
-            # Data Extraction
-            if liquid_regex:
-                date_str = liquid_regex.group(1)
-                val_str = liquid_regex.group(2)
-                sign = liquid_regex.group(3)
-
-                if date_str:
-                    try:
-                        ref_date = datetime.strptime(date_str, '%d/%m/%Y').date()
-                    except ValueError:
-                        pass
+            # The document is parsed once and its pages are shared by every strategy
+            pages = self.load_pages(source)
+            strategies = [self.strategy] if self.strategy == STRATEGY_LAYOUT else list(STRATEGIES)
+
+            notes, text, complete = [], '', True
+            for strategy in strategies:
+                text, complete = self.extract_note_pages(pages, filename, strategy)
+                notes = self.parse_text(text, filename)
+                if notes:
+                    break
+                logger.info(f"No note found in {filename} with '{strategy}' extraction")
+            # Without a note, the text of the last strategy is kept: a later heuristic may read it
+            return notes, strategy, text, complete
 
-                try:
-                    clean_val = val_str.replace('.', '').replace(',', '.')
-                    val = Decimal(clean_val)
-                    if sign == 'D':
-                        val = -val
-                except BaseException:
-                    pass
+        except MemoryError:
+            raise
+        except Exception as e:
+            logger.error(f"Fallback parsing error for {filename}: {e}")
+            return [], '', '', True
 
-            # Fallback for Value: Largest X,XX [CD] found in text
-            if val == 0:
-                # Look for all "Number + C/D"
-                # Exclude 0,00
-                matches = re.findall(r'(\d{1,3}(?:\.\d{3})*,\d{2})\s*([CD])', clean_text)
-                max_abs_val = Decimal(0)
-
-                for v_str, s_char in matches:
-                    if v_str == "0,00":
-                        continue
-                    try:
-                        c_val = Decimal(v_str.replace('.', '').replace(',', '.'))
-                        if c_val > max_abs_val:
-                            max_abs_val = c_val
-                            val = -c_val if s_char == 'D' else c_val
-                    except BaseException:
-                        pass
-
-            # Fallback for Date: Filename
-            if not ref_date:
-                filename = os.path.basename(file_path)
-                date_match = re.search(r'(\d{2}-\d{2}-\d{4})', filename)
-                if date_match:
-                    try:
-                        ref_date = datetime.strptime(date_match.group(1), '%d-%m-%Y').date()
-                    except BaseException:
-                        ref_date = date.today()
-                else:
-                    ref_date = date.today()
+    def load_pages(self, source) -> list:
+        """Parses the PDF document once (from a path, bytes or file-like object) and returns its pages."""
+        return list(PDFPage.get_pages(io.BytesIO(read_pdf_bytes(source))))
 
-            # Asset Identification
-            # 1. Futures (WIN/WDO)
-            asset_match = re.search(r'(WIN|WDO)[A-Z]\d{2}', clean_text)
-            if asset_match:
-                code_type = asset_match.group(1)
-                observation = f"{code_type}"
+    def extract_note_text(self, pages: list, filename: str, strategy: str = STRATEGY_LAYOUT) -> str:
+        """Text of extract_note_pages, without its completeness flag."""
+        return self.extract_note_pages(pages, filename, strategy)[0]
 
-            # 2. Stocks/Options (Ticker heuristic)
+    def extract_note_pages(self, pages: list, filename: str, strategy: str = STRATEGY_LAYOUT) -> tuple:
+        """
+        Extracts the note text from already loaded pages (see load_pages) with
+        the given strategy, page by page.
+
+        In incremental mode the last page, where SINACOR notes print the
+        "Líquido para" summary, is read first, followed by the remaining pages
+        in order, and extraction stops once the note is identified. Skipped
+        pages (always the ones between the pages read so far and the summary)
+        are never interpreted. The returned text keeps document order, so
+        with the 'layout' strategy and every page needed it is identical to
+        extract_text(). Returns (text, complete): complete is False when the
+        early exit left pages unread.
+        """
+        page_texts = {}
+        if not pages:
+            return "", True
+
+        with io.StringIO() as output:
+            rsrcmgr = PDFResourceManager(caching=True)
+            if strategy == STRATEGY_FAST:
+                device = RawTextConverter(rsrcmgr, output, laparams=None)
             else:
-                # Look for Ticker: 4 letters + alphanumeric suffixes
-                # Ignored common words
-                ignored = {'PARA', 'DATA', 'NOTA', 'PAGTO', 'VALOR', 'TOTAL', 'LOCAL', 'PRAZO', 'PRECO', 'FOLHA'}
-
-                # Regex for potential tickers
-                ticker_candidates = re.findall(r'\b([A-Z]{4}[A-Z0-9]{1,4})\b', clean_text)
-
-                found_ticker = ""
-                for cand in ticker_candidates:
-                    if cand not in ignored and not re.match(r'^[A-Z]+$', cand):
-                        # Require at least one digit to distinguish from words
-                        if any(c.isdigit() for c in cand):
-                            found_ticker = cand
-                            break
-
-                if found_ticker:
-                    # Look for Operation (C/V)
-                    op = "?"
-                    if re.search(r'\bC\b', clean_text) and not re.search(r'\bV\b', clean_text):
-                        op = "C"
-                    elif re.search(r'\bV\b', clean_text) and not re.search(r'\bC\b', clean_text):
-                        op = "V"
-                    else:
-                        # Scan common lines
-                        if "BOVESPA C" in clean_text or "BOVESPA 1 C" in clean_text or "1-BOVESPA C" in clean_text:
-                            op = "C"
-                        elif "BOVESPA V" in clean_text or "BOVESPA 1 V" in clean_text or "1-BOVESPA V" in clean_text:
-                            op = "V"
-
-                    # Last Resort: Infer from Value Sign (Net Settlement)
-                    # Debit (Negative) -> Purchase (C)
-                    # Credit (Positive) -> Sale (V)
-                    if op == "?":
-                        if val < 0:
-                            op = "C"
-                        elif val > 0:
-                            op = "V"
-
-                    observation = f"{found_ticker} - {op}"
-
-            if val != 0:
-                logger.info(
-                    f"Parsed via Heuristic: Date={ref_date}, Value={val}, Obs={observation} from "
-                    f"{os.path.basename(file_path)}")
-                return [MockNote(ref_date, float(val), observation)]
-
-            # Method B: Generic Currency Extraction (Legacy)
-            # ... (Existing logic) ...
-            matches = re.findall(r'R\$\s*([\d\.,]+)', text)
-
-            max_val = Decimal(0)
-            for m in matches:
-                clean_m = m.strip()
-                if clean_m and clean_m[-1] in '.,':
-                    clean_m = clean_m[:-1]
+                device = TextConverter(rsrcmgr, output, laparams=LAParams())
+            interpreter = PDFPageInterpreter(rsrcmgr, device)
 
-                try:
-                    if ',' in clean_m:
-                        val_str = clean_m.replace('.', '').replace(',', '.')
-                    else:
-                        val_str = clean_m
-
-                    current_val = Decimal(val_str)
-                    if abs(current_val) > abs(max_val):
-                        max_val = current_val
-                except BaseException:
+            order = list(range(len(pages)))
+            if self.incremental:
+                order = order[-1:] + order[:-1]
+
+            for index in order:
+                interpreter.process_page(pages[index])
+                page_texts[index] = output.getvalue()
+                output.seek(0)
+                output.truncate(0)
+
+                if not self.incremental:
                     continue
+                text = "".join(page_texts[i] for i in sorted(page_texts))
+                leading = "".join(page_texts[i] for i in sorted(page_texts) if i != len(pages) - 1)
+                if len(page_texts) < len(pages) and self._is_identified(text, leading, filename):
+                    logger.info(f"Early exit after {len(page_texts)}/{len(pages)} pages for {filename}")
+                    break
 
-            # Extract Date from Filename
-            filename = os.path.basename(file_path)
-            date_match = re.search(r'(\d{2}-\d{2}-\d{4})', filename)
+        return "".join(page_texts[i] for i in sorted(page_texts)), len(page_texts) == len(pages)
 
-            if date_match:
+    def _is_identified(self, text: str, leading: str, filename: str) -> bool:
+        """
+        True when the settlement value, its date, the asset and its operation
+        can already be read from text, whatever the skipped pages hold. leading
+        is the text of the pages read before the summary page: the asset has to
+        be found there, as the first ticker of the document precedes any
+        skipped page, while one on the summary page alone could be anything.
+        """
+        scan = NoteScanner().scan(text.replace('□', '.'))
+        if not scan.liquid:
+            return False
+        asset = NoteScanner().scan(leading.replace('□', '.'))
+        if not (asset.future or asset.ticker) or (scan.future, scan.ticker) != (asset.future, asset.ticker):
+            return False
+
+        date_str, val_str, _ = scan.liquid
+        if not date_str and not FILENAME_DATE_RE.search(filename):
+            return False
+
+        try:
+            if Decimal(val_str.replace('.', '').replace(',', '.')) == 0:
+                return False
+        except BaseException:
+            return False
+
+        if scan.future:
+            return True
+
+        # The operation markers must already settle C/V (see parse_text): a
+        # "C" and a "V" plus a "BOVESPA C" line, which nothing later overrides
+        if not (scan.has_c and scan.has_v and scan.bovespa_c):
+            return False
+
+        # Every trade line must have been read for the quantities: their total
+        # has to reach the "Valor das operações" printed in the summary
+        operations = OPERATIONS_RE.search(text)
+        return bool(operations) and trade_quantities(text, scan.ticker).gross == _brl_decimal(operations.group(1))
+
+    def parse_text(self, text: str, filename: str):
+        """
+        Heuristic extraction of a note from already extracted PDF text.
+        Settlement value, date, ticker and operation markers come from a single
+        NoteScanner sweep; the whole-text amount and R$ scans only run when no
+        settlement value was found.
+        """
+        # Method A: Specific "LÍQUIDO PARA" Extraction (Futures & Stocks)
+        # 1. Clean Text
+        clean_text = text.replace('□', '.')
+        scan = NoteScanner().scan(clean_text)
+
+        val = Decimal(0)
+        ref_date = None
+        observation = ""
+
+        # 2. Data Extraction: value (and optional date) right after "Líquido para"
+        if scan.liquid:
+            date_str, val_str, sign = scan.liquid
+
+            if date_str:
                 try:
-                    # filename often uses dash
-                    dt = datetime.strptime(date_match.group(1), '%d-%m-%Y')
-                    ref_date = dt.date()
+                    ref_date = datetime.strptime(date_str, '%d/%m/%Y').date()
+                except ValueError:
+                    pass
+
+            try:
+                clean_val = val_str.replace('.', '').replace(',', '.')
+                val = Decimal(clean_val)
+                if sign == 'D':
+                    val = -val
+            except BaseException:
+                pass
+
+        # Fallback for Value: Largest X,XX [CD] found in text
+        if val == 0:
+            # Look for all "Number + C/D"
+            # Exclude 0,00
+            matches = MONEY_RE.findall(clean_text)
+            max_abs_val = Decimal(0)
+
+            for v_str, s_char in matches:
+                if v_str == "0,00":
+                    continue
+                try:
+                    c_val = Decimal(v_str.replace('.', '').replace(',', '.'))
+                    if c_val > max_abs_val:
+                        max_abs_val = c_val
+                        val = -c_val if s_char == 'D' else c_val
                 except BaseException:
                     pass
 
-            if max_val == 0:
-                # logger.warning(f"Could not extract value from {filename}")
-                return []
+        # Fallback for Date: Filename
+        if not ref_date:
+            date_match = FILENAME_DATE_RE.search(filename)
+            if date_match:
+                try:
+                    ref_date = datetime.strptime(date_match.group(1), '%d-%m-%Y').date()
+                except BaseException:
+                    ref_date = date.today()
+            else:
+                ref_date = date.today()
+
+        # Asset Identification
+        # 1. Futures (WIN/WDO)
+        if scan.future:
+            observation = f"{scan.future}"
+
+        # 2. Stocks/Options (Ticker heuristic)
+        elif scan.ticker:
+            # Look for Operation (C/V)
+            op = "?"
+            if scan.has_c and not scan.has_v:
+                op = "C"
+            elif scan.has_v and not scan.has_c:
+                op = "V"
+            else:
+                # Scan common lines ("BOVESPA C", "BOVESPA 1 C", "1-BOVESPA C")
+                if scan.bovespa_c:
+                    op = "C"
+                elif scan.bovespa_v:
+                    op = "V"
+
+            # Last Resort: Infer from Value Sign (Net Settlement)
+            # Debit (Negative) -> Purchase (C)
+            # Credit (Positive) -> Sale (V)
+            if op == "?":
+                if val < 0:
+                    op = "C"
+                elif val > 0:
+                    op = "V"
+
+            observation = f"{scan.ticker} - {op}"
+
+        if val != 0:
+            logger.info(
+                f"Parsed via Heuristic: Date={ref_date}, Value={val}, Obs={observation} from "
+                f"{filename}")
+            if scan.ticker and not scan.future:
+                totals = trade_quantities(clean_text, scan.ticker)
+                buy_value, sell_value = side_values(totals, val)
+                return [MockNote(ref_date, float(val), observation, totals.bought, totals.sold,
+                                 float(buy_value), float(sell_value))]
+            return [MockNote(ref_date, float(val), observation)]
+
+        # Method B: Generic Currency Extraction (Legacy)
+        # Only reached when Method A found nothing, so it is scanned lazily.
+        matches = CURRENCY_RE.findall(text)
+
+        max_val = Decimal(0)
+        for m in matches:
+            clean_m = m.strip()
+            if clean_m and clean_m[-1] in '.,':
+                clean_m = clean_m[:-1]
+
+            try:
+                if ',' in clean_m:
+                    val_str = clean_m.replace('.', '').replace(',', '.')
+                else:
+                    val_str = clean_m
 
-            # logger.info(f"Fallback extracted: Date={ref_date}, Value={max_val} from {filename}")
-            return [MockNote(ref_date, float(max_val))]
+                current_val = Decimal(val_str)
+                if abs(current_val) > abs(max_val):
+                    max_val = current_val
+            except BaseException:
+                continue
 
-        except Exception as e:
-            logger.error(f"Fallback parsing error for {file_path}: {e}")
+        # Extract Date from Filename
+        date_match = FILENAME_DATE_RE.search(filename)
+
+        if date_match:
+            try:
+                # filename often uses dash
+                dt = datetime.strptime(date_match.group(1), '%d-%m-%Y')
+                ref_date = dt.date()
+            except BaseException:
+                pass
+
+        if max_val == 0:
+            # logger.warning(f"Could not extract value from {filename}")
             return []
+
+        # logger.info(f"Fallback extracted: Date={ref_date}, Value={max_val} from {filename}")
+        return [MockNote(ref_date, float(max_val))]
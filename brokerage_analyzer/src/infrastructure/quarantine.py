@@ -0,0 +1,45 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from brokerage_analyzer.models import QuarantinedNote
+from brokerage_analyzer.src.infrastructure.parse_sandbox import REASON_ERROR, TRANSIENT_REASONS, ParseFailure
+
+
+class DatabaseQuarantine:
+    """
+    Quarantined PDFs backed by the QuarantinedNote table, keyed by the SHA-256 of their bytes.
+
+    Parse errors and the memory limit repeat for the same bytes and keep the
+    file out until it is released. Timeouts and crashes may not: their entries
+    expire after transient_seconds (default BROKERAGE_QUARANTINE_TRANSIENT_SECONDS),
+    after which the file is parsed again and, if it still fails, quarantined anew.
+    """
+
+    def __init__(self, transient_seconds: int = None):
+        if transient_seconds is None:
+            transient_seconds = settings.BROKERAGE_QUARANTINE_TRANSIENT_SECONDS
+        self.transient_seconds = transient_seconds
+
+    def get_many(self, hashes) -> dict:
+        """content hash -> ParseFailure recorded for it (expired transient failures left out)."""
+        expired = timezone.now() - timedelta(seconds=self.transient_seconds)
+        return {
+            h: ParseFailure(reason, f"quarantined: {error}", seconds)
+            for h, reason, error, seconds in QuarantinedNote.objects.filter(content_hash__in=list(hashes))
+            .exclude(reason__in=TRANSIENT_REASONS, created_at__lt=expired)
+            .values_list('content_hash', 'reason', 'error', 'seconds')
+        }
+
+    def set_many(self, mapping: dict):
+        """mapping: content hash -> (filename, exception). Replaces the expired entries of files failing again."""
+        QuarantinedNote.objects.bulk_create([
+            QuarantinedNote(content_hash=h, filename=filename, reason=getattr(error, 'reason', REASON_ERROR),
+                            error=str(error), seconds=getattr(error, 'seconds', None))
+            for h, (filename, error) in mapping.items()
+        ], update_conflicts=True, unique_fields=['content_hash'],
+            update_fields=['filename', 'reason', 'error', 'seconds', 'created_at'])
+
+    def release(self, hashes):
+        QuarantinedNote.objects.filter(content_hash__in=list(hashes)).delete()
@@ -0,0 +1,84 @@
+import csv
+from itertools import islice
+from typing import Iterable, Iterator
+
+# Try to import pyarrow (Parquet export is optional)
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Report columns and the Transaction fields they are read from (values_list order)
+REPORT_COLUMNS = ('Date', 'Category', 'AssetClass', 'Ticker', 'LiquidValue', 'BuyValue', 'SellValue', 'Filename')
+TRANSACTION_FIELDS = ('date', 'category', 'asset_class', 'ticker', 'liquid_value', 'buy_value', 'sell_value',
+                      'filename')
+FLOAT_COLUMNS = ('LiquidValue', 'BuyValue', 'SellValue')
+CHUNK_SIZE = 2000
+
+
+def iter_chunks(rows: Iterable[tuple], chunk_size: int = CHUNK_SIZE) -> Iterator[list]:
+    """Groups an iterator of rows (e.g. values_list().iterator()) into lists of chunk_size rows."""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_records(rows: Iterable[tuple]) -> Iterator[dict]:
+    """Turns values_list rows into the record dicts expected by ExcelExporter, one at a time."""
+    for date_, category, asset_class, ticker, liquid, buy, sell, filename in rows:
+        yield {
+            'Date': date_,
+            'Category': category,
+            'AssetClass': asset_class,
+            'Ticker': ticker,
+            'LiquidValue': float(liquid),
+            'BuyValue': float(buy),
+            'SellValue': float(sell),
+            'Filename': filename,
+        }
+
+
+class _Echo:
+    """File-like object whose write() returns the value, so csv.writer can feed a generator."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows: Iterable[tuple]) -> Iterator[str]:
+    """Yields the report as CSV lines (header first); decimals are written exactly as stored."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(REPORT_COLUMNS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def write_parquet(rows: Iterable[tuple], fp, chunk_size: int = CHUNK_SIZE):
+    """Writes the report to fp as Parquet, one row group per chunk built straight into Arrow columns."""
+    if pq is None:
+        raise RuntimeError("Parquet export requires pyarrow.")
+
+    schema = pa.schema([
+        ('Date', pa.date32()),
+        ('Category', pa.string()),
+        ('AssetClass', pa.string()),
+        ('Ticker', pa.string()),
+        ('LiquidValue', pa.float64()),
+        ('BuyValue', pa.float64()),
+        ('SellValue', pa.float64()),
+        ('Filename', pa.string()),
+    ])
+
+    with pq.ParquetWriter(fp, schema) as writer:
+        for chunk in iter_chunks(rows, chunk_size):
+            arrays = []
+            for field, column in zip(schema, zip(*chunk)):
+                if field.name in FLOAT_COLUMNS:
+                    column = [float(value) for value in column]
+                arrays.append(pa.array(column, type=field.type))
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
@@ -0,0 +1,105 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+from brokerage_analyzer.models import MonthlyRollup, Transaction
+
+TOTAL_FIELDS = ('transaction_count', 'buy_total', 'sell_total', 'liquid_total')
+CENT = Decimal('0.01')
+
+
+def _money(t, name: str) -> Decimal:
+    """Value of a DecimalField as it is stored (instances built for bulk_create may still hold floats)."""
+    return Transaction._meta.get_field(name).to_python(getattr(t, name)).quantize(CENT)
+
+
+def _deltas(transactions, sign: int) -> dict:
+    """Sums Transaction instances per (year, month, category)."""
+    deltas = defaultdict(lambda: [0, Decimal(0), Decimal(0), Decimal(0)])
+    date_field = Transaction._meta.get_field('date')
+    for t in transactions:
+        ref_date = date_field.to_python(t.date)
+        delta = deltas[(ref_date.year, ref_date.month, t.category)]
+        delta[0] += sign
+        delta[1] += sign * _money(t, 'buy_value')
+        delta[2] += sign * _money(t, 'sell_value')
+        delta[3] += sign * _money(t, 'liquid_value')
+    return deltas
+
+
+def apply(transactions, sign: int = 1):
+    """
+    Adds (sign=1) or removes (sign=-1) transactions from the rollup.
+    Meant to run in the same DB transaction as the insert/delete it mirrors;
+    one UPDATE (or INSERT) per touched (year, month, category).
+    """
+    deltas = _deltas(transactions, sign)
+    with transaction.atomic():
+        for (year, month, category), (count, buy, sell, liquid) in deltas.items():
+            key = {'year': year, 'month': month, 'category': category}
+            updated = MonthlyRollup.objects.filter(**key).update(
+                transaction_count=F('transaction_count') + count,
+                buy_total=F('buy_total') + buy,
+                sell_total=F('sell_total') + sell,
+                liquid_total=F('liquid_total') + liquid,
+            )
+            if not updated:
+                MonthlyRollup.objects.create(**key, transaction_count=count, buy_total=buy, sell_total=sell,
+                                             liquid_total=liquid)
+
+        if sign < 0:
+            for year, month, category in deltas:
+                MonthlyRollup.objects.filter(year=year, month=month, category=category,
+                                             transaction_count__lte=0).delete()
+
+
+def expected_rollup() -> dict:
+    """The rollup computed from scratch with one grouped query over Transaction."""
+    rows = (
+        Transaction.objects.order_by()
+        .annotate(year=ExtractYear('date'), month=ExtractMonth('date'))
+        .values('year', 'month', 'category')
+        .annotate(transaction_count=Count('id'), buy_total=Sum('buy_value'), sell_total=Sum('sell_value'),
+                  liquid_total=Sum('liquid_value'))
+    )
+    return {(r['year'], r['month'], r['category']): tuple(r[f] for f in TOTAL_FIELDS) for r in rows}
+
+
+def stored_rollup() -> dict:
+    return {
+        (r[0], r[1], r[2]): tuple(r[3:])
+        for r in MonthlyRollup.objects.values_list('year', 'month', 'category', *TOTAL_FIELDS)
+    }
+
+
+def rebuild() -> int:
+    """Recomputes the whole rollup; returns the number of rows written."""
+    expected = expected_rollup()
+    with transaction.atomic():
+        MonthlyRollup.objects.all().delete()
+        MonthlyRollup.objects.bulk_create([
+            MonthlyRollup(year=year, month=month, category=category, **dict(zip(TOTAL_FIELDS, totals)))
+            for (year, month, category), totals in expected.items()
+        ])
+    return len(expected)
+
+
+def verify() -> list:
+    """Returns (key, expected, stored) for every (year, month, category) where the rollup drifted."""
+    expected = expected_rollup()
+    stored = stored_rollup()
+    mismatches = []
+    for key in sorted(set(expected) | set(stored), key=str):
+        exp, got = expected.get(key), stored.get(key)
+        if exp is None or got is None or any(Decimal(str(a)) != Decimal(str(b)) for a, b in zip(exp, got)):
+            mismatches.append((key, exp, got))
+    return mismatches
+
+
+def monthly_totals():
+    """(year, month, category, buy, sell, liquid) rows in the layout expected by ExcelExporter."""
+    return MonthlyRollup.objects.values_list('year', 'month', 'category', 'buy_total', 'sell_total',
+                                             'liquid_total')
@@ -1,30 +1,211 @@
 
 
+import hashlib
 import os
+from array import array
 from collections import defaultdict
-from tqdm import tqdm
-from brokerage_analyzer.src.infrastructure.pdf_parser import PdfParser
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from brokerage_analyzer.src.infrastructure.instrument_registry import get_registry
+from brokerage_analyzer.src.infrastructure.pdf_parser import (
+    PdfParser, deserialize_notes, note_quantities, read_pdf_bytes, serialize_notes, source_name
+)
+
+
+def _parse_pdf_notes(data: bytes, filename: str):
+    """
+    Worker entry point for the process pool.
+    Parses a single PDF (already read into memory) and returns its notes in
+    serialized (picklable) form, with the strategy and text they came from.
+    """
+    notes, strategy, text, complete = PdfParser().parse_with_text(data, filename)
+    return serialize_notes(notes), strategy, text, complete
+
+
+# Columnar record store layout: float columns live in typed arrays, the others in
+# lists of interned values (a few distinct dates/tickers/files repeated many times)
+COLUMNS = ('Date', 'Category', 'AssetClass', 'Ticker', 'LiquidValue', 'BuyValue', 'SellValue', 'BuyQuantity',
+           'SellQuantity', 'Filename', 'SourceHash')
+FLOAT_COLUMNS = ('LiquidValue', 'BuyValue', 'SellValue', 'BuyQuantity', 'SellQuantity')
+
+
+def _is_futures(category) -> bool:
+    return str(category).startswith('Futuros') or str(category).startswith('Futures')
+
+
+def _sorted_uniques_per_group(group_ids, values, n_groups: int) -> list:
+    """For each group id, the sorted distinct values of that group (vectorized set + sorted per group)."""
+    codes, uniques = pd.factorize(values)
+    by_value = np.argsort(uniques, kind='stable')
+    rank = np.empty(len(uniques), dtype=np.int64)
+    rank[by_value] = np.arange(len(uniques))
+    sorted_uniques = uniques[by_value]
+
+    pairs = np.unique(group_ids.astype(np.int64) * len(uniques) + rank[codes])
+    bounds = np.searchsorted(pairs // len(uniques), np.arange(n_groups + 1))
+    values = sorted_uniques[pairs % len(uniques)].tolist()
+    return [values[bounds[g]:bounds[g + 1]] for g in range(n_groups)]
+
+
+def _digest(hashes) -> str:
+    """Stable source hash for a record built from one or more files."""
+    hashes = sorted(set(hashes))
+    if len(hashes) == 1:
+        return hashes[0]
+    return hashlib.sha256(",".join(hashes).encode()).hexdigest()
 
 
 class DataAggregator:
-    def __init__(self):
+    def __init__(self, max_workers: int = 1, cache=None, registry=None, text_store=None, sandbox=None,
+                 quarantine=None):
+        """
+        max_workers: size of the process pool used by process_files (1 = serial).
+        cache: optional parse cache exposing get_many(hashes) / set_many(mapping),
+               keyed by the SHA-256 of the PDF bytes and storing serialized notes.
+        registry: InstrumentRegistry used to classify tickers (default: the shared one).
+        text_store: optional store exposing set_many(mapping, asset_type), receiving
+                    content hash -> (filename, strategy, text, complete) for every file
+                    parsed (strategy and text empty for files served by the parse cache).
+        sandbox: optional ParseSandbox: every file is then parsed in its own child
+                 process under a timeout and memory limit (up to max_workers at once).
+        quarantine: optional store exposing get_many(hashes) -> {hash: exception} and
+                    set_many(mapping), receiving content hash -> (filename, exception)
+                    for files that failed; quarantined files are not parsed again.
+        """
         self.parser = PdfParser()
-        self.records = []
+        self._columns = {c: array('d') if c in FLOAT_COLUMNS else [] for c in COLUMNS}
+        self._interned = {}
+        self.max_workers = max(1, max_workers or 1)
+        self.cache = cache
+        self.registry = registry or get_registry()
+        self.text_store = text_store
+        self.sandbox = sandbox
+        self.quarantine = quarantine
 
-    def process_directory(self, directory_path: str, asset_class: str):
+    def process_directory(self, directory_path: str, asset_class: str, progress=None):
         if not os.path.exists(directory_path):
-            return
+            return []
 
         files = [f for f in os.listdir(directory_path) if f.lower().endswith('.pdf')]
+        file_paths = [os.path.join(directory_path, filename) for filename in files]
+        return self.process_files(file_paths, asset_class, progress=progress)
+
+    def process_files(self, sources, asset_class: str, progress=None):
+        """
+        Parses a batch of PDFs and appends their records in the order given.
+        sources may be paths, bytes or file-like objects (e.g. Django UploadedFiles);
+        each one is read exactly once and the same bytes are hashed and parsed.
+        Files already present in the parse cache (same SHA-256) are not parsed again,
+        and identical files within the batch are parsed and merged only once (under
+        the name of the first of them).
+        With max_workers > 1 the remaining files are parsed in a bounded process pool;
+        results are merged back in input order, so the output is identical to the
+        serial path.
+        progress: optional callable(source, error) invoked as soon as each file is
+                  done (error is None on success), in completion order.
+        Returns a list of (source, exception) for files that failed.
+        """
+        sources = list(sources)
+        errors = []
+        contents = {}
+        hashes = {}
+        failures = {}
+
+        def done(content_hash, error=None):
+            if error is not None:
+                errors.append((sources[contents[content_hash][0]], error))
+                failures[content_hash] = (source_name(sources[contents[content_hash][0]]), error)
+            if progress:
+                for index, h in hashes.items():
+                    if h == content_hash:
+                        progress(sources[index], error)
+
+        for index, source in enumerate(sources):
+            try:
+                data = read_pdf_bytes(source)
+            except OSError as e:
+                errors.append((source, e))
+                if progress:
+                    progress(source, e)
+                continue
+            hashes[index] = hashlib.sha256(data).hexdigest()
+            contents.setdefault(hashes[index], (index, data))
+
+        parsed = self.cache.get_many(set(hashes.values())) if self.cache else {}
+        for content_hash in parsed:
+            done(content_hash)
+        pending = {h: content for h, content in contents.items() if h not in parsed}
+        if self.quarantine and pending:
+            for content_hash, error in self.quarantine.get_many(pending).items():
+                del pending[content_hash]
+                done(content_hash, error)
+                del failures[content_hash]  # Already quarantined
+
+        fresh = {}
+        texts = {}
+        workers = min(self.max_workers, len(pending))
+
+        if workers <= 1:
+            for content_hash, (index, data) in pending.items():
+                try:
+                    fresh[content_hash], strategy, text, complete = self._parse(data, source_name(sources[index]))
+                    texts[content_hash] = (source_name(sources[index]), strategy, text, complete)
+                except Exception as e:
+                    done(content_hash, e)
+                else:
+                    done(content_hash)
+        else:
+            # Sandboxed parses already run in child processes: threads only wait for them
+            pool, parse = ((ThreadPoolExecutor, self.sandbox.parse) if self.sandbox
+                           else (ProcessPoolExecutor, _parse_pdf_notes))
+            with pool(max_workers=workers) as executor:
+                futures = {executor.submit(parse, data, source_name(sources[index])): h
+                           for h, (index, data) in pending.items()}
+
+                for future in as_completed(futures):
+                    content_hash = futures[future]
+                    try:
+                        fresh[content_hash], strategy, text, complete = future.result()
+                        texts[content_hash] = (source_name(sources[contents[content_hash][0]]), strategy, text, complete)
+                    except Exception as e:
+                        done(content_hash, e)
+                    else:
+                        done(content_hash)
+
+        if self.cache and fresh:
+            self.cache.set_many(fresh)
+        if self.text_store:
+            # Cached files get a row too (no text), so every merged file can be linked to its transactions
+            texts.update({h: (source_name(sources[contents[h][0]]), '', '', True) for h in parsed})
+            if texts:
+                self.text_store.set_many(texts, asset_class)
+        if self.quarantine and failures:
+            self.quarantine.set_many(failures)
+        parsed.update(fresh)
 
-        for filename in tqdm(files, desc=f"Parsing {asset_class}"):
-            file_path = os.path.join(directory_path, filename)
-            self.process_single_pdf(file_path, asset_class)
+        # Merge in input order, not completion order; a file uploaded twice counts once
+        for content_hash, (index, _) in contents.items():
+            if content_hash in parsed:
+                self.add_notes(deserialize_notes(parsed[content_hash]), source_name(sources[index]),
+                               asset_class, content_hash)
+
+        return errors
+
+    def _parse(self, data: bytes, filename: str) -> tuple:
+        """(serialized notes, strategy, text, complete) of one PDF, in the sandbox when there is one."""
+        if self.sandbox:
+            return self.sandbox.parse(data, filename)
+        notes, strategy, text, complete = self.parser.parse_with_text(data, filename)
+        return serialize_notes(notes), strategy, text, complete
 
     def process_single_pdf(self, file_path: str, asset_class: str):
-        filename = os.path.basename(file_path)
-        notes = self.parser.parse_file(file_path)
+        data = read_pdf_bytes(file_path)
+        notes = self.parser.parse_file(data, os.path.basename(file_path))
+        self.add_notes(notes, os.path.basename(file_path), asset_class, hashlib.sha256(data).hexdigest())
 
+    def add_notes(self, notes, filename: str, asset_class: str, source_hash: str = ''):
+        """Classifies parsed notes and appends one record per note."""
         for note in notes:
             try:
                 # Extract net settlement value
@@ -42,29 +223,8 @@ class DataAggregator:
                     # Categorization Logic
                     if asset_class == 'Fundos e Acoes':
                         # Extract ticker part
-                        ticker_part = obs.split(' - ')[0].strip().upper()
-
-                        # List of Brazilian ETFs
-                        etf_list = {
-                            'BOVA11', 'BOVV11', 'BOVB11', 'BBOV11', 'BOVX11', 'SMAL11', 'SMALL11',
-                            'IVVB11', 'SPXI11', 'ACWI11', 'NASD11', 'EWBZ11', 'BLOK11', 'BEST11',
-                            'BBOI11', 'BMMT11', 'BREW11', 'BCIC11', 'IMAB11', 'IB5M11', 'IRFM11',
-                            'FIXA11', 'LFTB11', 'LFTS11', 'DEBB11', 'NTNS11', 'BNDX11', 'XIFX11',
-                            'AGRI11', 'ALUG11', 'DIVO11', 'DIVD11', 'NDIV11', '5GTK11', 'ELAS11',
-                            'USTK11', 'TECK11', 'SPYI11', 'XINA11', 'DOLA11', 'HASH11', 'BITH11',
-                            'ETHE11', 'QBTC11', 'QETH11', 'QSOL11', 'SOLH11', 'CRPT11', 'COIN11',
-                            'GOLD11', 'GLDX11', 'BSLV39', 'EURP11', 'ASIA11', 'AURO11', 'AUVP11',
-                            'ARGE11', 'BDAP11', 'BDOM11', 'BDEF11', 'B5MB11', 'B5P211'
-                        }
-
-                        if ticker_part in etf_list:
-                            category = 'ETFs'
-                        elif ticker_part.endswith('11'):
-                            category = 'FIIs'  # FIIs typically end in 11
-                        elif any(ticker_part.endswith(digit) for digit in ['3', '4', '5', '6']):
-                            category = 'Stocks'
-                        else:
-                            category = 'Others'
+                        ticker_part = obs.split(' - ')[0]
+                        category = self.registry.classify(ticker_part)
 
                     elif asset_class == 'Futuros':
                         # Separate Futures by ticker (e.g., WIN, WDO)
@@ -72,19 +232,27 @@ class DataAggregator:
                         current_asset_class = obs
 
                 # Calculate Buy/Sell Values
-                # Futures use daily adjustment (LiquidValue), other assets use gross value if available
+                # Futures use daily adjustment (LiquidValue), other assets the ticker's trade values
                 buy_value = 0.0
                 sell_value = 0.0
                 liq_float = float(liquid_value)
+                bought, sold, note_buy, note_sell = note_quantities(note)
 
                 # Futures operations are typically daily adjustments (LiquidValue only)
                 if not str(category).startswith('Futures') and not str(category).startswith('Futuros'):
-                    if liq_float < 0:
-                        buy_value = abs(liq_float)
+                    if note_buy or note_sell:
+                        buy_value, sell_value = float(note_buy), float(note_sell)
                     else:
-                        sell_value = abs(liq_float)
-
-                self.records.append({
+                        # No trade values to split by side: the settlement goes to its side, and without
+                        # quantities the tax ledger counts the note as unquantified instead of guessing a cost
+                        bought = sold = 0
+                        if liq_float < 0:
+                            buy_value = abs(liq_float)
+                        else:
+                            sell_value = abs(liq_float)
+                else:
+                    bought = sold = 0
+                self.append_record({
                     'Date': ref_date,
                     'Category': category,
                     'AssetClass': current_asset_class,  # This is Ticker + Op for Stocks
@@ -92,69 +260,113 @@ class DataAggregator:
                     'LiquidValue': liq_float,
                     'BuyValue': buy_value,
                     'SellValue': sell_value,
-                    'Filename': filename
+                    'BuyQuantity': float(bought),
+                    'SellQuantity': float(sold),
+                    'Filename': filename,
+                    'SourceHash': source_hash
                 })
 
             except AttributeError as e:
                 print(f"Error accessing data in {filename}: {e}")
 
+    def append_record(self, record: dict):
+        """Appends one record (a dict with every key in COLUMNS) to the columnar store."""
+        for column in COLUMNS:
+            value = record[column]
+            if column in FLOAT_COLUMNS:
+                self._columns[column].append(value)
+            else:
+                self._columns[column].append(self._interned.setdefault(value, value))
+
+    @property
+    def records(self) -> list:
+        """Raw (not aggregated) records as dicts, in insertion order."""
+        return [dict(zip(COLUMNS, values)) for values in zip(*(self._columns[c] for c in COLUMNS))]
+
+    def source_hashes(self) -> dict:
+        """SourceHash of each get_records() record -> sorted hashes of the files it was built from."""
+        groups = defaultdict(set)
+        for date_, category, ticker, source_hash in zip(*(self._columns[c] for c in
+                                                          ('Date', 'Category', 'Ticker', 'SourceHash'))):
+            # Futures records pass through with their file's hash, the others are grouped by (Date, Ticker)
+            groups[('futures', source_hash) if _is_futures(category) else (date_, ticker)].add(source_hash)
+        return {_digest(hashes): sorted(hashes) for hashes in groups.values()}
+
     def get_records(self):
-        # Validation Step 1: Sorting
-        sorted_records = sorted(self.records, key=lambda x: x['Date'])
+        """
+        Sorted records, with Stocks/FIIs/ETFs aggregated by (Date, Ticker) and
+        futures passed through. Vectorized over the columnar store; the output
+        (values, float sums, ordering) matches the original row-by-row version:
+        records stably sorted by date, futures first within a date, then the
+        aggregates in order of first appearance.
+        """
+        if not self._columns['Date']:
+            return []
+
+        # Built once: float columns are viewed in place, the others become object arrays
+        columns = {
+            c: np.frombuffer(self._columns[c], dtype=np.float64) if c in FLOAT_COLUMNS
+            else np.array(self._columns[c], dtype=object)
+            for c in COLUMNS
+        }
+
+        # Validation Step 1: Sorting (stable, by date)
+        date_codes, _ = pd.factorize(columns['Date'], sort=True)
+        order = np.argsort(date_codes, kind='stable')
+
+        category_codes, categories = pd.factorize(columns['Category'])
+        is_futures = np.array([_is_futures(c) for c in categories], dtype=bool)[category_codes]
+
+        # Futures: Do not aggregate, pass through directly.
+        futures_rows = order[is_futures[order]]
+        final_records = [
+            dict(zip(COLUMNS, values)) for values in zip(*(columns[c][futures_rows].tolist() for c in COLUMNS))
+        ]
+        final_dates = [date_codes[futures_rows]]
 
         # Validation Step 2: Aggregation for "Funds and Stocks"
-        # Aggregates operations for the same Ticker on the same Day.
-
-        aggregated_map = defaultdict(lambda: {
-            'Date': None,
-            'Category': '',
-            'AssetClass': '',
-            'LiquidValue': 0.0,
-            'BuyValue': 0.0,
-            'SellValue': 0.0,
-            'Filename': set()
-        })
-
-        final_records = []
-
-        for record in sorted_records:
-            if str(record['Category']).startswith('Futuros') or str(record['Category']).startswith('Futures'):
-                # Futures: Do not aggregate, pass through directly.
-                final_records.append(record)
-            else:
-                # Stocks/FIIs/ETFs: Aggregate by Date + Ticker
-                key = (record['Date'], record['Ticker'])
-
-                agg = aggregated_map[key]
-                agg['Date'] = record['Date']
-                agg['Ticker'] = record['Ticker']
-                agg['Category'] = record['Category']
-                # AssetClass might vary (e.g. PETR4 - C vs PETR4 - V). We'll reconstruct it.
-                agg['LiquidValue'] += record['LiquidValue']
-                agg['BuyValue'] += record['BuyValue']
-                agg['SellValue'] += record['SellValue']
-                agg['Filename'].add(record['Filename'])
-
-        # Convert aggregated map back to list
-        for key, agg in aggregated_map.items():
-            # Reconstruct AssetClass based on net result
-
-            ticker = agg['Ticker']
-            net_val = agg['LiquidValue']
-            op = "C" if net_val < 0 else "V"
-            # If net is 0, it might be a daytrade resulting in 0 net change (unlikely for value), but we handle it.
-
-            final_asset_class = f"{ticker} - {op}"
-
-            final_records.append({
-                'Date': agg['Date'],
-                'Category': agg['Category'],
-                'AssetClass': final_asset_class,
-                'LiquidValue': agg['LiquidValue'],
-                'BuyValue': agg['BuyValue'],
-                'SellValue': agg['SellValue'],
-                'Filename': ", ".join(sorted(list(agg['Filename'])))
-            })
+        # Aggregates operations for the same Ticker on the same Day, in order of first appearance.
+        rows = order[~is_futures[order]]
+        if len(rows):
+            ticker_codes, tickers = pd.factorize(columns['Ticker'][rows])
+            group_ids, _ = pd.factorize(date_codes[rows].astype(np.int64) * len(tickers) + ticker_codes)
+            n_groups = int(group_ids.max()) + 1
+
+            # np.add.at adds row by row in order, so the float sums are bit-identical to +=
+            sums = {}
+            for column in FLOAT_COLUMNS:
+                sums[column] = np.zeros(n_groups)
+                np.add.at(sums[column], group_ids, columns[column][rows])
+                sums[column] = sums[column].tolist()
+
+            first = rows[np.unique(group_ids, return_index=True)[1]]
+            # Category of the last record of each group
+            last = rows[len(rows) - 1 - np.unique(group_ids[::-1], return_index=True)[1]]
+
+            filenames = _sorted_uniques_per_group(group_ids, columns['Filename'][rows], n_groups)
+            source_hashes = _sorted_uniques_per_group(group_ids, columns['SourceHash'][rows], n_groups)
+
+            for date_, category, ticker, liquid, buy, sell, bought, sold, names, hashes in zip(
+                    columns['Date'][first].tolist(), columns['Category'][last].tolist(),
+                    columns['Ticker'][first].tolist(), sums['LiquidValue'], sums['BuyValue'], sums['SellValue'],
+                    sums['BuyQuantity'], sums['SellQuantity'], filenames, source_hashes):
+                # Reconstruct AssetClass based on net result
+                op = "C" if liquid < 0 else "V"
+
+                final_records.append({
+                    'Date': date_,
+                    'Category': category,
+                    'AssetClass': f"{ticker} - {op}",
+                    'LiquidValue': liquid,
+                    'BuyValue': buy,
+                    'SellValue': sell,
+                    'BuyQuantity': bought,
+                    'SellQuantity': sold,
+                    'Filename': ", ".join(names),
+                    'SourceHash': _digest(hashes)
+                })
+            final_dates.append(date_codes[first])
 
         # Re-sort final
-        return sorted(final_records, key=lambda x: x['Date'])
+        final_order = np.argsort(np.concatenate(final_dates), kind='stable')
+        return [final_records[i] for i in final_order]
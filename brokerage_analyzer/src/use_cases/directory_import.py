@@ -0,0 +1,125 @@
+import hashlib
+import os
+import time
+
+from django.core.files.base import ContentFile
+
+from brokerage_analyzer.src.infrastructure.import_checkpoint import STATUS_DONE, STATUS_FAILED, ImportCheckpoint
+from brokerage_analyzer.src.use_cases import tax_ledger
+from brokerage_analyzer.src.use_cases.ingestion import new_aggregator, save_batch
+
+CHECKPOINT_FILE = '.brokerage_import_checkpoint.jsonl'
+
+
+def iter_pdf_files(directory: str):
+    """Relative paths of the PDFs under directory, recursively, in a stable (sorted) order."""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith('.pdf'):
+                yield os.path.relpath(os.path.join(root, name), directory)
+
+
+class DirectoryImport:
+    """
+    Imports every brokerage note PDF under a directory in batches: each batch
+    is parsed (in a process pool with workers > 1), saved to the database and
+    then recorded in the checkpoint, so memory stays bounded by the batch size
+    and an interrupted run resumes after its last committed batch.
+
+    Notes are aggregated by (date, ticker) within a batch, as within an upload.
+    """
+
+    def __init__(self, directory: str, asset_type: str, batch_size: int = 500, workers: int = 1,
+                 checkpoint_path: str = None, retry_failed: bool = False):
+        self.directory = directory
+        self.asset_type = asset_type
+        self.batch_size = max(1, batch_size)
+        self.workers = workers
+        self.checkpoint = ImportCheckpoint(checkpoint_path or os.path.join(directory, CHECKPOINT_FILE))
+        self.retry_failed = retry_failed
+        self.pending = {}  # SHA-256 -> source of the batch being collected
+
+    def run(self, progress=None) -> dict:
+        """
+        progress: optional callable(totals) invoked after every committed batch.
+        Returns the totals: files, skipped, failed, imported, updated, batches, seconds.
+        """
+        totals = dict.fromkeys(('files', 'skipped', 'failed', 'imported', 'updated', 'batches'), 0)
+        start = time.perf_counter()
+        batch = []
+        for relative in iter_pdf_files(self.directory):
+            source = self._read(relative, totals)
+            if source is not None:
+                batch.append(source)
+            if len(batch) >= self.batch_size:
+                self._import_batch(batch, totals, progress)
+                batch = []
+        if batch:
+            self._import_batch(batch, totals, progress)
+        self.pending = {}
+
+        tax_ledger.refresh()
+        totals['seconds'] = round(time.perf_counter() - start, 3)
+        return totals
+
+    def _read(self, relative: str, totals: dict):
+        """
+        The file as a named ContentFile, or None when the checkpoint already
+        covers it or a file of the current batch has the same bytes.
+        """
+        path = os.path.join(self.directory, relative)
+        stat = os.stat(path)
+        if self.checkpoint.unchanged(relative, stat.st_size, stat.st_mtime_ns, self.retry_failed):
+            totals['skipped'] += 1
+            return None
+
+        with open(path, 'rb') as f:
+            data = f.read()
+        content_hash = hashlib.sha256(data).hexdigest()
+        if self.checkpoint.seen(content_hash, self.retry_failed):
+            # Same bytes under another name: only the path is new
+            self.checkpoint.record([{'path': relative, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                     'hash': content_hash, 'status': self.checkpoint.hashes[content_hash]}])
+            totals['skipped'] += 1
+            return None
+
+        entry = {'path': relative, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': content_hash,
+                 'status': STATUS_DONE}
+        if content_hash in self.pending:
+            # A copy within the batch: recorded along with the first file, with its status
+            self.pending[content_hash].copies.append(entry)
+            totals['skipped'] += 1
+            return None
+
+        source = ContentFile(data, name=os.path.basename(relative))
+        source.checkpoint_entry = entry
+        source.copies = []
+        self.pending[content_hash] = source
+        return source
+
+    def _import_batch(self, batch: list, totals: dict, progress=None):
+        aggregator = new_aggregator(self.workers)
+        if self.retry_failed:
+            aggregator.quarantine.release(source.checkpoint_entry['hash'] for source in batch)
+        errors = aggregator.process_files(batch, self.asset_type)
+        # Identical files are parsed once, errors name the first of them
+        failed = {source.checkpoint_entry['hash'] for source, _ in errors}
+        for source in batch:
+            if source.checkpoint_entry['hash'] in failed:
+                source.checkpoint_entry['status'] = STATUS_FAILED
+            for copy in source.copies:
+                copy['status'] = source.checkpoint_entry['status']
+
+        imported, updated = save_batch(aggregator)
+        # Only once the batch is committed
+        self.checkpoint.record(entry for source in batch for entry in [source.checkpoint_entry, *source.copies])
+        self.pending = {}
+
+        totals['files'] += len(batch)
+        totals['failed'] += sum(source.checkpoint_entry['status'] == STATUS_FAILED for source in batch)
+        totals['imported'] += imported
+        totals['updated'] += updated
+        totals['batches'] += 1
+        if progress:
+            progress(totals)
@@ -0,0 +1,249 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from brokerage_analyzer.models import IngestionFile, IngestionJob, NoteText, Transaction
+from brokerage_analyzer.src.infrastructure.note_text_store import DatabaseNoteTextStore
+from brokerage_analyzer.src.infrastructure.parse_cache import DatabaseParseCache
+from brokerage_analyzer.src.infrastructure.parse_sandbox import ParseSandbox
+from brokerage_analyzer.src.infrastructure.quarantine import DatabaseQuarantine
+from brokerage_analyzer.src.infrastructure import export_cache, rollup
+from brokerage_analyzer.src.infrastructure.pdf_parser import deserialize_notes, read_pdf_bytes, source_name
+from brokerage_analyzer.src.use_cases import tax_ledger
+from brokerage_analyzer.src.use_cases.data_aggregator import DataAggregator
+from brokerage_analyzer.src.use_cases.provenance import components
+
+logger = logging.getLogger(__name__)
+
+NATURAL_KEY = ['date', 'ticker', 'category', 'source_hash']
+UPSERT_FIELDS = ['asset_class', 'liquid_value', 'buy_value', 'sell_value', 'buy_quantity', 'sell_quantity', 'filename']
+
+
+def natural_key(t: Transaction) -> tuple:
+    return (t.date, t.ticker, t.category, t.source_hash)
+
+
+def new_aggregator(max_workers: int = None) -> DataAggregator:
+    """DataAggregator for imports: cached, text-storing, sandboxed parses with a quarantine."""
+    return DataAggregator(
+        max_workers=max_workers or settings.BROKERAGE_PARSE_WORKERS, cache=DatabaseParseCache(),
+        text_store=DatabaseNoteTextStore(), quarantine=DatabaseQuarantine(),
+        sandbox=ParseSandbox(timeout=settings.BROKERAGE_PARSE_TIMEOUT, memory_mb=settings.BROKERAGE_PARSE_MEMORY_MB),
+    )
+
+
+def create_job(uploaded_files, asset_type: str) -> IngestionJob:
+    """Stores the uploaded PDFs and queues them for the ingestion worker."""
+    with transaction.atomic():
+        job = IngestionJob.objects.create(asset_type=asset_type, total_files=len(uploaded_files))
+        IngestionFile.objects.bulk_create([
+            IngestionFile(job=job, name=source_name(f), content=read_pdf_bytes(f)) for f in uploaded_files
+        ])
+    return job
+
+
+def claim_next_job():
+    """
+    Marks the oldest pending job as running and returns it (None when the queue is empty).
+    A running job whose worker stopped reporting progress for BROKERAGE_JOB_STALE_SECONDS
+    (the process died) is claimed again, from its first file.
+    The conditional UPDATE makes the claim safe with several workers.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.BROKERAGE_JOB_STALE_SECONDS)
+    claimable = IngestionJob.objects.filter(
+        Q(status=IngestionJob.STATUS_PENDING)
+        | Q(status=IngestionJob.STATUS_RUNNING, heartbeat_at__lt=stale)
+        # Claimed before heartbeats were recorded
+        | Q(status=IngestionJob.STATUS_RUNNING, heartbeat_at__isnull=True, started_at__lt=stale)
+    ).order_by('created_at', 'pk')
+    for job_id, status, heartbeat_at in claimable.values_list('pk', 'status', 'heartbeat_at'):
+        claimed = IngestionJob.objects.filter(pk=job_id, status=status, heartbeat_at=heartbeat_at).update(
+            status=IngestionJob.STATUS_RUNNING, started_at=now, heartbeat_at=now, processed_files=0
+        )
+        if claimed:
+            if status == IngestionJob.STATUS_RUNNING:
+                logger.warning(f"Reclaiming stale ingestion job {job_id} (last heartbeat {heartbeat_at})")
+                IngestionFile.objects.filter(job_id=job_id).update(status='pending', error='')
+            return IngestionJob.objects.get(pk=job_id)
+    return None
+
+
+def save_records(records, sources: dict = None) -> tuple:
+    """
+    Upserts aggregated records on the Transaction natural key (date, ticker,
+    category, source_hash): a record built from exactly the same files as a
+    stored row updates it instead of appending a duplicate. Rows built from
+    an overlapping set of files are not matched; imports go through
+    save_batch, which replaces them first. Returns (imported, updated).
+    sources: DataAggregator.source_hashes(), to link the rows to their stored note texts.
+    """
+    objs = {}
+    for r in records:
+        # Map dictionary to Model
+        t = Transaction(
+            date=r['Date'],
+            category=r['Category'],
+            asset_class=r['AssetClass'],
+            ticker=r.get('Ticker', r['AssetClass'].split(' - ')[0]),
+            liquid_value=r['LiquidValue'],
+            buy_value=r['BuyValue'],
+            sell_value=r['SellValue'],
+            buy_quantity=round(r.get('BuyQuantity', 0)),
+            sell_quantity=round(r.get('SellQuantity', 0)),
+            filename=r['Filename'],
+            source_hash=r['SourceHash']
+        )
+        key = natural_key(t)
+        if key in objs:
+            # Several notes of one file for the same asset and day (e.g. futures): one row per key
+            first = objs[key]
+            first.liquid_value += t.liquid_value
+            first.buy_value += t.buy_value
+            first.sell_value += t.sell_value
+            first.buy_quantity += t.buy_quantity
+            first.sell_quantity += t.sell_quantity
+        else:
+            objs[key] = t
+
+    # Rows the upsert will overwrite, so their old amounts can leave the rollup, in one query
+    hashes = {key[3] for key in objs}
+    existing = [t for t in Transaction.objects.filter(source_hash__in=hashes) if natural_key(t) in objs]
+
+    # The monthly rollup is updated in the same DB transaction as the upsert
+    with transaction.atomic():
+        Transaction.objects.bulk_create(
+            list(objs.values()), update_conflicts=True, unique_fields=NATURAL_KEY, update_fields=UPSERT_FIELDS
+        )
+        rollup.apply(existing, sign=-1)
+        rollup.apply(objs.values())
+        if objs:
+            # The tax ledger is recomputed from the earliest month the import touched
+            tax_ledger.mark_dirty(min(Transaction._meta.get_field('date').to_python(key[0]) for key in objs))
+            export_cache.bump_version()
+        if sources:
+            link_note_texts(sources)
+    return len(objs) - len(existing), len(existing)
+
+
+def save_batch(aggregator: DataAggregator) -> tuple:
+    """
+    Saves the records of an import batch, replacing the stored transactions
+    already built from any of its files (see provenance.components): they are
+    deleted and the other files they were built from are merged into the batch
+    again from the parse cache, so importing A and then A+B leaves one row per
+    (date, ticker) and counts A once. Returns (imported, updated): rows new to
+    the table and rows rebuilt in place of stored ones.
+    """
+    files = {h for hashes in aggregator.source_hashes().values() for h in hashes}
+    texts, transaction_ids = set(), set()
+    for component_texts, component_transactions in components(files):
+        texts |= component_texts
+        transaction_ids |= component_transactions
+
+    partners = texts - files
+    if partners:
+        notes = DatabaseParseCache().get_many(partners)
+        for content_hash, filename, asset_type in (NoteText.objects.filter(pk__in=partners)
+                                                   .order_by('filename', 'pk')
+                                                   .values_list('content_hash', 'filename', 'asset_type')):
+            if content_hash in notes:
+                aggregator.add_notes(deserialize_notes(notes[content_hash]), filename, asset_type, content_hash)
+
+    with transaction.atomic():
+        # Deleted through the signals, which keep the rollup, the tax ledger and the data version current
+        replaced = Transaction.objects.filter(pk__in=transaction_ids).delete()[1].get(Transaction._meta.label, 0)
+        imported, updated = save_records(aggregator.get_records(), sources=aggregator.source_hashes())
+    saved = imported + updated
+    return saved - min(saved, replaced + updated), min(saved, replaced + updated)
+
+
+def link_note_texts(sources: dict):
+    """Links transactions to the stored texts of their files. sources: source_hash -> file hashes."""
+    file_hashes = {h for hashes in sources.values() for h in hashes}
+    stored = set(NoteText.objects.filter(pk__in=file_hashes).values_list('pk', flat=True))
+    Link = Transaction.note_texts.through
+    Link.objects.bulk_create([
+        Link(transaction_id=pk, notetext_id=h)
+        for pk, source_hash in Transaction.objects.filter(source_hash__in=list(sources)).values_list('pk', 'source_hash')
+        for h in sources.get(source_hash, ()) if h in stored
+    ], ignore_conflicts=True, batch_size=1000)
+
+
+class JobReclaimed(Exception):
+    """The job was claimed again (stale heartbeat) while this worker still ran it."""
+
+
+def run_job(job: IngestionJob):
+    """
+    Parses every file of a claimed job, reporting per-file progress on the
+    IngestionFile rows and the job counters, then saves the aggregated records.
+    """
+    sources = []
+    for f in job.files.all():
+        source = ContentFile(bytes(f.content), name=f.name)
+        source.file_id = f.pk
+        sources.append(source)
+
+    def progress(source, error):
+        IngestionFile.objects.filter(pk=source.file_id).update(
+            status='failed' if error else 'done',
+            error=str(error) if error else ''
+        )
+        IngestionJob.objects.filter(pk=job.pk).update(processed_files=F('processed_files') + 1, heartbeat_at=timezone.now())
+
+    try:
+        aggregator = new_aggregator()
+        aggregator.process_files(sources, job.asset_type, progress=progress)
+
+        with transaction.atomic():
+            # The UPDATE locks the job row until commit, so a stale-job claim waits for the save and then
+            # finds the job done. A job claimed again while this worker was parsing is left to its new worker.
+            owned = IngestionJob.objects.filter(
+                pk=job.pk, status=IngestionJob.STATUS_RUNNING, started_at=job.started_at
+            ).update(heartbeat_at=timezone.now())
+            if not owned:
+                raise JobReclaimed(f"Ingestion job {job.pk} was claimed by another worker")
+            imported, updated = save_batch(aggregator)
+            IngestionJob.objects.filter(pk=job.pk).update(
+                status=IngestionJob.STATUS_DONE, imported_count=imported, skipped_count=updated,
+                finished_at=timezone.now()
+            )
+        tax_ledger.refresh()
+    except JobReclaimed as e:
+        logger.warning(str(e))
+        job.refresh_from_db()
+        return job
+    except Exception as e:
+        logger.exception(f"Ingestion job {job.pk} failed")
+        IngestionJob.objects.filter(pk=job.pk).update(
+            status=IngestionJob.STATUS_FAILED, error=str(e), finished_at=timezone.now()
+        )
+
+    # The PDFs are kept until the job is done or failed, so a job whose worker died can be claimed again
+    job.files.update(content=b'')
+
+    job.refresh_from_db()
+    return job
+
+
+def job_status(job: IngestionJob) -> dict:
+    """JSON-serializable progress of a job, as returned by the status endpoint."""
+    return {
+        'id': job.pk,
+        'status': job.status,
+        'asset_type': job.asset_type,
+        'total_files': job.total_files,
+        'processed_files': job.processed_files,
+        'imported': job.imported_count,
+        'updated': job.skipped_count,
+        'error': job.error,
+        'finished': job.is_finished,
+        'files': [
+            {'name': f.name, 'status': f.status, 'error': f.error}
+            for f in job.files.only('pk', 'name', 'status', 'error')
+        ],
+    }
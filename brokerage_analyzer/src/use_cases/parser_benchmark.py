@@ -0,0 +1,249 @@
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timezone
+from multiprocessing import get_all_start_methods, get_context, set_start_method
+
+import numpy as np
+
+from brokerage_analyzer.src.infrastructure.note_generator import GROUND_TRUTH_FILE
+from brokerage_analyzer.src.infrastructure.pdf_parser import STRATEGY_FAST, STRATEGY_LAYOUT, PdfParser
+from brokerage_analyzer.src.use_cases.strategy_comparison import FIELDS, note_fields
+
+# Benchmarked parser configurations: 'correpy' is the production path (CorrePy, then
+# the fast/layout fallback); the others run one fallback strategy on its own.
+PARSERS = {
+    'correpy': {'correpy': True, 'strategy': STRATEGY_FAST},
+    'fast': {'correpy': False, 'strategy': STRATEGY_FAST},
+    'layout': {'correpy': False, 'strategy': STRATEGY_LAYOUT},
+}
+
+
+def load_ground_truth(directory: str) -> list:
+    with open(os.path.join(directory, GROUND_TRUTH_FILE)) as f:
+        truth = json.load(f)
+    for entry in truth:
+        entry['date'] = date.fromisoformat(entry['date'])
+    return truth
+
+
+def _status_kb(field: str, pid='self'):
+    """A memory field of /proc/<pid>/status, in KiB (None without procfs or once the process is gone)."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith(f'{field}:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _reset_peak_rss() -> str:
+    """
+    Resets the RSS high-water mark of this process and returns how peaks will
+    be read. ru_maxrss cannot be reset and survives the fork+exec of a spawned
+    process, so a child would report its parent's peak; on Linux VmHWM can be
+    reset through clear_refs instead. Elsewhere peaks fall back to ru_maxrss.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return 'VmHWM'
+    except OSError:
+        return 'ru_maxrss'
+
+
+def _mb(kb) -> float:
+    return round(kb / 1024, 1)
+
+
+def _rss_mb() -> float:
+    """Current resident set size (0 without procfs)."""
+    return _mb(_status_kb('VmRSS') or 0)
+
+
+def _peak_rss_mb() -> float:
+    """Peak resident set size since _reset_peak_rss (ru_maxrss is in KiB on Linux, bytes on macOS)."""
+    peak = _status_kb('VmHWM')
+    if peak is not None:
+        return _mb(peak)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _children() -> list:
+    pids = []
+    for task in os.listdir('/proc/self/task') if os.path.isdir('/proc/self/task') else ():
+        try:
+            with open(f'/proc/self/task/{task}/children') as f:
+                pids.extend(f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+class ChildRssSampler(threading.Thread):
+    """
+    Samples the summed RSS of this process's children (the pool workers) until
+    stopped; peak_mb is the highest sum seen. The children's own ru_maxrss
+    would again start from the high-water mark of the process they came from.
+    """
+
+    def __init__(self, interval: float = 0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            total = sum(_status_kb('VmRSS', pid) or 0 for pid in _children())
+            self.peak_kb = max(self.peak_kb, total)
+
+    def stop(self) -> float:
+        self._stop_event.set()
+        self.join()
+        return _mb(self.peak_kb)
+
+
+def _latency_stats(latencies) -> dict:
+    ms = np.array(latencies) * 1000
+    return {
+        'p50_ms': round(float(np.percentile(ms, 50)), 2),
+        'p95_ms': round(float(np.percentile(ms, 95)), 2),
+        'max_ms': round(float(ms.max()), 2),
+    }
+
+
+def _run_parser(name: str, directory: str, truth: list) -> dict:
+    """
+    Child-process entry point: parses every note of the corpus with one parser
+    configuration, so the reported peak RSS belongs to that configuration only.
+    """
+    logging.disable(logging.INFO)
+    rss_source = _reset_peak_rss()
+    baseline_rss = _rss_mb()
+    parser = PdfParser(**PARSERS[name])
+
+    latencies = []
+    matches = dict.fromkeys(FIELDS, 0)
+    exact = 0
+    start = time.perf_counter()
+    for entry in truth:
+        file_start = time.perf_counter()
+        fields = note_fields(parser.parse_file(os.path.join(directory, entry['filename'])))
+        latencies.append(time.perf_counter() - file_start)
+
+        agree = [field for field in FIELDS if fields[field] == entry[field]]
+        for field in agree:
+            matches[field] += 1
+        exact += len(agree) == len(FIELDS)
+    seconds = time.perf_counter() - start
+    peak_rss = _peak_rss_mb()
+
+    return {
+        'files': len(truth),
+        'seconds': round(seconds, 3),
+        'notes_per_second': round(len(truth) / seconds, 2),
+        **_latency_stats(latencies),
+        'baseline_rss_mb': baseline_rss,
+        'peak_rss_mb': peak_rss,
+        'rss_growth_mb': round(peak_rss - baseline_rss, 1),
+        'rss_source': rss_source,
+        'accuracy': {field: round(count / len(truth), 4) for field, count in matches.items()},
+        'exact': round(exact / len(truth), 4),
+    }
+
+
+def _run_aggregator(directory: str, filenames: list, workers: int) -> dict:
+    """Child-process entry point: the whole DataAggregator pipeline (parse, classify, get_records)."""
+    from brokerage_analyzer.src.use_cases.data_aggregator import DataAggregator
+
+    logging.disable(logging.INFO)
+    if 'fork' in get_all_start_methods():
+        # This process was spawned; its pool workers should start the way they do in the app
+        set_start_method('fork', force=True)
+    rss_source = _reset_peak_rss()
+    baseline_rss = _rss_mb()
+    aggregator = DataAggregator(max_workers=workers)
+    sampler = ChildRssSampler()
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        errors = aggregator.process_files([os.path.join(directory, name) for name in filenames], 'Fundos e Acoes')
+        records = aggregator.get_records()
+    finally:
+        peak_worker_rss = sampler.stop()
+    seconds = time.perf_counter() - start
+    peak_rss = _peak_rss_mb()
+
+    return {
+        'files': len(filenames),
+        'workers': workers,
+        'errors': len(errors),
+        'records': len(records),
+        'seconds': round(seconds, 3),
+        'notes_per_second': round(len(filenames) / seconds, 2),
+        'baseline_rss_mb': baseline_rss,
+        'peak_rss_mb': peak_rss,
+        'rss_growth_mb': round(peak_rss - baseline_rss, 1),
+        'peak_worker_rss_mb': peak_worker_rss,  # Summed over the pool workers alive at once
+        'rss_source': rss_source,
+    }
+
+
+def run_benchmark(directory: str, parsers=tuple(PARSERS), workers: int = 1) -> dict:
+    """
+    Benchmarks each parser configuration and the DataAggregator pipeline over a
+    generated corpus (see NoteGenerator) and scores the parsed fields against
+    its ground truth. Every run happens in a fresh spawned process.
+    """
+    truth = load_ground_truth(directory)
+    context = get_context('spawn')
+
+    results = {}
+    for name in parsers:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results[name] = pool.submit(_run_parser, name, directory, truth).result()
+
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        aggregator = pool.submit(_run_aggregator, directory, [e['filename'] for e in truth], workers).result()
+
+    return {
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'corpus': {
+            'directory': os.path.abspath(directory),
+            'notes': len(truth),
+            'futures': sum(e['kind'] == 'futures' for e in truth),
+            'pages': sum(e['pages'] for e in truth),
+        },
+        'parsers': results,
+        'aggregator': aggregator,
+    }
+
+
+def compare_results(current: dict, baseline: dict) -> list:
+    """(metric, baseline, current, relative change) for the throughput and accuracy figures of two runs."""
+    rows = []
+    sections = [(f"parsers.{name}", current['parsers'][name], baseline.get('parsers', {}).get(name))
+                for name in current['parsers']]
+    sections.append(('aggregator', current['aggregator'], baseline.get('aggregator')))
+    for prefix, now, before in sections:
+        if not before:
+            continue
+        for metric in ('notes_per_second', 'p95_ms', 'rss_growth_mb', 'exact'):
+            if metric in now and before.get(metric):
+                rows.append((f"{prefix}.{metric}", before[metric], now[metric], now[metric] / before[metric] - 1))
+    return rows
@@ -0,0 +1,49 @@
+from collections import defaultdict
+
+from brokerage_analyzer.models import Transaction
+
+
+def components(content_hashes) -> list:
+    """
+    Groups the given files (SHA-256 of the PDFs) with every transaction built
+    from them and, in turn, every other file those transactions were built
+    from (notes of one upload aggregated by (date, ticker)). A transaction is
+    built from the files its note_texts link to and, for rows of a single file
+    imported before the links existed, from the file its source_hash names.
+    Returns a list of (content hashes, transaction ids).
+    """
+    Link = Transaction.note_texts.through
+    edges = set()  # (transaction id, content hash)
+    texts, transactions = set(), set()
+    frontier = set(content_hashes)
+    while frontier:
+        texts |= frontier
+        found = set(Link.objects.filter(notetext_id__in=frontier).values_list('transaction_id', 'notetext_id'))
+        found |= set(Transaction.objects.filter(source_hash__in=frontier).values_list('pk', 'source_hash'))
+        new = {transaction_id for transaction_id, _ in found} - transactions
+        transactions |= new
+        found |= set(Link.objects.filter(transaction_id__in=new).values_list('transaction_id', 'notetext_id'))
+        edges |= found
+        frontier = {content_hash for _, content_hash in found} - texts
+
+    by_text, by_transaction = defaultdict(set), defaultdict(set)
+    for transaction_id, content_hash in edges:
+        by_text[content_hash].add(transaction_id)
+        by_transaction[transaction_id].add(content_hash)
+
+    seen, result = set(), []
+    for start in sorted(texts):
+        if start in seen:
+            continue
+        component_texts, component_transactions, stack = set(), set(), [start]
+        while stack:
+            content_hash = stack.pop()
+            if content_hash in component_texts:
+                continue
+            component_texts.add(content_hash)
+            for transaction_id in by_text[content_hash] - component_transactions:
+                component_transactions.add(transaction_id)
+                stack.extend(by_transaction[transaction_id])
+        seen |= component_texts
+        result.append((component_texts, component_transactions))
+    return result
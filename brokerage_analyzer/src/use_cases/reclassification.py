@@ -0,0 +1,51 @@
+from django.db import transaction
+from django.db.models import Case, F, Min, Value, When
+
+from brokerage_analyzer.models import Transaction
+from brokerage_analyzer.src.infrastructure import export_cache, rollup
+from brokerage_analyzer.src.infrastructure.instrument_registry import FUTURES_PREFIX, get_registry
+from brokerage_analyzer.src.use_cases import tax_ledger
+
+
+def pending_changes(registry=None) -> dict:
+    """
+    ticker -> new category for stored transactions the registry now classifies
+    differently. Futures rows (and tickers that would become futures) are left
+    alone: their values use the daily-adjustment layout, not buy/sell.
+    """
+    registry = registry or get_registry()
+    changes = {}
+    rows = (Transaction.objects.exclude(category__startswith=FUTURES_PREFIX)
+            .order_by().values_list('ticker', 'category').distinct())
+    for ticker, category in rows:
+        new_category = registry.classify(ticker)
+        if new_category != category and not new_category.startswith(FUTURES_PREFIX):
+            changes[ticker] = new_category
+    return changes
+
+
+def reclassify_transactions(registry=None, changes: dict = None) -> int:
+    """
+    Applies the registry to stored transactions with a single UPDATE ... CASE
+    over the affected tickers, then rebuilds the monthly rollup, flags the tax
+    ledger from the earliest affected month (the UPDATE bypasses the signals
+    that keep both current) and invalidates cached reports.
+    Returns the rows updated.
+    changes: a pending_changes() result already at hand.
+    """
+    if changes is None:
+        changes = pending_changes(registry)
+    if not changes:
+        return 0
+
+    affected = Transaction.objects.filter(ticker__in=list(changes)).exclude(category__startswith=FUTURES_PREFIX)
+    with transaction.atomic():
+        earliest = affected.aggregate(earliest=Min('date'))['earliest']
+        updated = affected.update(
+            category=Case(*[When(ticker=t, then=Value(c)) for t, c in changes.items()], default=F('category'))
+        )
+        rollup.rebuild()
+        if earliest:
+            tax_ledger.mark_dirty(earliest)
+        export_cache.bump_version()
+    return updated
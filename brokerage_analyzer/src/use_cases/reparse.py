@@ -0,0 +1,74 @@
+from django.db import transaction
+
+from brokerage_analyzer.models import NoteText, Transaction
+from brokerage_analyzer.src.infrastructure.note_text_store import DatabaseNoteTextStore
+from brokerage_analyzer.src.infrastructure.parse_cache import DatabaseParseCache
+from brokerage_analyzer.src.infrastructure.pdf_parser import PdfParser, deserialize_notes, serialize_notes
+from brokerage_analyzer.src.use_cases import tax_ledger
+from brokerage_analyzer.src.use_cases.data_aggregator import DataAggregator
+from brokerage_analyzer.src.use_cases.ingestion import save_records
+from brokerage_analyzer.src.use_cases.provenance import components
+
+
+def reparse_texts(parser: PdfParser = None, chunk_size: int = 1000) -> tuple:
+    """
+    Runs the current heuristics (PdfParser.parse_text) over every complete
+    stored note text; no PDF is opened. Returns (texts read, {content hash:
+    serialized notes}, partial texts) with the texts whose notes differ from
+    the parse cache. Partial texts (incremental early exit) are only counted:
+    the pages they lack were never stored, so their notes are kept as imported.
+    """
+    parser = parser or PdfParser()
+    cache = DatabaseParseCache()
+    store = DatabaseNoteTextStore()
+
+    count = 0
+    changed = {}
+    batch = {}
+
+    def compare():
+        previous = cache.get_many(batch)
+        changed.update({h: notes for h, notes in batch.items() if previous.get(h) != notes})
+        batch.clear()
+
+    for content_hash, filename, text in store.iter_texts(chunk_size):
+        count += 1
+        batch[content_hash] = serialize_notes(parser.parse_text(text, filename))
+        if len(batch) >= chunk_size:
+            compare()
+    if batch:
+        compare()
+    return count, changed, store.partial_count()
+
+
+def apply_changes(changed: dict) -> tuple:
+    """
+    Stores re-parsed notes in the parse cache and rebuilds the transactions
+    they feed: each group of texts (see provenance.components) is aggregated again with
+    the current instrument registry and replaces its previous rows. Returns
+    (transactions deleted, transactions saved).
+    """
+    if not changed:
+        return 0, 0
+
+    cache = DatabaseParseCache()
+    deleted = saved = 0
+    with transaction.atomic():
+        cache.update_many(changed)
+        for texts, transaction_ids in components(changed):
+            notes = cache.get_many(texts)
+            aggregators = {}
+            for content_hash, filename, asset_type in (NoteText.objects.filter(pk__in=texts)
+                                                       .order_by('filename', 'pk')
+                                                       .values_list('content_hash', 'filename', 'asset_type')):
+                if content_hash in notes:
+                    aggregator = aggregators.setdefault(asset_type, DataAggregator())
+                    aggregator.add_notes(deserialize_notes(notes[content_hash]), filename, asset_type, content_hash)
+
+            # Deleted one by one through the signals, which keep the rollup and the tax ledger current
+            deleted += Transaction.objects.filter(pk__in=transaction_ids).delete()[1].get(Transaction._meta.label, 0)
+            for aggregator in aggregators.values():
+                imported, updated = save_records(aggregator.get_records(), sources=aggregator.source_hashes())
+                saved += imported + updated
+    tax_ledger.refresh()
+    return deleted, saved
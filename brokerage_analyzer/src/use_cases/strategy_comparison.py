@@ -0,0 +1,65 @@
+import os
+import time
+from brokerage_analyzer.src.infrastructure.pdf_parser import STRATEGIES, STRATEGY_LAYOUT, PdfParser
+
+FIELDS = ('date', 'value', 'sign', 'ticker')
+
+
+def note_fields(notes) -> dict:
+    """Fields compared between strategies, taken from the first parsed note (None when nothing was parsed)."""
+    if not notes:
+        return dict.fromkeys(FIELDS)
+
+    note = notes[0]
+    value = note.financial_summary.net_settlement_value
+    return {
+        'date': note.reference_date,
+        'value': round(abs(value), 2),
+        'sign': 'D' if value < 0 else 'C',
+        'ticker': note.observation.split(' - ')[0] or None,
+    }
+
+
+def compare_strategies(file_paths, strategies=STRATEGIES, reference: str = STRATEGY_LAYOUT) -> dict:
+    """
+    Runs every extraction strategy over the same PDFs, without falling back
+    from one strategy to another, and reports the time spent (extraction +
+    heuristics) and how often each field agrees with the reference strategy.
+    Each document is loaded once and its pages are shared by every strategy.
+    """
+    parser = PdfParser()
+    timings = dict.fromkeys(strategies, 0.0)
+    fields = {}
+
+    for file_path in file_paths:
+        filename = os.path.basename(file_path)
+        fields[filename] = {}
+        pages = parser.load_pages(file_path)
+        for strategy in strategies:
+            start = time.perf_counter()
+            text = parser.extract_note_text(pages, filename, strategy)
+            notes = parser.parse_text(text, filename)
+            timings[strategy] += time.perf_counter() - start
+            fields[filename][strategy] = note_fields(notes)
+
+    agreement = {}
+    disagreements = []
+    for strategy in strategies:
+        if strategy == reference:
+            continue
+        agreement[strategy] = dict.fromkeys(FIELDS, 0)
+        for filename, by_strategy in fields.items():
+            for field in FIELDS:
+                got, expected = by_strategy[strategy][field], by_strategy[reference][field]
+                if got == expected:
+                    agreement[strategy][field] += 1
+                else:
+                    disagreements.append((filename, strategy, field, got, expected))
+
+    return {
+        'files': len(file_paths),
+        'reference': reference,
+        'timings': timings,
+        'agreement': agreement,
+        'disagreements': disagreements,
+    }
@@ -0,0 +1,204 @@
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Min, OuterRef, Q, Subquery, Sum
+
+from brokerage_analyzer.models import TaxLedgerState, TaxMonthlyResult, TaxPosition, Transaction
+from brokerage_analyzer.src.infrastructure.instrument_registry import FUTURES_PREFIX
+
+CENT = Decimal('0.01')
+SWING, DAY_TRADE, FII = TaxMonthlyResult.POOL_SWING, TaxMonthlyResult.POOL_DAY_TRADE, TaxMonthlyResult.POOL_FII
+RATES = {SWING: Decimal('0.15'), DAY_TRADE: Decimal('0.20'), FII: Decimal('0.20')}
+# Swing-trade stock sales up to this amount in a month are exempt (Lei 11.033/2004, art. 3)
+STOCK_EXEMPTION_LIMIT = Decimal('20000.00')
+
+# Stored rows summed per (date, category, ticker), whatever files they were built from
+DAY_TOTALS = {'liquid': Sum('liquid_value'), 'buy': Sum('buy_value'), 'sell': Sum('sell_value'),
+              'bought': Sum('buy_quantity'), 'sold': Sum('sell_quantity')}
+RESULT_FIELDS = ('sales_total', 'stock_sales_total', 'result', 'exempt_result', 'loss_offset', 'taxable_result',
+                 'loss_balance', 'tax_due', 'unquantified_count')
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def mark_dirty(day: date):
+    """Flags the ledger as out of date from the month of day on (keeps an earlier flag)."""
+    month = month_start(day)
+    TaxLedgerState.objects.get_or_create(pk=1)
+    TaxLedgerState.objects.filter(pk=1).filter(Q(dirty_from__isnull=True) | Q(dirty_from__gt=month)).update(
+        dirty_from=month
+    )
+
+
+def refresh():
+    """Recomputes from the earliest dirty month, if any. Returns that month (None when already current)."""
+    state = TaxLedgerState.objects.filter(pk=1).first()
+    if state is None or state.dirty_from is None:
+        return None
+
+    dirty_from = state.dirty_from
+    with transaction.atomic():
+        recompute(dirty_from)
+        # A concurrent mark_dirty with an earlier month keeps its flag
+        TaxLedgerState.objects.filter(pk=1, dirty_from=dirty_from).update(dirty_from=None)
+    return dirty_from
+
+
+class _Month:
+    """Results of one month being replayed, per pool."""
+
+    def __init__(self):
+        self.sales = defaultdict(Decimal)
+        self.stock_sales = Decimal(0)
+        self.results = defaultdict(Decimal)
+        self.stock_result = Decimal(0)  # Swing-trade stock result, the part the exemption applies to
+        self.unquantified = defaultdict(int)
+        self.tickers = set()
+
+
+def recompute(from_month: date = None) -> int:
+    """
+    Replays transactions from from_month (default: the whole history) with the
+    average-cost method and rewrites the positions and monthly results from
+    that month on. Earlier months are untouched: positions and loss balances
+    are resumed from the last rows before from_month.
+
+    Stored transactions are summed per (date, ticker) first, as notes of one
+    day imported separately are separate rows. Their buy/sell values are the
+    ticker's trade values with its share of the fees (see
+    pdf_parser.side_values); rows without quantities are counted as
+    unquantified. Quantities bought and sold on the same day are day trades
+    (20%); the rest moves the position at its average cost. FIIs form their
+    own pool (20%); futures adjustments are day-trade results. Returns the number of monthly result rows written.
+    """
+    if from_month is None:
+        first = Transaction.objects.aggregate(first=Min('date'))['first']
+        if first is None:
+            with transaction.atomic():
+                TaxPosition.objects.all().delete()
+                TaxMonthlyResult.objects.all().delete()
+            return 0
+        from_month = first
+    from_month = month_start(from_month)
+
+    with transaction.atomic():
+        positions = {
+            p.ticker: [p.quantity, p.total_cost]
+            for p in TaxPosition.objects.filter(month__lt=from_month, month=Subquery(
+                TaxPosition.objects.filter(ticker=OuterRef('ticker'), month__lt=from_month)
+                .order_by('-month').values('month')[:1]
+            ))
+        }
+        balances = dict(
+            TaxMonthlyResult.objects.filter(month__lt=from_month, month=Subquery(
+                TaxMonthlyResult.objects.filter(pool=OuterRef('pool'), month__lt=from_month)
+                .order_by('-month').values('month')[:1]
+            )).values_list('pool', 'loss_balance')
+        )
+
+        TaxPosition.objects.filter(month__gte=from_month).delete()
+        TaxMonthlyResult.objects.filter(month__gte=from_month).delete()
+
+        new_positions, new_results = [], []
+        current, month = None, None
+        rows = (Transaction.objects.filter(date__gte=from_month).values('date', 'category', 'ticker')
+                .annotate(**DAY_TOTALS).order_by('date', 'ticker', 'category')
+                .values_list('date', 'category', 'ticker', *DAY_TOTALS).iterator(chunk_size=2000))
+        for row in rows:
+            if month != month_start(row[0]):
+                if current:
+                    _close_month(month, current, positions, balances, new_positions, new_results)
+                current, month = _Month(), month_start(row[0])
+            _apply(current, positions, *row[1:])
+        if current:
+            _close_month(month, current, positions, balances, new_positions, new_results)
+
+        TaxPosition.objects.bulk_create(new_positions, batch_size=1000)
+        TaxMonthlyResult.objects.bulk_create(new_results, batch_size=1000)
+    return len(new_results)
+
+
+def _apply(month: _Month, positions: dict, category, ticker, liquid, buy, sell, bought, sold):
+    if category.startswith(FUTURES_PREFIX):
+        month.results[DAY_TRADE] += liquid
+        return
+
+    swing_pool, day_trade_pool = (FII, FII) if category == 'FIIs' else (SWING, DAY_TRADE)
+    month.tickers.add(ticker)
+
+    if (buy and not bought) or (sell and not sold):
+        # The note's quantities are unknown: its sales still count, its result cannot be computed
+        month.unquantified[swing_pool] += 1
+        month.sales[swing_pool] += sell
+        if category == 'Stocks':
+            month.stock_sales += sell
+        return
+
+    if bought and sold:
+        day_traded = min(bought, sold)
+        buy_part = (buy * day_traded / bought).quantize(CENT)
+        sell_part = (sell * day_traded / sold).quantize(CENT)
+        month.results[day_trade_pool] += sell_part - buy_part
+        month.sales[day_trade_pool] += sell_part
+        bought, sold, buy, sell = bought - day_traded, sold - day_traded, buy - buy_part, sell - sell_part
+
+    position = positions.setdefault(ticker, [0, Decimal(0)])
+    if bought:
+        position[0] += bought
+        position[1] += buy
+    if sold:
+        month.sales[swing_pool] += sell
+        if category == 'Stocks':
+            month.stock_sales += sell
+
+        covered = min(sold, position[0])
+        if covered < sold:
+            # Selling more than the known position (short sale or missing history)
+            month.unquantified[swing_pool] += 1
+        if covered:
+            # Amounts are kept in cents, so resuming from stored positions matches a full replay
+            cost = (position[1] * covered / position[0]).quantize(CENT)
+            result = (sell * covered / sold).quantize(CENT) - cost
+            position[0] -= covered
+            position[1] -= cost
+            month.results[swing_pool] += result
+            if category == 'Stocks':
+                month.stock_result += result
+
+
+def _close_month(month_date, month: _Month, positions, balances, new_positions, new_results):
+    for ticker in sorted(month.tickers):
+        quantity, cost = positions.get(ticker, (0, Decimal(0)))
+        new_positions.append(TaxPosition(ticker=ticker, month=month_date, quantity=quantity, total_cost=cost))
+
+    for pool in sorted(set(month.results) | set(month.sales) | set(month.unquantified)):
+        result = month.results[pool]
+        exempt = Decimal(0)
+        if pool == SWING and month.stock_sales <= STOCK_EXEMPTION_LIMIT and month.stock_result > 0:
+            exempt = month.stock_result
+
+        balance = balances.get(pool, Decimal(0))
+        base = result - exempt
+        offset = min(balance, base) if base > 0 else Decimal(0)
+        taxable = max(base - offset, Decimal(0))
+        balance = balance - offset + max(-base, Decimal(0))
+        balances[pool] = balance
+
+        new_results.append(TaxMonthlyResult(
+            month=month_date, pool=pool,
+            sales_total=month.sales[pool],
+            stock_sales_total=month.stock_sales if pool == SWING else Decimal(0),
+            result=result, exempt_result=exempt, loss_offset=offset, taxable_result=taxable, loss_balance=balance,
+            tax_due=(taxable * RATES[pool]).quantize(CENT), unquantified_count=month.unquantified[pool],
+        ))
+
+
+def monthly_results():
+    """(year, month, pool label, *RESULT_FIELDS) rows for the "Apuração IR" sheet."""
+    labels = dict(TaxMonthlyResult.POOL_CHOICES)
+    for month, pool, *values in TaxMonthlyResult.objects.values_list('month', 'pool', *RESULT_FIELDS):
+        yield (month.year, month.month, labels[pool], *values)
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+from django.core.cache import cache
+
+from brokerage_analyzer.models import Transaction
+
+DEFAULT_POINTS = 500
+MAX_POINTS = 5000
+CACHE_SECONDS = 24 * 3600  # Keys carry the data version: a stale entry is never read, only evicted
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Indices of the threshold points kept by Largest-Triangle-Three-Buckets:
+    the first and last points, plus, in each of threshold - 2 equal buckets,
+    the point forming the largest triangle with the previously kept point and
+    the mean of the next bucket. Peaks and dips survive the downsampling.
+    All indices are returned when there are no more than threshold points.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # threshold - 2 non-empty buckets over the points between the first and the last
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = (end, edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        mean_x, mean_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+
+        area = np.abs((x[a] - mean_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (mean_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def _series(days: np.ndarray, values: np.ndarray, points: int) -> dict:
+    keep = lttb(days.astype(np.int64).astype(np.float64), values, points)
+    return {
+        'dates': np.datetime_as_string(days[keep], unit='D').tolist(),
+        'values': np.round(values[keep], 2).tolist(),
+    }
+
+
+def portfolio_timeline(points: int = DEFAULT_POINTS) -> dict:
+    """
+    Cumulative net cash flow (sum of liquid values: negative = net invested)
+    over the whole portfolio and per category, one value per day with
+    transactions, each series downsampled to at most points with LTTB.
+
+    The daily flows are summed into a (day, category) matrix in one np.add.at
+    over the Transaction columns and accumulated with a single cumsum.
+    A category series only holds the days on which that category moved.
+    """
+    rows = list(Transaction.objects.order_by().values_list('date', 'category', 'liquid_value'))
+    if not rows:
+        return {'days': 0, 'points': points, 'net_cash_flow': {'dates': [], 'values': []}, 'categories': {}}
+
+    dates, categories, amounts = zip(*rows)
+    days, day_index = np.unique(np.array(dates, dtype='datetime64[D]'), return_inverse=True)
+    category_codes, category_names = pd.factorize(np.array(categories, dtype=object), sort=True)
+
+    flows = np.zeros((len(days), len(category_names)))
+    np.add.at(flows, (day_index, category_codes), np.array(amounts, dtype=np.float64))
+    traded = np.zeros(flows.shape, dtype=bool)
+    traded[day_index, category_codes] = True
+    positions = np.cumsum(flows, axis=0)
+
+    return {
+        'days': len(days),
+        'points': points,
+        'net_cash_flow': _series(days, positions.sum(axis=1), points),
+        'categories': {
+            name: _series(days[traded[:, column]], positions[traded[:, column], column], points)
+            for column, name in enumerate(category_names)
+        },
+    }
+
+
+def cached_timeline(version_key: str, points: int = DEFAULT_POINTS) -> dict:
+    """portfolio_timeline(points), computed once per data version (see export_cache.current_version)."""
+    return cache.get_or_set(f"brokerage_timeline:{version_key}:{points}", lambda: portfolio_timeline(points),
+                            CACHE_SECONDS)
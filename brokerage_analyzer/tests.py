@@ -1,2 +1,1084 @@
+"""
+unit tests for brokerage note parsing and aggregation
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from unittest import skipUnless
+from unittest.mock import patch
+
+import numpy as np
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+from reportlab.pdfgen import canvas
+
+from .models import (
+    IngestionFile, IngestionJob, MonthlyRollup, NoteText, ParsedNoteCache, QuarantinedNote, TaxLedgerState,
+    TaxMonthlyResult, TaxPosition, Transaction,
+)
+from .src.infrastructure import rollup
+from .src.infrastructure.excel_exporter import ExcelExporter
+from .src.infrastructure.export_cache import ExportCache
+from .src.infrastructure.instrument_registry import get_registry
+from .src.infrastructure.note_generator import GROUND_TRUTH_FILE, NoteGenerator
+from .src.infrastructure.note_text_store import DatabaseNoteTextStore, compress_text, decompress_text
+from .src.infrastructure.parse_cache import DatabaseParseCache
+from .src.infrastructure.parse_sandbox import REASON_CRASH, REASON_ERROR, REASON_TIMEOUT, ParseFailure, ParseSandbox
+from .src.infrastructure.report_writers import pq
+from .src.infrastructure.pdf_parser import (
+    STRATEGY_FAST, STRATEGY_LAYOUT, BrokerageNote, MockFinancialSummary, MockNote, PdfParser, extract_text,
+    note_quantities, serialize_notes,
+)
+from .src.infrastructure.quarantine import DatabaseQuarantine
+from .src.use_cases.data_aggregator import DataAggregator
+from .src.use_cases.ingestion import claim_next_job, run_job, save_batch, save_records
+from .src.use_cases.parser_benchmark import load_ground_truth, run_benchmark
+from .src.use_cases import tax_ledger
+from .src.use_cases.reclassification import pending_changes, reclassify_transactions
+from .src.use_cases.strategy_comparison import FIELDS, compare_strategies, note_fields
+from .src.use_cases.timeline import lttb
+
+
+def build_note_pdf(path, *pages):
+    """writes a minimal brokerage note, one list of text lines per page"""
+    c = canvas.Canvas(path)
+    for lines in pages:
+        y = 800
+        for line in lines:
+            c.drawString(50, y, line)
+            y -= 20
+        c.showPage()
+    c.save()
+    return path
+
+
+def upload_notes(client, paths, extra=()):
+    """posts the given PDFs to the upload view"""
+    files = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            files.append(SimpleUploadedFile(os.path.basename(path), f.read(), 'application/pdf'))
+    return client.post(reverse('upload_notes'), {'asset_type': 'Fundos e Acoes', 'files': files + list(extra)})
+
+
+class BrokerageNotesTestMixin:
+    """creates a temporary folder with a few synthetic brokerage notes"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.files = [
+            build_note_pdf(os.path.join(self.tmp_dir, 'nota_15-03-2024.pdf'), [
+                "NOTA DE CORRETAGEM",
+                "1-BOVESPA C VISTA PETR4 ON 100 35,00 3.500,00 D",
+                "Líquido para 18/03/2024 3.501,23 D",
+            ]),
+            build_note_pdf(os.path.join(self.tmp_dir, 'nota_2_15-03-2024.pdf'), [
+                "NOTA DE CORRETAGEM",
+                "1-BOVESPA V VISTA PETR4 ON 50 36,00 1.800,00 C",
+                "Líquido para 18/03/2024 1.799,10 C",
+            ]),
+            build_note_pdf(os.path.join(self.tmp_dir, 'nota_02-04-2024.pdf'), [
+                "NOTA DE CORRETAGEM",
+                "1-BOVESPA C VISTA HGLG11 CI 10 160,00 1.600,00 D",
+                "Líquido para 04/04/2024 1.600,48 D",
+            ]),
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+class DataAggregatorParallelTest(BrokerageNotesTestMixin, TestCase):
+    """tests for the process-pool ingestion mode"""
+
+    def test_parallel_matches_serial(self):
+        """parallel parsing returns exactly the serial records, in the same order"""
+        serial = DataAggregator()
+        for file_path in self.files:
+            serial.process_single_pdf(file_path, 'Fundos e Acoes')
+
+        parallel = DataAggregator(max_workers=3)
+        errors = parallel.process_files(self.files, 'Fundos e Acoes')
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(parallel.records), 3)
+        self.assertEqual(parallel.records, serial.records)
+        self.assertEqual(parallel.get_records(), serial.get_records())
+
+    def test_identical_files_are_merged_once(self):
+        """the same note uploaded twice in one batch counts once"""
+        with open(self.files[0], 'rb') as f:
+            data = f.read()
+        uploads = [SimpleUploadedFile(name, data, 'application/pdf') for name in ('a.pdf', 'copia_a.pdf')]
+        progress = []
+
+        aggregator = DataAggregator()
+        aggregator.process_files(uploads, 'Fundos e Acoes', progress=lambda source, error: progress.append(source.name))
+
+        self.assertEqual(progress, ['a.pdf', 'copia_a.pdf'])
+        self.assertEqual([(r['Filename'], r['LiquidValue']) for r in aggregator.get_records()], [('a.pdf', -3501.23)])
+
+    def test_missing_file_reported_as_error(self):
+        """a missing file is reported without discarding the others"""
+        missing = os.path.join(self.tmp_dir, 'missing.pdf')
+        aggregator = DataAggregator(max_workers=2)
+        errors = aggregator.process_files(self.files[:1] + [missing], 'Fundos e Acoes')
+
+        self.assertEqual(len(aggregator.records), 1)
+        self.assertEqual([fp for fp, _ in errors], [missing])
+
+
+class ParseCacheTest(BrokerageNotesTestMixin, TestCase):
+    """tests for the content-hash parse cache and duplicate-import detection"""
+
+    def test_cached_files_are_not_parsed_again(self):
+        """a second run over the same files is served from the cache"""
+        first = DataAggregator(cache=DatabaseParseCache())
+        first.process_files(self.files, 'Fundos e Acoes')
+        self.assertEqual(ParsedNoteCache.objects.count(), 3)
+
+        second = DataAggregator(cache=DatabaseParseCache())
+        with patch.object(second.parser, 'parse_file') as parse_file:
+            second.process_files(self.files, 'Fundos e Acoes')
+
+        parse_file.assert_not_called()
+        self.assertEqual(second.get_records(), first.get_records())
+
+    def test_cached_files_are_recorded_in_the_text_store(self):
+        """files served by the cache still get a NoteText row, which links them to their transactions"""
+        DataAggregator(cache=DatabaseParseCache()).process_files(self.files, 'Fundos e Acoes')
+        DataAggregator(cache=DatabaseParseCache(), text_store=DatabaseNoteTextStore()).process_files(
+            self.files, 'Fundos e Acoes')
+
+        self.assertEqual(sorted(NoteText.objects.values_list('filename', 'strategy')),
+                         sorted((os.path.basename(p), '') for p in self.files))
+
+    @override_settings(BROKERAGE_PARSE_WORKERS=1)
+    def test_reupload_skips_duplicates(self):
+        """uploading the same notes twice does not duplicate transactions"""
+        upload_notes(self.client, self.files)
+        call_command('run_ingestion_worker', '--once', stdout=StringIO())
+        imported = Transaction.objects.count()
+        self.assertEqual(imported, 2)  # PETR4 (same day, aggregated) + HGLG11
+
+        upload_notes(self.client, self.files)
+        call_command('run_ingestion_worker', '--once', stdout=StringIO())
+        self.assertEqual(Transaction.objects.count(), imported)
+        self.assertTrue(all(len(t.source_hash) == 64 for t in Transaction.objects.all()))
+
+
+@override_settings(BROKERAGE_PARSE_WORKERS=1)
+class IngestionJobTest(BrokerageNotesTestMixin, TestCase):
+    """tests for background ingestion jobs and the progress endpoint"""
+
+    def test_upload_queues_job(self):
+        """the upload view only stores the files; nothing is parsed in the request"""
+        response = upload_notes(self.client, self.files)
+
+        job = IngestionJob.objects.get()
+        self.assertRedirects(response, f"{reverse('dashboard')}?job={job.pk}")
+        self.assertEqual(job.status, IngestionJob.STATUS_PENDING)
+        self.assertEqual(job.files.count(), 3)
+        self.assertEqual(Transaction.objects.count(), 0)
+
+    def test_worker_runs_job_and_reports_progress(self):
+        """the worker imports the notes and the status endpoint reports per-file progress"""
+        broken = SimpleUploadedFile('broken.pdf', b'not a pdf', 'application/pdf')
+        upload_notes(self.client, self.files, extra=[broken])
+        job = IngestionJob.objects.get()
+
+        status = self.client.get(reverse('job_status', args=[job.pk])).json()
+        self.assertEqual((status['status'], status['processed_files'], status['total_files']), ('pending', 0, 4))
+
+        call_command('run_ingestion_worker', '--once', stdout=StringIO())
+
+        status = self.client.get(reverse('job_status', args=[job.pk])).json()
+        self.assertEqual(status['status'], 'done')
+        self.assertTrue(status['finished'])
+        self.assertEqual(status['processed_files'], 4)
+        self.assertEqual(status['imported'], 2)
+        self.assertEqual([f['status'] for f in status['files']], ['done'] * 4)
+        self.assertEqual(Transaction.objects.count(), 2)
+        self.assertFalse(IngestionFile.objects.exclude(content=b'').exists())
+
+        response = self.client.get(reverse('dashboard'), {'job': job.pk})
+        self.assertContains(response, f'Importação #{job.pk}')
+
+    @override_settings(BROKERAGE_JOB_STALE_SECONDS=600)
+    def test_stale_running_job_is_reclaimed(self):
+        """a job left running by a dead worker keeps its files and is claimed again once its heartbeat is stale"""
+        upload_notes(self.client, self.files)
+        job = claim_next_job()
+        IngestionFile.objects.filter(pk=job.files.first().pk).update(status='done')
+        IngestionJob.objects.filter(pk=job.pk).update(processed_files=1)
+        self.assertIsNone(claim_next_job())  # Heartbeat still fresh: the worker may be alive
+
+        IngestionJob.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=601))
+        reclaimed = claim_next_job()
+        self.assertEqual(reclaimed.pk, job.pk)
+        self.assertEqual(reclaimed.processed_files, 0)
+        self.assertFalse(reclaimed.files.filter(content=b'').exists())
+
+        run_job(reclaimed)
+        self.assertEqual((reclaimed.status, reclaimed.processed_files, reclaimed.imported_count), ('done', 3, 2))
+        self.assertEqual(Transaction.objects.count(), 2)
+        self.assertFalse(IngestionFile.objects.exclude(content=b'').exists())
+
+    def test_reclaimed_job_is_not_saved_by_its_old_worker(self):
+        """a worker whose job was claimed again meanwhile saves nothing and leaves the files to the new worker"""
+        upload_notes(self.client, self.files)
+        job = claim_next_job()
+        IngestionJob.objects.filter(pk=job.pk).update(started_at=timezone.now() + timedelta(seconds=1))
+
+        with self.assertLogs('brokerage_analyzer.src.use_cases.ingestion', level='WARNING'):
+            run_job(job)
+        self.assertEqual(job.status, IngestionJob.STATUS_RUNNING)
+        self.assertEqual(Transaction.objects.count(), 0)
+        self.assertFalse(IngestionFile.objects.filter(content=b'').exists())
+
+    def test_status_reports_updated_rows(self):
+        """a re-imported file counts as updated, not as skipped"""
+        for _ in range(2):
+            upload_notes(self.client, self.files[2:])
+            call_command('run_ingestion_worker', '--once', stdout=StringIO())
+        job = IngestionJob.objects.order_by('-pk').first()
+
+        status = self.client.get(reverse('job_status', args=[job.pk])).json()
+        self.assertEqual((status['imported'], status['updated']), (0, 1))
+        self.assertNotIn('skipped', status)
+
+
+class PdfSourceTest(BrokerageNotesTestMixin, TestCase):
+    """tests for parsing PDFs given as paths, bytes or file-like objects"""
+
+    def test_all_sources_parse_the_same(self):
+        """path, bytes, BytesIO and UploadedFile inputs give the same notes"""
+        path = self.files[0]
+        with open(path, 'rb') as f:
+            data = f.read()
+        filename = os.path.basename(path)
+
+        parser = PdfParser()
+        results = [
+            parser.parse_file(path),
+            parser.parse_file(data, filename),
+            parser.parse_file(BytesIO(data), filename),
+            parser.parse_file(SimpleUploadedFile(filename, data, 'application/pdf')),
+        ]
+
+        got = [[(n.reference_date, n.financial_summary.net_settlement_value, n.observation) for n in notes]
+               for notes in results]
+        self.assertEqual(got, [[(date(2024, 3, 15), -3501.23, 'PETR4 - C')]] * 4)
+
+    def test_uploaded_files_are_processed_in_memory(self):
+        """DataAggregator accepts UploadedFiles and records their original names"""
+        uploads = []
+        for path in self.files:
+            with open(path, 'rb') as f:
+                uploads.append(SimpleUploadedFile(os.path.basename(path), f.read(), 'application/pdf'))
+
+        aggregator = DataAggregator()
+        errors = aggregator.process_files(uploads, 'Fundos e Acoes')
+
+        self.assertEqual(errors, [])
+        self.assertEqual([r['Filename'] for r in aggregator.records], [os.path.basename(p) for p in self.files])
+
+
+class FallbackScannerGoldenTest(TestCase):
+    """golden outputs of the fallback heuristics, recorded before the single-pass scanner"""
+
+    GOLDEN = [
+        ("NOTA DE CORRETAGEM\nC/V Tipo mercado\n1-BOVESPA C VISTA PETR4 ON 100 35,00 3.500,00 D\n"
+         "Líquido para 18/03/2024 3.501,23 D\n", "nota_15-03-2024.pdf",
+         [(date(2024, 3, 15), -3501.23, 'PETR4 - C')]),
+        ("1-BOVESPA V VISTA VALE3 ON 100 60,00 6.000,00 C\nLíquido para 18/03/2024 5.998,10 C\n",
+         "nota_15-03-2024.pdf", [(date(2024, 3, 15), 5998.1, 'VALE3 - V')]),
+        ("ITSA4 C\nLIQUIDO PARA18/03/2024 1.234,56 D", "nota_15-03-2024.pdf",
+         [(date(2024, 3, 18), -1234.56, 'ITSA4 - C')]),
+        ("L.QUIDO PARA18/03/20243.501,23 D BOVA11", "x.pdf",
+         [(date(2024, 3, 18), -3501.23, 'PARA18 - C')]),
+        ("BMF WINJ24 C 2 ajuste\nLíquido para 19/03/2024 250,00 C", "nota_18-03-2024.pdf",
+         [(date(2024, 3, 18), 250.0, 'WIN')]),
+        ("XWDOF25 V\nLíquido para\n440,50 D", "nota_02-01-2025.pdf",
+         [(date(2025, 1, 2), -440.5, 'WDO')]),
+        ("PETR4 100,00 D 2.500,00 C 0,00 D", "nota_10-05-2024.pdf",
+         [(date(2024, 5, 10), 2500.0, 'PETR4 - C')]),
+        ("C V 1-BOVESPA V HGLG11 Líquido para 1.600,48 C", "nota_02-04-2024.pdf",
+         [(date(2024, 4, 2), 1600.48, 'HGLG11 - V')]),
+        ("ABCD11 Líquido para 1.600,48 D", "nota_02-04-2024.pdf",
+         [(date(2024, 4, 2), -1600.48, 'ABCD11 - C')]),
+        ("Total R$ 1.234,56 e R$ 99,90.", "nota_05-06-2024.pdf",
+         [(date(2024, 6, 5), 1234.56, '')]),
+        ("NOTA DE CORRETAGEM PARA DATA TOTAL", "nota_05-06-2024.pdf", []),
+    ]
+
+    def test_golden_outputs(self):
+        """parse_text returns the same MockNote values as the multi-regex implementation"""
+        parser = PdfParser()
+        for text, filename, expected in self.GOLDEN:
+            with self.subTest(text=text):
+                notes = parser.parse_text(text, filename)
+                got = [(n.reference_date, n.financial_summary.net_settlement_value, n.observation) for n in notes]
+                self.assertEqual(got, expected)
+
+
+class NoteQuantitiesTest(TestCase):
+    """tests for the quantities recorded from parsed notes"""
+
+    @skipUnless(BrokerageNote, "correpy is not installed")
+    def test_correpy_trades_are_counted(self):
+        """CorrePy notes carry their trades instead of bought/sold; the observation's ticker is summed"""
+        from correpy.domain.entities.security import Security
+        from correpy.domain.entities.transaction import Transaction as Trade
+        from correpy.domain.enums import TransactionType
+
+        note = BrokerageNote(reference_id=1, reference_date=date(2024, 3, 15), transactions=[
+            Trade(TransactionType.BUY, Decimal(100), Decimal('35.00'), Security('PETROBRAS PN N2 PETR4')),
+            Trade(TransactionType.SELL, Decimal(40), Decimal('36.00'), Security('PETROBRAS PN N2 PETR4F')),
+            Trade(TransactionType.BUY, Decimal(10), Decimal('70.00'), Security('VALE ON NM VALE3')),
+        ])
+        # Purchases 4.200,00, sales 1.440,00 and 1,23 of fees, shared out by trade value
+        note.financial_summary = MockFinancialSummary(-2761.23)
+        note.observation = 'PETR4 - C'
+
+        [serialized] = serialize_notes([note])
+        self.assertEqual((serialized['bought'], serialized['sold']), (100, 40))
+        self.assertEqual((serialized['buy_value'], serialized['sell_value']), (3500.76, 1439.69))
+        note.observation = ''
+        self.assertEqual(note_quantities(note), (110, 40, 4200.92, 1439.69))
+
+    def test_values_are_split_by_side_and_ticker(self):
+        """a note buying and selling a ticker, or trading several, books each ticker's own trade values"""
+        parser = PdfParser()
+        [note] = parser.parse_text("1-BOVESPA C VISTA ITSA4 PN 200 10,00 2.000,00 D\n"
+                                   "1-BOVESPA V VISTA ITSA4 PN 100 11,00 1.100,00 C\n"
+                                   "Líquido para 18/03/2024 900,00 D", 'nota_18-03-2024.pdf')
+        self.assertEqual(note_quantities(note), (200, 100, 2000.0, 1100.0))
+
+        [note] = parser.parse_text("1-BOVESPA C VISTA PETR4 PN 100 35,00 3.500,00 D\n"
+                                   "1-BOVESPA C VISTA VALE3 ON 10 70,00 700,00 D\n"
+                                   "Líquido para 18/03/2024 4.201,26 D", 'nota_18-03-2024.pdf')
+        self.assertEqual(note_quantities(note), (100, 0, 3501.05, 0.0))
+
+    def test_day_trade_within_one_note(self):
+        """C 200 @ 10 and V 100 @ 11 on one note: +100 of day trade and 100 shares left at a cost of 1.000"""
+        aggregator = DataAggregator()
+        aggregator.add_notes([MockNote(date(2024, 3, 18), -900.0, 'ITSA4 - C', 200, 100, 2000.0, 1100.0)],
+                             'nota.pdf', 'Fundos e Acoes', 'abc')
+        save_records(aggregator.get_records())
+        tax_ledger.refresh()
+
+        self.assertEqual(TaxMonthlyResult.objects.get(pool='day_trade').result, Decimal('100.00'))
+        self.assertEqual(TaxPosition.objects.values_list('quantity', 'total_cost').get(), (100, Decimal('1000.00')))
+
+    def test_notes_without_trade_values_are_unquantified(self):
+        """quantities without values to split (e.g. an old cache entry) are dropped instead of guessing a cost"""
+        aggregator = DataAggregator()
+        aggregator.add_notes([MockNote(date(2024, 3, 18), -900.0, 'ITSA4 - C', 200, 100)],
+                             'nota.pdf', 'Fundos e Acoes', 'abc')
+        [record] = aggregator.get_records()
+        self.assertEqual((record['BuyValue'], record['BuyQuantity'], record['SellQuantity']), (900.0, 0.0, 0.0))
+
+
+class IncrementalExtractionTest(TestCase):
+    """tests for page-incremental text extraction with early exit"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        filler = ["Negócios realizados (continua)"] + [f"Linha {i} sem dados" for i in range(30)]
+        self.pages = [
+            ["NOTA DE CORRETAGEM  Folha 1", "C/V", "1-BOVESPA C VISTA PETR4 ON 100 35,00 3.500,00 D"],
+            filler,
+            filler,
+            ["Resumo Financeiro", "Valor das operações 3.500,00", "Líquido para 18/03/2024 3.501,23 D"],
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_stops_once_note_is_identified(self):
+        """summary page plus first page are enough; the filler pages are skipped"""
+        path = build_note_pdf(os.path.join(self.tmp_dir, 'nota_15-03-2024.pdf'), *self.pages)
+
+        with self.assertLogs('brokerage_analyzer.src.infrastructure.pdf_parser', level='INFO') as logs:
+            incremental = PdfParser(incremental=True)._parse_fallback(path)
+        full = PdfParser(incremental=False)._parse_fallback(path)
+
+        self.assertTrue(any('Early exit after 2/4 pages' in line for line in logs.output))
+        self.assertEqual(
+            [(n.reference_date, n.financial_summary.net_settlement_value, n.observation) for n in incremental],
+            [(n.reference_date, n.financial_summary.net_settlement_value, n.observation) for n in full],
+        )
+
+    def test_trade_lines_on_a_later_page_are_read(self):
+        """the trades sit on page 2 and the summary shows a ticker-like code: nothing may be skipped"""
+        filler = ["Negócios realizados (continua)"] + [f"Linha {i} sem dados" for i in range(30)]
+        pages = [
+            ["NOTA DE CORRETAGEM  Folha 1", "Negócios realizados", "C/V"],
+            ["1-BOVESPA V VISTA VALE3 ON 100 70,00 7.000,00 C"],
+            filler,
+            ["Resumo Financeiro", "Clearing CBLC3 Agente 308", "Líquido para 18/03/2024 6.998,10 C"],
+        ]
+        path = build_note_pdf(os.path.join(self.tmp_dir, 'nota_15-03-2024.pdf'), *pages)
+
+        incremental = PdfParser(incremental=True)._parse_fallback(path)
+        full = PdfParser(incremental=False)._parse_fallback(path)
+
+        self.assertEqual([n.observation for n in incremental], ['VALE3 - V'])
+        self.assertEqual(
+            [(n.reference_date, n.financial_summary.net_settlement_value, n.observation, n.sold) for n in incremental],
+            [(n.reference_date, n.financial_summary.net_settlement_value, n.observation, n.sold) for n in full],
+        )
+
+    def test_reads_whole_document_when_needed(self):
+        """without an early exit the text matches pdfminer's extract_text exactly"""
+        path = build_note_pdf(os.path.join(self.tmp_dir, 'nota.pdf'), *self.pages)
+
+        parser = PdfParser()
+        text = parser.extract_note_text(parser.load_pages(path), 'nota.pdf', STRATEGY_LAYOUT)
+
+        self.assertEqual(text, extract_text(path))
+
+
+class FastExtractionTest(BrokerageNotesTestMixin, TestCase):
+    """tests for the layout-free extraction strategy"""
+
+    def test_fast_and_layout_agree(self):
+        """the comparison harness reports full field agreement on the sample notes"""
+        report = compare_strategies(self.files)
+
+        self.assertEqual(report['files'], 3)
+        self.assertEqual(report['agreement'][STRATEGY_FAST], dict.fromkeys(FIELDS, 3))
+        self.assertEqual(report['disagreements'], [])
+
+    def test_falls_back_to_layout_when_fast_finds_nothing(self):
+        """an empty fast extraction is retried with layout analysis"""
+        parser = PdfParser()
+        real_extract = parser.extract_note_pages
+
+        def extract(pages, filename, strategy):
+            return ("", True) if strategy == STRATEGY_FAST else real_extract(pages, filename, strategy)
+
+        with patch.object(parser, 'extract_note_pages', side_effect=extract) as mocked:
+            notes = parser._parse_fallback(self.files[0])
+
+        self.assertEqual([call.args[2] for call in mocked.call_args_list], [STRATEGY_FAST, STRATEGY_LAYOUT])
+        self.assertEqual(notes[0].observation, 'PETR4 - C')
+
+
+class ColumnarAggregationTest(TestCase):
+    """golden output of get_records, recorded with the dict-based implementation"""
+
+    def record(self, day, category, ticker, value, filename, source_hash):
+        return {
+            'Date': date(2024, 3, day), 'Category': category, 'AssetClass': f"{ticker} - C", 'Ticker': ticker,
+            'LiquidValue': value, 'BuyValue': abs(value) if value < 0 else 0.0,
+            'SellValue': value if value > 0 else 0.0, 'BuyQuantity': 0.0, 'SellQuantity': 0.0, 'Filename': filename,
+            'SourceHash': source_hash,
+        }
+
+    def test_get_records_matches_golden_output(self):
+        """daily (Date, Ticker) aggregation, futures pass-through and ordering are unchanged"""
+        aggregator = DataAggregator()
+        rows = [
+            self.record(16, 'Stocks', 'PETR4', -100.1, 'b.pdf', 'h2'),
+            self.record(15, 'Futures - WIN', 'WIN', 50.0, 'w.pdf', 'hw'),
+            self.record(16, 'Stocks', 'PETR4', 0.2, 'a.pdf', 'h1'),
+            self.record(15, 'FIIs', 'HGLG11', -10.0, 'c.pdf', 'h3'),
+            self.record(16, 'Futures - WDO', 'WDO', -5.0, 'd.pdf', 'h4'),
+            self.record(16, 'Others', 'PETR4', 0.1, 'a.pdf', 'h1'),
+        ]
+        for row in rows:
+            aggregator.append_record(row)
+
+        self.assertEqual(aggregator.records, rows)
+        self.assertEqual(aggregator.get_records(), [
+            rows[1],
+            {'Date': date(2024, 3, 15), 'Category': 'FIIs', 'AssetClass': 'HGLG11 - C', 'LiquidValue': -10.0,
+             'BuyValue': 10.0, 'SellValue': 0.0, 'BuyQuantity': 0.0, 'SellQuantity': 0.0, 'Filename': 'c.pdf',
+             'SourceHash': 'h3'},
+            rows[4],
+            {'Date': date(2024, 3, 16), 'Category': 'Others', 'AssetClass': 'PETR4 - C',
+             'LiquidValue': -100.1 + 0.2 + 0.1, 'BuyValue': 100.1, 'SellValue': 0.2 + 0.1, 'BuyQuantity': 0.0,
+             'SellQuantity': 0.0, 'Filename': 'a.pdf, b.pdf', 'SourceHash': hashlib.sha256(b'h1,h2').hexdigest()},
+        ])
+
+
+class ExcelExporterTest(TestCase):
+    """tests for the streaming write-only Excel export"""
+
+    def test_streams_sheets_and_summaries(self):
+        """category sheets, Resumo IR and Resumo Futuros are written from a single pass over a generator"""
+        rows = [
+            ('Stocks', date(2024, 3, 15), 'PETR4 - C', -3501.23),
+            ('Futures - WIN', date(2024, 3, 18), 'WIN', 250.0),
+            ('FIIs', date(2024, 4, 2), 'HGLG11 - C', -1600.48),
+            ('Stocks', date(2024, 3, 20), 'PETR4 - V', 1799.1),
+        ]
+        records = (
+            {'Date': d, 'Category': cat, 'AssetClass': asset, 'LiquidValue': v,
+             'BuyValue': -v if v < 0 else 0.0, 'SellValue': v if v > 0 else 0.0, 'Filename': 'nota.pdf'}
+            for cat, d, asset, v in rows
+        )
+        buffer = BytesIO()
+        ExcelExporter(records).to_excel(buffer)
+
+        buffer.seek(0)
+        wb = load_workbook(buffer)
+        self.assertEqual(wb.sheetnames, ['FIIs', 'Futures - WIN', 'Stocks', 'Resumo IR', 'Resumo Futuros'])
+
+        stocks = [[c.value for c in row] for row in wb['Stocks'].iter_rows()]
+        self.assertEqual(stocks[0], ['Date', 'AssetClass', 'BuyValue', 'SellValue', 'LiquidValue', 'Filename'])
+        self.assertEqual(stocks[1][1:], ['PETR4 - C', 3501.23, 0, -3501.23, 'nota.pdf'])
+        self.assertEqual(wb['Stocks']['E2'].number_format, 'R$ #,##0.00')
+        self.assertEqual(wb['Futures - WIN']['C2'].number_format, 'R$ #,##0.00')
+
+        tax = [[c.value for c in row] for row in wb['Resumo IR'].iter_rows(min_row=2)]
+        self.assertEqual(tax, [[2024, 3, 'Stocks', 3501.23, 1799.1, -3501.23 + 1799.1],
+                               [2024, 4, 'FIIs', 1600.48, 0, -1600.48]])
+        futures = [[c.value for c in row] for row in wb['Resumo Futuros'].iter_rows(min_row=2)]
+        self.assertEqual(futures, [['Futures - WIN', 2024, 3, 250]])
+
+
+class DownloadReportTest(TestCase):
+    """tests for the streamed report downloads"""
+
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        settings = self.settings(BROKERAGE_EXPORT_CACHE_DIR=cache_dir)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        Transaction.objects.create(date=date(2024, 3, 15), category='Stocks', asset_class='PETR4 - C', ticker='PETR4',
+                                   liquid_value='-3501.23', buy_value='3501.23', filename='nota.pdf')
+        Transaction.objects.create(date=date(2024, 3, 18), category='Futures - WIN', asset_class='WIN', ticker='WIN',
+                                   liquid_value='250.00', filename='win.pdf')
+
+    def test_csv_is_streamed(self):
+        """CSV rows come straight from values_list, decimals unchanged"""
+        response = self.client.get(reverse('download_report'), {'format': 'csv'})
+
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines, [
+            'Date,Category,AssetClass,Ticker,LiquidValue,BuyValue,SellValue,Filename',
+            '2024-03-15,Stocks,PETR4 - C,PETR4,-3501.23,3501.23,0.00,nota.pdf',
+            '2024-03-18,Futures - WIN,WIN,WIN,250.00,0.00,0.00,win.pdf',
+        ])
+
+    def test_xlsx_is_streamed(self):
+        """the default format is the Excel workbook, served from a temporary file"""
+        response = self.client.get(reverse('download_report'))
+
+        self.assertTrue(response.streaming)
+        self.assertIn('Relatorio_Notas_Corretagem.xlsx', response['Content-Disposition'])
+        wb = load_workbook(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(wb.sheetnames, ['Futures - WIN', 'Stocks', 'Resumo IR', 'Resumo Futuros', 'Apuração IR'])
+        self.assertEqual(wb['Stocks']['E2'].value, -3501.23)
+
+    @skipUnless(pq, "pyarrow not installed")
+    def test_parquet_is_streamed(self):
+        """the Parquet download holds the same rows"""
+        response = self.client.get(reverse('download_report'), {'format': 'parquet'})
+
+        table = pq.read_table(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(table.column('Ticker').to_pylist(), ['PETR4', 'WIN'])
+        self.assertEqual(table.column('LiquidValue').to_pylist(), [-3501.23, 250.0])
+
+    def test_reports_are_cached_by_data_version(self):
+        """a report is generated once per data version, unchanged ones are answered with 304"""
+        with patch.object(ExcelExporter, 'to_excel', autospec=True, side_effect=ExcelExporter.to_excel) as to_excel:
+            first = self.client.get(reverse('download_report'))
+            b''.join(first.streaming_content)
+            second = self.client.get(reverse('download_report'))
+            self.assertEqual(b''.join(second.streaming_content)[:2], b'PK')
+            self.assertEqual(to_excel.call_count, 1)
+
+            not_modified = self.client.get(reverse('download_report'), HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual(not_modified.status_code, 304)
+
+            Transaction.objects.create(date=date(2024, 4, 2), category='FIIs', asset_class='HGLG11 - C',
+                                       ticker='HGLG11', liquid_value='-160.00', buy_value='160.00', filename='fii.pdf')
+            changed = self.client.get(reverse('download_report'), HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual(changed.status_code, 200)
+            self.assertNotEqual(changed['ETag'], first['ETag'])
+            b''.join(changed.streaming_content)
+            self.assertEqual(to_excel.call_count, 2)
+
+    def test_storing_an_older_version_keeps_the_newer_reports(self):
+        """a slow request finishing after the data changed again only prunes versions older than its own"""
+        cache = ExportCache()
+        old_key, new_key = '1-20240315100000000000', '2-20240315100500000000'
+        cache.store(new_key, 'csv', lambda f: f.write(b'new'))
+        cache.store(old_key, 'xlsx', lambda f: f.write(b'old'))
+        self.assertIsNotNone(cache.get(new_key, 'csv'))
+
+        cache.store(new_key, 'xlsx', lambda f: f.write(b'new'))
+        self.assertIsNone(cache.get(old_key, 'xlsx'))
+        self.assertEqual(sorted(os.listdir(cache.directory)), [f'report-{new_key}.csv', f'report-{new_key}.xlsx'])
+
+
+@override_settings(BROKERAGE_PARSE_WORKERS=1)
+class MonthlyRollupTest(BrokerageNotesTestMixin, TestCase):
+    """tests for the incrementally maintained (year, month, category) rollup"""
+
+    def test_rollup_follows_imports_and_deletes(self):
+        """imports and deletes keep the rollup equal to a full aggregation"""
+        upload_notes(self.client, self.files)
+        call_command('run_ingestion_worker', '--once', stdout=StringIO())
+
+        self.assertEqual(
+            list(MonthlyRollup.objects.values_list('year', 'month', 'category', 'transaction_count', 'liquid_total')),
+            [(2024, 3, 'Stocks', 1, Decimal('-1702.13')), (2024, 4, 'FIIs', 1, Decimal('-1600.48'))],
+        )
+        self.assertEqual(rollup.verify(), [])
+
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['total_transactions'], 2)
+        self.assertEqual(response.context['total_liquid'], Decimal('-3302.61'))
+
+        Transaction.objects.filter(category='FIIs').delete()
+        self.assertEqual(rollup.verify(), [])
+        self.assertFalse(MonthlyRollup.objects.filter(category='FIIs').exists())
+
+    def test_command_detects_drift_and_rebuilds(self):
+        """writes that bypass signals are reported by --verify-only and fixed by a rebuild"""
+        Transaction.objects.create(date=date(2024, 3, 15), category='Stocks', asset_class='PETR4 - C',
+                                   ticker='PETR4', liquid_value='-10.00', buy_value='10.00', filename='a.pdf')
+        Transaction.objects.update(liquid_value='-20.00')
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_monthly_rollup', '--verify-only', stdout=StringIO())
+
+        call_command('rebuild_monthly_rollup', stdout=StringIO())
+        self.assertEqual(MonthlyRollup.objects.get().liquid_total, Decimal('-20.00'))
+
+
+class TransactionUpsertTest(TestCase):
+    """tests for natural-key upserts of imported records"""
+
+    def record(self, liquid):
+        return {'Date': date(2024, 3, 15), 'Category': 'Stocks', 'AssetClass': 'PETR4 - V', 'Ticker': 'PETR4',
+                'LiquidValue': liquid, 'BuyValue': 0.0, 'SellValue': liquid, 'Filename': 'a.pdf', 'SourceHash': 'abc'}
+
+    def test_reimport_updates_rows_in_place(self):
+        """saving the same note twice updates the existing row and keeps the rollup consistent"""
+        self.assertEqual(save_records([self.record(100.0)]), (1, 0))
+        self.assertEqual(save_records([self.record(150.0)]), (0, 1))
+
+        self.assertEqual(Transaction.objects.get().liquid_value, Decimal('150.00'))
+        self.assertEqual(rollup.verify(), [])
+        self.assertEqual(MonthlyRollup.objects.get().transaction_count, 1)
+
+
+@override_settings(BROKERAGE_PARSE_WORKERS=1)
+class OverlappingImportTest(BrokerageNotesTestMixin, TestCase):
+    """tests for re-imports that overlap files already stored"""
+
+    def import_files(self, paths):
+        upload_notes(self.client, paths)
+        call_command('run_ingestion_worker', '--once', stdout=StringIO())
+        return IngestionJob.objects.order_by('-pk').first()
+
+    def test_import_a_then_a_and_b(self):
+        """the rows built from A are replaced by the A+B aggregate, so A counts once"""
+        self.import_files(self.files[:1])
+        self.assertEqual(list(Transaction.objects.values_list('liquid_value', flat=True)), [Decimal('-3501.23')])
+
+        job = self.import_files(self.files[:2])
+        self.assertEqual((job.imported_count, job.skipped_count), (0, 1))
+        petr4 = Transaction.objects.get()
+        self.assertEqual(petr4.liquid_value, Decimal('-1702.13'))
+        self.assertEqual(petr4.note_texts.count(), 2)
+        self.assertEqual(rollup.verify(), [])
+
+        # B alone again: rebuilt from A (parse cache) and B, still one row
+        self.import_files(self.files[1:2])
+        self.assertEqual(list(Transaction.objects.values_list('liquid_value', flat=True)), [Decimal('-1702.13')])
+
+
+class NoteGeneratorTest(TestCase):
+    """tests for the synthetic brokerage note corpus"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_parser_recovers_ground_truth(self):
+        """stock and futures notes, including multi-page ones, parse to their ground truth"""
+        truth = NoteGenerator(seed=3, futures_ratio=0.5, max_pages=2).generate(self.tmp_dir, 6)
+        self.assertTrue(os.path.isfile(os.path.join(self.tmp_dir, GROUND_TRUTH_FILE)))
+        self.assertEqual({e['kind'] for e in truth}, {'stock', 'futures'})
+        self.assertIn(2, [e['pages'] for e in truth])
+
+        parser = PdfParser(correpy=False)
+        for entry in load_ground_truth(self.tmp_dir):
+            with self.subTest(filename=entry['filename']):
+                notes = parser.parse_file(os.path.join(self.tmp_dir, entry['filename']))
+                self.assertEqual(note_fields(notes), {field: entry[field] for field in FIELDS})
+                self.assertEqual((notes[0].bought, notes[0].sold), (entry['bought'], entry['sold']))
+
+    def test_same_seed_same_corpus(self):
+        """the corpus is reproducible from its seed"""
+        first = NoteGenerator(seed=7).generate(os.path.join(self.tmp_dir, 'a'), 3)
+        second = NoteGenerator(seed=7).generate(os.path.join(self.tmp_dir, 'b'), 3)
+        self.assertEqual(first, second)
+
+
+class ParserBenchmarkTest(TestCase):
+    """tests for the parser benchmark"""
+
+    @skipUnless(os.path.exists('/proc/self/clear_refs'), "needs Linux procfs")
+    def test_spawned_runs_report_their_own_peak_rss(self):
+        """a configuration's peak RSS is not the high-water mark inherited from the calling process"""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, ignore_errors=True)
+        NoteGenerator(seed=1).generate(tmp_dir, 2)
+        ballast = b'x' * (300 * 1024 * 1024)  # Raises this process's ru_maxrss past 300 MB
+
+        results = run_benchmark(tmp_dir, ('fast',), workers=1)
+        del ballast
+
+        for run in (results['parsers']['fast'], results['aggregator']):
+            self.assertEqual(run['rss_source'], 'VmHWM')
+            self.assertLess(run['peak_rss_mb'], 300)
+            self.assertGreaterEqual(run['rss_growth_mb'], 0)
+
+
+class InstrumentRegistryTest(TestCase):
+    """tests for the ticker -> category reference data"""
+
+    def test_classification(self):
+        """data file entries win over the ticker shape, which covers the remaining B3 instruments"""
+        registry = get_registry()
+        expected = {
+            'BOVA11': 'ETFs', 'BSLV39': 'ETFs', 'TAEE11': 'Stocks', 'HGLG11': 'FIIs', 'PETR4': 'Stocks',
+            'PETR4F': 'Stocks', 'AAPL34': 'BDRs', 'PETRD350': 'Options', 'WINJ24': 'Futures - WIN',
+            'WDO': 'Futures - WDO', 'ABC': 'Others',
+        }
+        for ticker, category in expected.items():
+            with self.subTest(ticker=ticker):
+                self.assertEqual(registry.classify(ticker), category)
+        self.assertIs(get_registry(), registry)
+
+    def test_reclassify_updates_stored_rows(self):
+        """stored transactions follow the registry in one pass and the rollup is rebuilt"""
+        for ticker, category in [('TAEE11', 'FIIs'), ('AAPL34', 'Stocks'), ('HGLG11', 'FIIs'),
+                                 ('WIN', 'Futures - WIN')]:
+            Transaction.objects.create(date=date(2024, 3, 15), category=category, asset_class=f"{ticker} - C",
+                                       ticker=ticker, liquid_value='-10.00', buy_value='10.00', filename='a.pdf')
+
+        with self.assertNumQueries(1):
+            self.assertEqual(pending_changes(), {'TAEE11': 'Stocks', 'AAPL34': 'BDRs'})
+        call_command('reclassify_transactions', stdout=StringIO())
+
+        self.assertEqual(dict(Transaction.objects.values_list('ticker', 'category')),
+                         {'TAEE11': 'Stocks', 'AAPL34': 'BDRs', 'HGLG11': 'FIIs', 'WIN': 'Futures - WIN'})
+        self.assertEqual(rollup.verify(), [])
+        self.assertEqual(pending_changes(), {})
+
+
+class TaxLedgerTest(TestCase):
+    """tests for the incremental income-tax ledger"""
+
+    def trade(self, day, ticker, category, buy=0, bought=0, sell=0, sold=0):
+        return Transaction.objects.create(
+            date=day, ticker=ticker, category=category, asset_class=ticker, liquid_value=Decimal(sell) - Decimal(buy),
+            buy_value=buy, sell_value=sell, buy_quantity=bought, sell_quantity=sold, filename='a.pdf',
+            source_hash=f"{ticker}{day}",
+        )
+
+    def results(self):
+        return {
+            (r.month, r.pool): (r.result, r.exempt_result, r.loss_offset, r.loss_balance, r.tax_due)
+            for r in TaxMonthlyResult.objects.all()
+        }
+
+    def setUp(self):
+        self.trade(date(2024, 1, 10), 'PETR4', 'Stocks', buy=3000, bought=100)
+        self.trade(date(2024, 1, 20), 'PETR4', 'Stocks', buy=4000, bought=100)
+        self.trade(date(2024, 2, 5), 'PETR4', 'Stocks', sell=2000, sold=50)
+        self.trade(date(2024, 2, 6), 'VALE3', 'Stocks', buy=1000, bought=10, sell=900, sold=10)
+        self.trade(date(2024, 3, 4), 'PETR4', 'Stocks', sell=30000, sold=150)
+        Transaction.objects.create(date=date(2024, 3, 5), ticker='WIN', category='Futures - WIN', asset_class='WIN',
+                                   liquid_value=300, filename='w.pdf')
+        self.trade(date(2024, 4, 1), 'HGLG11', 'FIIs', buy=1600, bought=10)
+        self.trade(date(2024, 4, 15), 'HGLG11', 'FIIs', sell=900, sold=5)
+        tax_ledger.refresh()
+
+    def test_average_cost_exemption_day_trade_and_losses(self):
+        """average cost, the R$ 20k stock exemption, day trades and loss carryforward per pool"""
+        D = Decimal
+        self.assertEqual(self.results(), {
+            # Sold 50 of 200 at an average cost of 35: exempt, sales below R$ 20k
+            (date(2024, 2, 1), 'swing'): (D('250.00'), D('250.00'), D(0), D(0), D(0)),
+            (date(2024, 2, 1), 'day_trade'): (D('-100.00'), D(0), D(0), D('100.00'), D(0)),
+            (date(2024, 3, 1), 'swing'): (D('24750.00'), D(0), D(0), D(0), D('3712.50')),
+            # The futures gain offsets February's day-trade loss
+            (date(2024, 3, 1), 'day_trade'): (D('300.00'), D(0), D('100.00'), D(0), D('40.00')),
+            (date(2024, 4, 1), 'fii'): (D('100.00'), D(0), D(0), D(0), D('20.00')),
+        })
+        self.assertIsNone(tax_ledger.refresh())
+
+    def test_new_note_recomputes_from_its_month(self):
+        """earlier months keep their rows and the outcome equals a full recomputation"""
+        january_and_february = list(TaxMonthlyResult.objects.filter(month__lt=date(2024, 3, 1)).values_list('pk'))
+
+        self.trade(date(2024, 3, 1), 'PETR4', 'Stocks', buy=4500, bought=100)
+        self.assertEqual(tax_ledger.refresh(), date(2024, 3, 1))
+
+        self.assertEqual(
+            list(TaxMonthlyResult.objects.filter(month__lt=date(2024, 3, 1)).values_list('pk')), january_and_february
+        )
+        # 150 of 250 sold at the new average cost of 39
+        self.assertEqual(self.results()[(date(2024, 3, 1), 'swing')][0], Decimal('24150.00'))
+
+        incremental = self.results()
+        call_command('rebuild_tax_ledger', stdout=StringIO())
+        self.assertEqual(self.results(), incremental)
+
+    def test_day_trade_split_across_imports(self):
+        """the buy and the sell of one day in rows of different files still make a day trade"""
+        self.trade(date(2024, 5, 6), 'ITSA4', 'Stocks', buy=1000, bought=100)
+        Transaction.objects.create(date=date(2024, 5, 6), ticker='ITSA4', category='Stocks', asset_class='ITSA4 - V',
+                                   liquid_value=1100, sell_value=1100, sell_quantity=100, filename='b.pdf',
+                                   source_hash='other file')
+        tax_ledger.refresh()
+
+        self.assertEqual(self.results()[(date(2024, 5, 1), 'day_trade')][0], Decimal('100.00'))
+        self.assertNotIn((date(2024, 5, 1), 'swing'), self.results())
+
+    def test_reclassification_recomputes_from_the_earliest_affected_month(self):
+        """the UPDATE of reclassify_transactions skips the signals, so it flags the ledger itself"""
+        fii = self.results()[(date(2024, 4, 1), 'fii')]
+        Transaction.objects.filter(ticker='HGLG11').update(category='Stocks')
+        call_command('rebuild_tax_ledger', stdout=StringIO())
+        self.assertNotIn((date(2024, 4, 1), 'fii'), self.results())
+
+        self.assertEqual(reclassify_transactions(), 2)
+        self.assertEqual(TaxLedgerState.objects.get().dirty_from, date(2024, 4, 1))
+        self.assertEqual(tax_ledger.refresh(), date(2024, 4, 1))
+        self.assertEqual(self.results()[(date(2024, 4, 1), 'fii')], fii)
+
+
+@override_settings(BROKERAGE_PARSE_WORKERS=1)
+class NoteTextStoreTest(BrokerageNotesTestMixin, TestCase):
+    """tests for the stored note texts and their re-parse"""
+
+    def test_texts_are_stored_and_reparsed(self):
+        """imports keep the compressed text of each note; a changed text rebuilds only its transactions"""
+        upload_notes(self.client, self.files)
+        call_command('run_ingestion_worker', '--once', stdout=StringIO())
+
+        self.assertEqual(NoteText.objects.count(), 3)
+        self.assertEqual(set(NoteText.objects.values_list('strategy', flat=True)), {STRATEGY_FAST})
+        stocks = Transaction.objects.get(ticker='PETR4')
+        self.assertEqual(sorted(stocks.note_texts.values_list('filename', flat=True)),
+                         ['nota_15-03-2024.pdf', 'nota_2_15-03-2024.pdf'])
+
+        out = StringIO()
+        call_command('reparse_brokerage_notes', stdout=out)
+        self.assertIn("3 stored texts re-parsed", out.getvalue())
+        self.assertIn("0 changed", out.getvalue())
+
+        # Stand-in for a heuristic fix: the text now reads differently
+        note = NoteText.objects.get(filename='nota_02-04-2024.pdf')
+        note.text = compress_text(decompress_text(note.text).replace('1.600,48', '1.700,48'))
+        note.save()
+
+        call_command('reparse_brokerage_notes', '--dry-run', stdout=StringIO())
+        self.assertEqual(Transaction.objects.get(ticker='HGLG11').liquid_value, Decimal('-1600.48'))
+
+        call_command('reparse_brokerage_notes', stdout=StringIO())
+        fii = Transaction.objects.get(ticker='HGLG11')
+        self.assertEqual(fii.liquid_value, Decimal('-1700.48'))
+        self.assertEqual(list(fii.note_texts.all()), [note])
+        self.assertEqual(Transaction.objects.get(ticker='PETR4').pk, stocks.pk)
+        self.assertEqual(rollup.verify(), [])
+
+    def test_partial_texts_are_reported_not_reparsed(self):
+        """a text cut short by the incremental early exit lacks pages: reparse counts it instead of re-reading it"""
+        filler = ["Negócios realizados (continua)"] + [f"Linha {i} sem dados" for i in range(30)]
+        path = build_note_pdf(os.path.join(self.tmp_dir, 'nota_18-03-2024.pdf'),
+                              ["NOTA DE CORRETAGEM  Folha 1", "C/V", "1-BOVESPA C VISTA VALE3 ON 100 70,00 7.000,00 D"],
+                              filler, filler,
+                              ["Resumo Financeiro", "Valor das operações 7.000,00", "Líquido para 20/03/2024 7.001,23 D"])
+        DataAggregator(text_store=DatabaseNoteTextStore()).process_files(self.files[:1] + [path], 'Fundos e Acoes')
+
+        self.assertEqual(sorted(NoteText.objects.values_list('filename', 'complete')),
+                         [('nota_15-03-2024.pdf', True), ('nota_18-03-2024.pdf', False)])
+        out = StringIO()
+        call_command('reparse_brokerage_notes', stdout=out)
+        self.assertIn("1 stored texts re-parsed", out.getvalue())
+        self.assertIn("1 partial texts skipped", out.getvalue())
+
+
+class DirectoryImportTest(BrokerageNotesTestMixin, TestCase):
+    """tests for the checkpointed directory import command"""
+
+    def test_interrupted_import_resumes(self):
+        """committed batches are checkpointed; a rerun only imports the rest"""
+        checkpoint = os.path.join(self.tmp_dir, 'checkpoint.jsonl')
+        args = ('import_brokerage_notes', self.tmp_dir, '--batch-size', '1', '--workers', '1',
+                '--checkpoint', checkpoint)
+
+        calls = []
+
+        def crash_on_second_batch(aggregator):
+            calls.append(aggregator)
+            if len(calls) == 2:
+                raise RuntimeError("crash")
+            return save_batch(aggregator)
+
+        with patch('brokerage_analyzer.src.use_cases.directory_import.save_batch', crash_on_second_batch):
+            with self.assertRaises(RuntimeError):
+                call_command(*args, stdout=StringIO())
+        self.assertEqual(Transaction.objects.count(), 1)
+
+        out = StringIO()
+        call_command(*args, stdout=out)
+        self.assertIn("Resuming: 1 files", out.getvalue())
+        self.assertEqual(Transaction.objects.count(), 3)  # The two PETR4 notes landed in different batches
+        self.assertEqual(NoteText.objects.count(), 3)
+
+        # Nothing left to do, and a copy under another name is recognised by its hash
+        shutil.copy(self.files[0], os.path.join(self.tmp_dir, 'copia.pdf'))
+        out = StringIO()
+        call_command(*args, stdout=out)
+        self.assertIn("0 files imported", out.getvalue())
+        self.assertIn("4 already done", out.getvalue())
+        self.assertEqual(Transaction.objects.count(), 3)
+
+    def test_copies_within_a_batch_are_imported_once(self):
+        """a copy in the same batch is skipped by hash and checkpointed with the first file"""
+        shutil.copy(self.files[0], os.path.join(self.tmp_dir, 'copia_15-03-2024.pdf'))
+        checkpoint = os.path.join(self.tmp_dir, 'checkpoint.jsonl')
+        args = ('import_brokerage_notes', self.tmp_dir, '--workers', '1', '--checkpoint', checkpoint)
+
+        out = StringIO()
+        call_command(*args, stdout=out)
+        self.assertIn("3 files imported", out.getvalue())
+        self.assertIn("1 already done", out.getvalue())
+        self.assertEqual(Transaction.objects.get(ticker='PETR4').liquid_value, Decimal('-1702.13'))
+        self.assertEqual(rollup.verify(), [])
+
+        out = StringIO()
+        call_command(*args, stdout=out)
+        self.assertIn("Resuming: 4 files", out.getvalue())
+        self.assertIn("0 files imported", out.getvalue())
+
+
+class ParseSandboxTest(BrokerageNotesTestMixin, TestCase):
+    """tests for the sandboxed parses and the quarantine"""
+
+    def test_sandbox_matches_in_process_parse(self):
+        """a sandboxed parse returns the in-process result"""
+        with open(self.files[0], 'rb') as f:
+            data = f.read()
+        notes, strategy, text, complete = PdfParser().parse_with_text(data, 'nota_15-03-2024.pdf')
+
+        self.assertEqual(ParseSandbox().parse(data, 'nota_15-03-2024.pdf'),
+                         (serialize_notes(notes), strategy, text, complete))
+
+    def test_slow_files_are_quarantined(self):
+        """a file past the timeout is killed, quarantined with its timing and not parsed again"""
+        aggregator = DataAggregator(max_workers=2, sandbox=ParseSandbox(timeout=0.001), quarantine=DatabaseQuarantine())
+        errors = aggregator.process_files(self.files[:1], 'Fundos e Acoes')
+
+        self.assertEqual([type(e) for _, e in errors], [ParseFailure])
+        quarantined = QuarantinedNote.objects.get()
+        self.assertEqual((quarantined.filename, quarantined.reason), ('nota_15-03-2024.pdf', REASON_TIMEOUT))
+        self.assertGreaterEqual(quarantined.seconds, 0.001)
+
+        aggregator = DataAggregator(max_workers=2, sandbox=ParseSandbox(), quarantine=DatabaseQuarantine())
+        with patch.object(aggregator.sandbox, 'parse', return_value=([], STRATEGY_FAST, '', True)) as parse:
+            errors = aggregator.process_files(self.files, 'Fundos e Acoes')
+
+        self.assertEqual(parse.call_count, 2)
+        self.assertEqual([(fp, e.reason) for fp, e in errors], [(self.files[0], REASON_TIMEOUT)])
+
+    def test_only_transient_failures_are_retried(self):
+        """a timeout gets a second attempt, a parser exception does not"""
+        sandbox = ParseSandbox()
+        result = ([], STRATEGY_FAST, '', True)
+        with patch.object(sandbox, '_parse_once', side_effect=[ParseFailure(REASON_TIMEOUT, 'slow'), result]) as once:
+            self.assertEqual(sandbox.parse(b'%PDF', 'nota.pdf'), result)
+        self.assertEqual(once.call_count, 2)
+
+        with patch.object(sandbox, '_parse_once', side_effect=ParseFailure(REASON_ERROR, 'broken')) as once:
+            with self.assertRaises(ParseFailure):
+                sandbox.parse(b'%PDF', 'nota.pdf')
+        self.assertEqual(once.call_count, 1)
+
+    def test_transient_quarantine_expires(self):
+        """a timed-out file is parsed again once its entry expires; parse errors stay quarantined"""
+        quarantine = DatabaseQuarantine(transient_seconds=3600)
+        quarantine.set_many({'slow': ('slow.pdf', ParseFailure(REASON_TIMEOUT, 'timed out', 120.0)),
+                             'broken': ('broken.pdf', ParseFailure(REASON_ERROR, 'ValueError'))})
+        self.assertEqual(set(quarantine.get_many(['slow', 'broken'])), {'slow', 'broken'})
+
+        QuarantinedNote.objects.update(created_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(set(quarantine.get_many(['slow', 'broken'])), {'broken'})
+
+        quarantine.set_many({'slow': ('slow.pdf', ParseFailure(REASON_CRASH, 'parser process died'))})
+        self.assertEqual(quarantine.get_many(['slow'])['slow'].reason, REASON_CRASH)
+        self.assertEqual(QuarantinedNote.objects.count(), 2)
+
+
+class PortfolioTimelineTest(TestCase):
+    """tests for the downsampled cumulative cash-flow series"""
+
+    def setUp(self):
+        Transaction.objects.create(date=date(2024, 3, 15), category='Stocks', asset_class='PETR4 - C', ticker='PETR4',
+                                   liquid_value='-3501.23', buy_value='3501.23', filename='nota.pdf')
+        Transaction.objects.create(date=date(2024, 3, 15), category='Futures - WIN', asset_class='WIN', ticker='WIN',
+                                   liquid_value='250.00', filename='win.pdf')
+        Transaction.objects.create(date=date(2024, 3, 18), category='Stocks', asset_class='PETR4 - V', ticker='PETR4',
+                                   liquid_value='1799.10', sell_value='1799.10', filename='nota_2.pdf')
+
+    def test_lttb_keeps_extremes(self):
+        """LTTB returns the point budget, the end points and the spike"""
+        x = np.arange(1000, dtype=float)
+        y = np.sin(x / 50)
+        y[500] = 10
+        keep = lttb(x, y, 50)
+
+        self.assertEqual(len(keep), 50)
+        self.assertEqual((keep[0], keep[-1]), (0, 999))
+        self.assertIn(500, keep)
+        self.assertTrue(np.all(np.diff(keep) > 0))
+        self.assertEqual(lttb(x[:10], y[:10], 50).tolist(), list(range(10)))
+
+    def test_timeline_is_cumulative_and_cached(self):
+        """daily flows are accumulated per category and served from the cache until the data changes"""
+        cache.clear()
+        response = self.client.get(reverse('portfolio_timeline'), {'points': 100})
+        data = response.json()
+
+        self.assertEqual(data['net_cash_flow'], {'dates': ['2024-03-15', '2024-03-18'], 'values': [-3251.23, -1452.13]})
+        self.assertEqual(data['categories'], {
+            'Futures - WIN': {'dates': ['2024-03-15'], 'values': [250.0]},
+            'Stocks': {'dates': ['2024-03-15', '2024-03-18'], 'values': [-3501.23, -1702.13]},
+        })
+
+        with self.assertNumQueries(1):  # Only the data version
+            self.assertEqual(self.client.get(reverse('portfolio_timeline'), {'points': 100}).json(), data)
+        not_modified = self.client.get(reverse('portfolio_timeline'), {'points': 100},
+                                       HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        Transaction.objects.filter(ticker='WIN').delete()
+        data = self.client.get(reverse('portfolio_timeline'), {'points': 100}).json()
+        self.assertEqual(data['net_cash_flow']['values'], [-3501.23, -1702.13])
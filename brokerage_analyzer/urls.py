@@ -4,5 +4,7 @@ from . import views
 urlpatterns = [
     path('', views.dashboard, name='dashboard'),
     path('upload/', views.upload_notes, name='upload_notes'),
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
     path('download/', views.download_report, name='download_report'),
+    path('timeline/', views.portfolio_timeline, name='portfolio_timeline'),
 ]
@@ -1,31 +1,50 @@
-import os
-from django.shortcuts import render, redirect
-from django.conf import settings
+from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib import messages
-from django.core.files.storage import FileSystemStorage
+from django.urls import reverse
 from .forms import UploadNotesForm
-from .models import Transaction
-from brokerage_analyzer.src.use_cases.data_aggregator import DataAggregator
+from .models import IngestionJob, MonthlyRollup, Transaction
+from brokerage_analyzer.src.use_cases import ingestion, tax_ledger, timeline
 
-from django.http import HttpResponse
+from django.http import FileResponse, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from brokerage_analyzer.src.infrastructure import export_cache, rollup
 from brokerage_analyzer.src.infrastructure.excel_exporter import ExcelExporter
-from io import BytesIO
+from brokerage_analyzer.src.infrastructure.report_writers import (
+    CHUNK_SIZE, TRANSACTION_FIELDS, iter_csv, iter_records, pq, write_parquet
+)
 
 from django.db.models import Sum
 
 
+REPORT_FORMATS = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv; charset=utf-8',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
 def dashboard(request):
-    # Statistics
-    total_transactions = Transaction.objects.count()
-    total_liquid = Transaction.objects.aggregate(Sum('liquid_value'))['liquid_value__sum'] or 0
+    # Statistics (from the monthly rollup, so the cost does not grow with the Transaction table)
+    totals = MonthlyRollup.objects.aggregate(count=Sum('transaction_count'), liquid=Sum('liquid_total'))
+    total_transactions = totals['count'] or 0
+    total_liquid = totals['liquid'] or 0
 
     # Aggregation by Category
-    category_stats = Transaction.objects.values('category').annotate(total=Sum('liquid_value')).order_by('category')
+    category_stats = MonthlyRollup.objects.values('category').annotate(total=Sum('liquid_total')).order_by('category')
 
     # Recent Transactions
     transactions = Transaction.objects.all().order_by('-date')[:50]
 
+    # Ingestion job to follow: the one just uploaded, or the latest still in progress
+    job_id = request.GET.get('job', '')
+    if job_id.isdigit():
+        job = IngestionJob.objects.filter(pk=job_id).first()
+    else:
+        job = IngestionJob.objects.exclude(status__in=[IngestionJob.STATUS_DONE, IngestionJob.STATUS_FAILED]).first()
+
     context = {
+        'job': job,
         'total_transactions': total_transactions,
         'total_liquid': total_liquid,
         'category_stats': category_stats,
@@ -43,112 +62,97 @@ def upload_notes(request):
             asset_type = form.cleaned_data['asset_type']
             uploaded_files = request.FILES.getlist('files')
 
-            # 1. Setup Temporary Directory
-            temp_dir = os.path.join(settings.BASE_DIR, 'media', 'temp')
-            if not os.path.exists(temp_dir):
-                os.makedirs(temp_dir)
-
-            # 2. Process Files
-            aggregator = DataAggregator()
-            count = 0
-
-            for f in uploaded_files:
-                # Save to disk temporarily
-                fs = FileSystemStorage(location=temp_dir)
-                filename = fs.save(f.name, f)
-                file_path = os.path.join(temp_dir, filename)
-
-                try:
-                    # Parse the file
-                    aggregator.process_single_pdf(file_path, asset_type)
-
-                except Exception as e:
-                    messages.error(request, f"Error processing {f.name}: {e}")
-                finally:
-                    # Delete file immediately
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-
-            # 3. Save to Database
-            # Retrieve aggregated records
-            # get_records() aggregates by Day/Ticker
-            final_records = aggregator.get_records()
-
-            objs = []
-            for r in final_records:
-                # Map dictionary to Model
-                t = Transaction(
-                    date=r['Date'],
-                    category=r['Category'],
-                    asset_class=r['AssetClass'],
-                    ticker=r.get('Ticker', r['AssetClass'].split(' - ')[0]),
-                    liquid_value=r['LiquidValue'],
-                    buy_value=r['BuyValue'],
-                    sell_value=r['SellValue'],
-                    filename=r['Filename']
-                )
-                objs.append(t)
-
-            Transaction.objects.bulk_create(objs)
-            count = len(objs)
-
-            messages.success(request, f"{count} records imported successfully!")
-
-            # Cleanup temp dir if empty
-            try:
-                os.rmdir(temp_dir)
-            except BaseException:
-                pass
+            # Parsing and saving run in the background (manage.py run_ingestion_worker),
+            # the dashboard polls the job status
+            job = ingestion.create_job(uploaded_files, asset_type)
+            messages.info(request, f"{job.total_files} arquivo(s) enviado(s) para processamento.")
 
-            return redirect('dashboard')
+            return redirect(f"{reverse('dashboard')}?job={job.pk}")
     else:
         form = UploadNotesForm()
 
     return render(request, 'brokerage_analyzer/upload.html', {'form': form})
 
 
+def job_status(request, job_id):
+    job = get_object_or_404(IngestionJob, pk=job_id)
+    return JsonResponse(ingestion.job_status(job))
+
+
+def _write_report(report_format: str, output):
+    # Read the table as plain tuples, chunk by chunk (no model instances, no full copy in memory)
+    rows = Transaction.objects.order_by('date').values_list(*TRANSACTION_FIELDS).iterator(chunk_size=CHUNK_SIZE)
+
+    if report_format == 'csv':
+        for line in iter_csv(rows):
+            output.write(line.encode('utf-8'))
+    elif report_format == 'parquet':
+        write_parquet(rows, output)
+    else:
+        tax_ledger.refresh()
+        ExcelExporter(iter_records(rows), monthly_totals=rollup.monthly_totals(),
+                      tax_results=tax_ledger.monthly_results()).to_excel(output)
+
+
+def _conditional(request, tag: str):
+    """
+    (data version, ETag, 304 response or None): responses derived only from the
+    brokerage data are validated by the data version it was computed from.
+    """
+    version = export_cache.current_version()
+    etag = quote_etag(f"{version.key}-{tag}")
+    return version, etag, get_conditional_response(request, etag=etag, last_modified=version.changed_at.timestamp())
+
+
+def _set_validators(response, version, etag):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(version.changed_at.timestamp())
+    return response
+
+
+def portfolio_timeline(request):
+    """Cumulative net cash flow series (total and per category), downsampled to ?points=N."""
+    points = request.GET.get('points', '')
+    points = min(max(int(points), 3), timeline.MAX_POINTS) if points.isdigit() else timeline.DEFAULT_POINTS
+
+    version, etag, not_modified = _conditional(request, f"timeline-{points}")
+    if not_modified is not None:
+        return not_modified
+    return _set_validators(JsonResponse(timeline.cached_timeline(version.key, points)), version, etag)
+
+
 def download_report(request):
     # 1. Fetch Data
-    transactions = Transaction.objects.all().order_by('date')
+    report_format = request.GET.get('format', 'xlsx')
+    if report_format not in REPORT_FORMATS:
+        report_format = 'xlsx'
 
-    if not transactions.exists():
+    if not Transaction.objects.exists():
         messages.warning(request, "No data available to generate report.")
         return redirect('dashboard')
 
-    # 2. Format for ExcelExporter
-    # Exporter expects: {'Date', 'Category', 'AssetClass', 'Ticker', 'LiquidValue', 'BuyValue', 'SellValue', 'Filename'}
-    records = []
-    for t in transactions:
-        records.append({
-            'Date': t.date,
-            'Category': t.category,
-            'AssetClass': t.asset_class,
-            'Ticker': t.ticker,
-            'LiquidValue': float(t.liquid_value),
-            'BuyValue': float(t.buy_value),
-            'SellValue': float(t.sell_value),
-            'Filename': t.filename
-        })
-
-    # 3. Generate Excel in Memory
-    exporter = ExcelExporter(records)
-
-    # Use BytesIO buffer to capture the file content
-    buffer = BytesIO()
-
-    try:
-        exporter.to_excel(buffer)
-    except Exception as e:
-        print(f"Export Error: {e}")
-        messages.error(request, "Error generating Excel report.")
+    if report_format == 'parquet' and pq is None:
+        messages.error(request, "Parquet export requires pyarrow.")
         return redirect('dashboard')
 
-    buffer.seek(0)
+    # 2. Reports only change with the data: the data version is the validator, and the
+    #    file generated for it is reused until an import or edit bumps the version
+    version, etag, not_modified = _conditional(request, report_format)
+    if not_modified is not None:
+        return not_modified
+
+    cache = export_cache.ExportCache()
+    path = cache.get(version.key, report_format)
+    if path is None:
+        try:
+            path = cache.store(version.key, report_format, lambda output: _write_report(report_format, output))
+        except Exception as e:
+            print(f"Export Error: {e}")
+            messages.error(request, "Error generating report.")
+            return redirect('dashboard')
 
-    # 4. Return Response
-    response = HttpResponse(
-        buffer.getvalue(),
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = 'attachment; filename="Relatorio_Notas_Corretagem.xlsx"'
-    return response
+    # 3. Return Response (streamed from the cached file)
+    filename = f"Relatorio_Notas_Corretagem.{report_format}"
+    response = FileResponse(open(path, 'rb'), as_attachment=True, filename=filename,
+                            content_type=REPORT_FORMATS[report_format])
+    return _set_validators(response, version, etag)
@@ -2,6 +2,7 @@
 
 import os
 import sys
+import tempfile
 from pathlib import Path
 from decouple import config
 import dj_database_url
@@ -159,5 +160,19 @@ else:
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Brokerage Analyzer
+# Number of worker processes used to parse uploaded brokerage notes (1 = serial)
+BROKERAGE_PARSE_WORKERS = config('BROKERAGE_PARSE_WORKERS', default=min(4, os.cpu_count() or 1), cast=int)
+# Each note is parsed in a child process, killed after this many seconds or beyond this address space (0 = no limit)
+BROKERAGE_PARSE_TIMEOUT = config('BROKERAGE_PARSE_TIMEOUT', default=120, cast=float)
+BROKERAGE_PARSE_MEMORY_MB = config('BROKERAGE_PARSE_MEMORY_MB', default=2048, cast=int)
+# A note that timed out or crashed twice in a row is quarantined for this many seconds, then parsed again
+BROKERAGE_QUARANTINE_TRANSIENT_SECONDS = config('BROKERAGE_QUARANTINE_TRANSIENT_SECONDS', default=86400, cast=int)
+# A running ingestion job whose worker has not reported progress for this many seconds is claimed again
+BROKERAGE_JOB_STALE_SECONDS = config('BROKERAGE_JOB_STALE_SECONDS', default=600, cast=int)
+# Generated reports, reused until the brokerage data changes
+BROKERAGE_EXPORT_CACHE_DIR = config('BROKERAGE_EXPORT_CACHE_DIR',
+                                    default=os.path.join(tempfile.gettempdir(), 'brokerage_reports'))
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
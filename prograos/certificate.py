@@ -2,15 +2,142 @@
 Certificate Manager for A1 Digital Certificates
 Handles loading, validation, and providing certificates for NF-e signing
 """
+import os
+import secrets
+import ssl
+import tempfile
+import threading
 from datetime import datetime
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.serialization import pkcs12
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+class LoadedCertificate:
+    """
+    Decrypted key and certificate of one CertificateConfig version, with
+    their PEM encodings
+    """
+
+    def __init__(self, private_key, certificate, ca_certs):
+        self.private_key = private_key
+        self.certificate = certificate
+        self.ca_certs = list(ca_certs or [])
+        self.cert_pem = certificate.public_bytes(serialization.Encoding.PEM)
+        self.key_pem = private_key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.TraditionalOpenSSL,
+            encryption_algorithm=serialization.NoEncryption()
+        )
+        self._ssl_context = None
+
+    def ssl_context(self):
+        """
+        SSLContext presenting this certificate, for TLS client authentication;
+        built once. ssl only loads a chain from files: they live in a private
+        temp dir just for the load, the key encrypted with a one-off password,
+        so the decrypted key is never written to disk
+        """
+        if self._ssl_context is None:
+            password = secrets.token_bytes(32)
+            chain = self.cert_pem + b''.join(ca.public_bytes(serialization.Encoding.PEM) for ca in self.ca_certs)
+            key = self.private_key.private_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PrivateFormat.PKCS8,
+                encryption_algorithm=serialization.BestAvailableEncryption(password)
+            )
+            context = ssl.create_default_context()
+            with tempfile.TemporaryDirectory() as directory:  # mode 0700, removed on exit
+                cert_path, key_path = os.path.join(directory, 'cert.pem'), os.path.join(directory, 'key.pem')
+                for path, data in ((cert_path, chain), (key_path, key)):
+                    with open(path, 'wb') as f:
+                        f.write(data)
+                context.load_cert_chain(cert_path, key_path, password=password)
+            self._ssl_context = context
+        return self._ssl_context
+
+
+class CertificateCache:
+    """
+    Process-level cache of loaded A1 certificates, keyed by CertificateConfig
+    id and updated_at: the .pfx is read and decrypted once per version of the
+    config instead of on every signature. Also keeps the active config, so
+    signing a receipt only checks its id and updated_at. Saving or deleting a
+    CertificateConfig invalidates the cache in this process (signals); other
+    worker processes see the change at their next version check.
+    """
+
+    _lock = threading.RLock()
+    _entries = {}  # config id -> (updated_at, LoadedCertificate)
+    _active = None  # ((id, updated_at) or None, CertificateConfig or None)
+
+    @classmethod
+    def get(cls, config):
+        """LoadedCertificate of config, loading the .pfx when this version is not cached"""
+        with cls._lock:
+            cached = cls._entries.get(config.pk)
+            if cached and cached[0] == config.updated_at:
+                return cached[1]
+
+            loaded = LoadedCertificate(*_load_pfx(config))
+            if config.pk is not None:
+                cls._entries[config.pk] = (config.updated_at, loaded)
+            return loaded
+
+    @classmethod
+    def active_config(cls):
+        """
+        The active CertificateConfig (or None). One light query compares its id
+        and updated_at with the cached one; the row is only fetched when they differ
+        """
+        from .models import CertificateConfig
+
+        with cls._lock:
+            version = CertificateConfig.objects.filter(is_active=True).values_list('pk', 'updated_at').first()
+            if cls._active is None or cls._active[0] != version:
+                config = CertificateConfig.objects.filter(pk=version[0]).first() if version else None
+                cls._active = (version, config)
+            return cls._active[1]
+
+    @classmethod
+    def invalidate(cls, config_id=None):
+        """Drops the cached certificate of config_id (all of them when None) and the active config"""
+        with cls._lock:
+            if config_id is None:
+                cls._entries.clear()
+            else:
+                cls._entries.pop(config_id, None)
+            cls._active = None
+
+
+def _load_pfx(config):
+    """(private_key, certificate, ca_certs) of the config's .pfx file"""
+    cert_path = config.certificate_file.path
+    password = config.password.encode('utf-8')
+
+    try:
+        # Read the .pfx file
+        with open(cert_path, 'rb') as f:
+            pfx_data = f.read()
+
+        # Load the certificate
+        private_key, certificate, ca_certs = pkcs12.load_key_and_certificates(
+            pfx_data,
+            password,
+            backend=default_backend()
+        )
+        logger.info(f"Certificate loaded successfully: {config.name}")
+        return private_key, certificate, ca_certs
+
+    except Exception as e:
+        logger.error(f"Failed to load certificate: {str(e)}")
+        raise ValueError(f"Erro ao carregar certificado: {str(e)}")
+
+
 class CertificateManager:
     """
     Manages A1 digital certificates for NF-e signing
@@ -24,13 +151,10 @@ class CertificateManager:
             certificate_config: CertificateConfig model instance
         """
         self.config = certificate_config
-        self._private_key = None
-        self._certificate = None
-        self._loaded = False
 
     def load_certificate(self):
         """
-        Load the A1 certificate from file
+        Load the A1 certificate from file (once per config version, see CertificateCache)
 
         Returns:
             tuple: (private_key, certificate, ca_certificates)
@@ -39,34 +163,8 @@ class CertificateManager:
             ValueError: If certificate file is invalid or password is incorrect
             FileNotFoundError: If certificate file doesn't exist
         """
-        if self._loaded:
-            return self._private_key, self._certificate, []
-
-        cert_path = self.config.certificate_file.path
-        password = self.config.password.encode('utf-8')
-
-        try:
-            # Read the .pfx file
-            with open(cert_path, 'rb') as f:
-                pfx_data = f.read()
-
-            # Load the certificate
-            private_key, certificate, ca_certs = pkcs12.load_key_and_certificates(
-                pfx_data,
-                password,
-                backend=default_backend()
-            )
-
-            self._private_key = private_key
-            self._certificate = certificate
-            self._loaded = True
-
-            logger.info(f"Certificate loaded successfully: {self.config.name}")
-            return private_key, certificate, ca_certs or []
-
-        except Exception as e:
-            logger.error(f"Failed to load certificate: {str(e)}")
-            raise ValueError(f"Erro ao carregar certificado: {str(e)}")
+        loaded = CertificateCache.get(self.config)
+        return loaded.private_key, loaded.certificate, loaded.ca_certs
 
     def validate_certificate(self):
         """
@@ -130,10 +228,7 @@ class CertificateManager:
         Returns:
             bytes: Certificate in PEM format
         """
-        from cryptography.hazmat.primitives import serialization
-
-        _, cert, _ = self.load_certificate()
-        return cert.public_bytes(serialization.Encoding.PEM)
+        return CertificateCache.get(self.config).cert_pem
 
     def get_key_pem(self):
         """
@@ -142,11 +237,13 @@ class CertificateManager:
         Returns:
             bytes: Private key in PEM format
         """
-        from cryptography.hazmat.primitives import serialization
+        return CertificateCache.get(self.config).key_pem
 
-        key, _, _ = self.load_certificate()
-        return key.private_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PrivateFormat.TraditionalOpenSSL,
-            encryption_algorithm=serialization.NoEncryption()
-        )
+    def get_ssl_context(self):
+        """
+        Get an SSL context presenting the certificate, for TLS client authentication
+
+        Returns:
+            ssl.SSLContext: Context with the certificate chain and private key loaded
+        """
+        return CertificateCache.get(self.config).ssl_context()
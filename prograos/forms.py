@@ -276,3 +276,17 @@ class CalculadoraFreteForm(forms.Form):
                 params={'preco': preco_base, 'custo': custo}
             )
         return cleaned_data
+
+
+class ExtratoImportForm(forms.Form):
+    arquivo = forms.FileField(
+        label="Extrato Bancário (OFX ou CSV)",
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.ofx,.csv,.txt'})
+    )
+    dias_apos_nota = forms.IntegerField(
+        label="Prazo de Pagamento (dias após a nota)",
+        min_value=1,
+        max_value=730,
+        initial=120,
+        widget=forms.NumberInput(attrs={'class': 'form-control'})
+    )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from prograos.services.kpi_rollup import KpiRollup
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the (user, month) MonthlyKpi rollup from the notas and verifies it"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify-only', action='store_true',
+                            help="Only compare the stored rollup with a fresh aggregation")
+
+    def handle(self, *args, **options):
+        if not options['verify_only']:
+            count = KpiRollup.rebuild()
+            self.stdout.write(f"Rebuilt {count} MonthlyKpi rows")
+
+        mismatches = KpiRollup.verify()
+        for (user_id, month), expected, stored in mismatches:
+            self.stdout.write(f"user {user_id} {month:%m/%Y}: expected {expected}, stored {stored}")
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} MonthlyKpi rows out of date (run without --verify-only to rebuild)")
+
+        self.stdout.write(self.style.SUCCESS("MonthlyKpi rollup is consistent"))
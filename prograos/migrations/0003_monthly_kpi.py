@@ -0,0 +1,38 @@
+# Generated by Django 4.2.27 on 2026-10-17 01:14
+
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('prograos', '0002_certificateconfig_emitterconfig_taxprofile_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyKpi',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Mês')),
+                ('notas', models.PositiveIntegerField(default=0)),
+                ('receita', models.DecimalField(decimal_places=5, default=Decimal('0.00'), max_digits=21)),
+                ('custo', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=18)),
+                ('frete', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=18)),
+                ('pago', models.PositiveIntegerField(default=0)),
+                ('parcial', models.PositiveIntegerField(default=0)),
+                ('pendente', models.PositiveIntegerField(default=0)),
+                ('soja', models.PositiveIntegerField(default=0)),
+                ('milho', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_kpis', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['user', 'month'],
+                'unique_together': {('user', 'month')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.27 on 2026-10-17 01:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prograos', '0003_monthly_kpi'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pagamento',
+            name='id_transacao_bancaria',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True, verbose_name='ID da Transação Bancária'),
+        ),
+    ]
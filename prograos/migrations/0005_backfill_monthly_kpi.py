@@ -0,0 +1,62 @@
+from datetime import date
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+# Decimal places of the MonthlyKpi money fields (kpi_rollup.PLACES)
+PLACES = {'receita': Decimal('0.00001'), 'custo': Decimal('0.01'), 'frete': Decimal('0.01')}
+
+
+def build_monthly_kpis(apps, schema_editor):
+    """Same totals as KpiRollup.rebuild, for the notas created before the table existed."""
+    NotaCarregamento = apps.get_model('prograos', 'NotaCarregamento')
+    MonthlyKpi = apps.get_model('prograos', 'MonthlyKpi')
+
+    receita = ExpressionWrapper(F('quantidade_sacos') * F('preco_por_saco'),
+                                output_field=DecimalField(max_digits=18, decimal_places=2))
+    com_financeiro = Q(financeiro__isnull=False)
+    rows = (
+        NotaCarregamento.objects.exclude(created_by=None)
+        .annotate(m=TruncMonth('data_criacao'))
+        .values('created_by', 'm')
+        .annotate(
+            notas=Count('id'),
+            receita=Sum(receita),
+            custo=Sum('financeiro__valor_custo_total'),
+            frete=Sum(Coalesce('pesagem__frete_total_calculado', Decimal(0.0)), filter=com_financeiro,
+                      output_field=DecimalField()),
+            pago=Count('financeiro', filter=Q(financeiro__status_pagamento='PAGO')),
+            parcial=Count('financeiro', filter=Q(financeiro__status_pagamento='PARCIAL')),
+            pendente=Count('financeiro', filter=Q(financeiro__status_pagamento='PENDENTE')),
+            soja=Count('id', filter=Q(tipo_grao='SOJA')),
+            milho=Count('id', filter=Q(tipo_grao='MILHO')),
+        )
+        .order_by()
+    )
+
+    kpis = []
+    for row in rows:
+        m, user_id = row.pop('m'), row.pop('created_by')
+        if timezone.is_aware(m):
+            m = timezone.localtime(m)
+        totals = {field: value or 0 for field, value in row.items()}
+        for field, places in PLACES.items():
+            totals[field] = Decimal(totals[field]).quantize(places)
+        kpis.append(MonthlyKpi(user_id=user_id, month=date(m.year, m.month, 1), **totals))
+    # Rows the signals already wrote since 0003 are rebuilt along with the rest
+    MonthlyKpi.objects.all().delete()
+    MonthlyKpi.objects.bulk_create(kpis, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prograos', '0004_pagamento_id_transacao_bancaria'),
+    ]
+
+    operations = [
+        migrations.RunPython(build_monthly_kpis, migrations.RunPython.noop),
+    ]
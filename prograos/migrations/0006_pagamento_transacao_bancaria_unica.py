@@ -0,0 +1,61 @@
+from decimal import Decimal
+from importlib import import_module
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def remove_duplicate_imports(apps, schema_editor):
+    """
+    Keeps the first Pagamento of each (registro, bank transaction id) written
+    twice by concurrent statement imports, and refreshes valor_pago and
+    status_pagamento of the registros involved as atualizar_status would
+    (their costs do not depend on the payments).
+    """
+    Pagamento = apps.get_model('prograos', 'Pagamento')
+    RegistroFinanceiro = apps.get_model('prograos', 'RegistroFinanceiro')
+
+    duplicates = (
+        Pagamento.objects.exclude(id_transacao_bancaria=None)
+        .values('registro_financeiro', 'id_transacao_bancaria')
+        .annotate(n=Count('id'), first=Min('id'))
+        .filter(n__gt=1)
+        .order_by()
+    )
+    registro_ids = set()
+    for row in duplicates:
+        (Pagamento.objects.filter(registro_financeiro=row['registro_financeiro'],
+                                  id_transacao_bancaria=row['id_transacao_bancaria'])
+         .exclude(pk=row['first']).delete())
+        registro_ids.add(row['registro_financeiro'])
+
+    for registro in RegistroFinanceiro.objects.filter(pk__in=registro_ids).select_related('nota'):
+        registro.valor_pago = registro.pagamentos.aggregate(total=Sum('valor'))['total'] or Decimal('0.00')
+        valor_total = registro.nota.valor_total
+        if valor_total is not None and registro.valor_pago >= valor_total:
+            registro.status_pagamento = 'PAGO'
+        elif registro.valor_pago > Decimal('0.00'):
+            registro.status_pagamento = 'PARCIAL'
+        else:
+            registro.status_pagamento = 'PENDENTE'
+        registro.save(update_fields=['valor_pago', 'status_pagamento'])
+
+    if registro_ids:
+        # MonthlyKpi counts the registros by status
+        import_module('prograos.migrations.0005_backfill_monthly_kpi').build_monthly_kpis(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prograos', '0005_backfill_monthly_kpi'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_imports, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='pagamento',
+            constraint=models.UniqueConstraint(fields=('registro_financeiro', 'id_transacao_bancaria'),
+                                               name='pagamento_transacao_bancaria_unica'),
+        ),
+    ]
@@ -134,11 +134,12 @@ class PesagemCaminhao(models.Model):
 
         super().save(*args, **kwargs)
 
-        # 3) Atualiza financeiro vinculado
+        # 3) Atualiza financeiro vinculado (em lote; adiado dentro de RecomputeService.deferred())
+        from prograos.services.recompute_service import RecomputeService
         try:
-            for nota in self.notacarregamento_set.all():
-                if getattr(nota, 'financeiro', None):
-                    nota.financeiro.atualizar_status()
+            nota_ids = list(self.notacarregamento_set.values_list('pk', flat=True))
+            if not RecomputeService.request(nota_ids):
+                RecomputeService.recompute(nota_ids)
         except Exception:
             pass
 
@@ -275,17 +276,31 @@ class Pagamento(models.Model):
     )
     observacoes = models.TextField(blank=True, null=True)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    # Identificador do lançamento no extrato importado (FITID do OFX); evita importar o mesmo extrato duas vezes
+    id_transacao_bancaria = models.CharField(max_length=100, blank=True, null=True, db_index=True,
+                                             verbose_name="ID da Transação Bancária")
+
+    class Meta:
+        constraints = [
+            # Um lançamento do extrato paga cada registro uma única vez, mesmo com importações simultâneas
+            models.UniqueConstraint(fields=['registro_financeiro', 'id_transacao_bancaria'],
+                                    name='pagamento_transacao_bancaria_unica'),
+        ]
 
     def save(self, *args, **kwargs):
+        from prograos.services.recompute_service import RecomputeService
         super().save(*args, **kwargs)
         # Ao salvar, avisa o "pai" (RegistroFinanceiro) para se atualizar.
-        self.registro_financeiro.atualizar_status()
+        if not RecomputeService.request(registro_ids=[self.registro_financeiro_id]):
+            self.registro_financeiro.atualizar_status()
 
     def delete(self, *args, **kwargs):
+        from prograos.services.recompute_service import RecomputeService
         registro = self.registro_financeiro
         super().delete(*args, **kwargs)
         # Ao deletar, também avisa o "pai" para se atualizar.
-        registro.atualizar_status()
+        if not RecomputeService.request(registro_ids=[registro.pk]):
+            registro.atualizar_status()
 
     def __str__(self):
         return f"Pagamento de R$ {self.valor} para a Nota #{self.registro_financeiro.nota.id}"
@@ -298,6 +313,34 @@ class Pagamento(models.Model):
     )
 
 
+class MonthlyKpi(models.Model):
+    """
+    Totais das notas de um usuário por mês (mês local de data_criacao), mantidos
+    por signals (ver services/kpi_rollup.py) para que o dashboard e o relatório
+    mensal não varram o histórico a cada acesso.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='monthly_kpis')
+    month = models.DateField(verbose_name="Mês")  # Primeiro dia do mês
+
+    notas = models.PositiveIntegerField(default=0)
+    # quantidade_sacos (3 casas) x preco_por_saco (2 casas), sem arredondar
+    receita = models.DecimalField(max_digits=21, decimal_places=5, default=Decimal('0.00'))
+    custo = models.DecimalField(max_digits=18, decimal_places=2, default=Decimal('0.00'))
+    frete = models.DecimalField(max_digits=18, decimal_places=2, default=Decimal('0.00'))
+    pago = models.PositiveIntegerField(default=0)
+    parcial = models.PositiveIntegerField(default=0)
+    pendente = models.PositiveIntegerField(default=0)
+    soja = models.PositiveIntegerField(default=0)
+    milho = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['user', 'month']
+        unique_together = [('user', 'month')]
+
+    def __str__(self):
+        return f"{self.user} - {self.month:%m/%Y} (R$ {self.receita})"
+
+
 class Invoice(models.Model):
     class Status(models.TextChoices):
         DRAFT = 'DRAFT', 'Rascunho'
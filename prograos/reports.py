@@ -1,12 +1,13 @@
 import io
 import pandas as pd
-from datetime import datetime
+from datetime import date, datetime
 from django.http import HttpResponse
 from reportlab.lib import colors
 from reportlab.lib.units import inch
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
-from .models import Amostra, NotaCarregamento, RegistroFinanceiro
+from .models import Amostra, MonthlyKpi, NotaCarregamento, RegistroFinanceiro
+from .services.kpi_rollup import KpiRollup
 from django.db.models import Sum, F, DecimalField, ExpressionWrapper
 from django.db.models.functions import Coalesce  # noqa
 from decimal import Decimal
@@ -212,7 +213,7 @@ class ReportGenerator:
         import os
         from django.conf import settings
         from num2words import num2words
-        from .models import CertificateConfig
+        from .certificate import CertificateCache
         from .signing.pdf_signer import PDFSigner
 
         buffer = io.BytesIO()
@@ -426,8 +427,8 @@ class ReportGenerator:
 
         # --- ASSINATURA DIGITAL (A1) ---
         try:
-            # Busca um certificado ativo
-            cert_config = CertificateConfig.objects.filter(is_active=True).first()
+            # Busca um certificado ativo (em cache no processo, sem consulta a cada recibo)
+            cert_config = CertificateCache.active_config()
             if cert_config:
                 # logger.info(f"Assinando recibo {nota.id} com certificado: {cert_config.name}")
                 # Passa a posição Y calculada
@@ -732,20 +733,26 @@ class ReportGenerator:
         )
 
         # Totals
-        receita_expr = ExpressionWrapper(
-            F('quantidade_sacos') * F('preco_por_saco'),
-            output_field=DecimalField(max_digits=18, decimal_places=2),
-        )
+        if date(year, month, 1) < KpiRollup.current_month():
+            # Closed month: totals from the MonthlyKpi rollup
+            kpi = MonthlyKpi.objects.filter(user=user, month=date(year, month, 1)).first()
+            total_receita = kpi.receita if kpi else Decimal('0.00')
+            total_custo = kpi.custo if kpi else Decimal('0.00')
+        else:
+            receita_expr = ExpressionWrapper(
+                F('quantidade_sacos') * F('preco_por_saco'),
+                output_field=DecimalField(max_digits=18, decimal_places=2),
+            )
 
-        total_receita = transactions.aggregate(total=Sum(receita_expr))['total'] or Decimal('0.00')
+            total_receita = transactions.aggregate(total=Sum(receita_expr))['total'] or Decimal('0.00')
 
-        # qt_notas = transactions.count()
+            # qt_notas = transactions.count()
 
-        total_custo = (
-            RegistroFinanceiro.objects
-            .filter(nota__in=transactions)
-            .aggregate(total=Sum('valor_custo_total'))['total'] or Decimal('0.00')
-        )
+            total_custo = (
+                RegistroFinanceiro.objects
+                .filter(nota__in=transactions)
+                .aggregate(total=Sum('valor_custo_total'))['total'] or Decimal('0.00')
+            )
 
         # total_frete = (
         #     RegistroFinanceiro.objects
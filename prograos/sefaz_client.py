@@ -3,6 +3,7 @@ SEFAZ Client for NF-e Webservice Communication
 Handles all communication with SEFAZ webservices in MA (Maranhão)
 """
 import requests
+from requests.adapters import HTTPAdapter
 from lxml import etree
 from datetime import datetime
 import logging
@@ -31,6 +32,25 @@ SEFAZ_WEBSERVICES = {
 }
 
 
+class ClientCertificateAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose connections use a given SSLContext, e.g. one with the A1
+    client certificate loaded (requests' cert= only takes file paths)
+    """
+
+    def __init__(self, ssl_context, **kwargs):
+        self.ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['ssl_context'] = self.ssl_context
+        return super().init_poolmanager(*args, **kwargs)
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        proxy_kwargs['ssl_context'] = self.ssl_context
+        return super().proxy_manager_for(proxy, **proxy_kwargs)
+
+
 class SefazClient:
     """
     Client for communicating with SEFAZ webservices
@@ -86,21 +106,18 @@ class SefazClient:
         }
 
         try:
-            # Get certificate for SSL
-            cert_pem = None
-            key_pem = None
-            if self.certificate_manager:
-                cert_pem = self.certificate_manager.get_cert_pem()
-                key_pem = self.certificate_manager.get_key_pem()
-
-            # Make request
-            response = requests.post(
-                url,
-                data=soap_env,
-                headers=headers,
-                cert=(cert_pem, key_pem) if cert_pem else None,
-                timeout=30
-            )
+            # Get certificate for SSL (the cached context of the certificate, nothing on disk)
+            with requests.Session() as session:
+                if self.certificate_manager:
+                    session.mount('https://', ClientCertificateAdapter(self.certificate_manager.get_ssl_context()))
+
+                # Make request
+                response = session.post(
+                    url,
+                    data=soap_env,
+                    headers=headers,
+                    timeout=30
+                )
 
             response.raise_for_status()
 
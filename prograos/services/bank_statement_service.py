@@ -0,0 +1,311 @@
+import csv
+import hashlib
+import io
+import re
+import unicodedata
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from prograos.models import Pagamento, RegistroFinanceiro
+from prograos.services.recompute_service import RecomputeService
+
+# A payment is matched to notas created up to DAYS_AFTER days before it (or DAYS_BEFORE days after: advances)
+DAYS_BEFORE = 7
+DAYS_AFTER = 120
+DOCUMENT_RE = re.compile(r'(?<!\d)(\d{3}\.?\d{3}\.?\d{3}-?\d{2}|\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2})(?!\d)')
+CSV_COLUMNS = {
+    'date': ('data', 'date', 'data lancamento', 'data do lancamento'),
+    'amount': ('valor', 'amount', 'valor (r$)'),
+    'document': ('documento', 'cpf/cnpj', 'cpf_cnpj', 'cpf', 'cnpj'),
+    'description': ('descricao', 'historico', 'description', 'lancamento'),
+    'transaction_id': ('id', 'identificador', 'fitid', 'id transacao'),
+}
+
+REASON_NO_MATCH = "Nenhuma nota em aberto compatível"
+REASON_AMBIGUOUS = "Valor corresponde a mais de uma nota em aberto"
+
+
+@dataclass
+class StatementLine:
+    date: date
+    amount: Decimal  # Credits are positive
+    document: str  # CPF/CNPJ digits of the payer, '' when the statement does not show it
+    description: str
+    transaction_id: str
+
+
+@dataclass
+class ImportResult:
+    lines: int = 0
+    created: int = 0
+    amount: Decimal = Decimal('0.00')
+    duplicates: int = 0
+    debits: int = 0
+    notas: set = field(default_factory=set)
+    unmatched: list = field(default_factory=list)  # (line, reason)
+    leftovers: list = field(default_factory=list)  # (line, amount not allocated to any nota)
+
+
+def only_digits(value) -> str:
+    return re.sub(r'\D', '', value or '')
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode()
+    return ' '.join(text.lower().split())
+
+
+def _amount(text: str) -> Decimal:
+    """'1.234,56', '-1234.56', 'R$ 50' -> Decimal."""
+    text = (text or '').replace('R$', '').replace(' ', '').strip()
+    if ',' in text:
+        text = text.replace('.', '').replace(',', '.')
+    try:
+        return Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f"Valor inválido no extrato: {text!r}")
+
+
+def _date(text: str) -> date:
+    for fmt in ('%d/%m/%Y', '%Y-%m-%d', '%d/%m/%y'):
+        try:
+            return datetime.strptime(text.strip(), fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f"Data inválida no extrato: {text!r}")
+
+
+def _decode(data: bytes) -> str:
+    try:
+        return data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return data.decode('cp1252')  # OFX files of Brazilian banks are usually CHARSET:1252
+
+
+def _line_ids(lines):
+    """Fills transaction_id of lines without one with a hash of their content (and repetition within the file)."""
+    seen = defaultdict(int)
+    for line in lines:
+        if line.transaction_id:
+            continue
+        key = f"{line.date}|{line.amount}|{line.document}|{line.description}"
+        seen[key] += 1
+        line.transaction_id = 'csv:' + hashlib.sha1(f"{key}#{seen[key]}".encode()).hexdigest()[:32]
+    return lines
+
+
+def parse_csv(text: str) -> list:
+    """
+    Statement lines of a CSV export with a header row (data, valor and
+    optionally documento, descricao, id); ';' or ',' separated, amounts in
+    either 1.234,56 or 1234.56 notation.
+    """
+    sample = text[:4096]
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=';,\t')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(io.StringIO(text), dialect)
+    header = [_normalize(name) for name in next(reader, [])]
+
+    columns = {}
+    for name, aliases in CSV_COLUMNS.items():
+        columns[name] = next((header.index(alias) for alias in aliases if alias in header), None)
+    if columns['date'] is None or columns['amount'] is None:
+        raise ValueError("O CSV precisa das colunas 'data' e 'valor'")
+
+    def column(row, name):
+        index = columns[name]
+        return row[index].strip() if index is not None and index < len(row) else ''
+
+    lines = []
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        description = column(row, 'description')
+        lines.append(StatementLine(
+            date=_date(column(row, 'date')),
+            amount=_amount(column(row, 'amount')),
+            document=only_digits(column(row, 'document')) or _document_in(description),
+            description=description,
+            transaction_id=column(row, 'transaction_id'),
+        ))
+    return _line_ids(lines)
+
+
+def _document_in(text: str) -> str:
+    match = DOCUMENT_RE.search(text or '')
+    return only_digits(match.group(1)) if match else ''
+
+
+def parse_ofx(text: str) -> list:
+    """Statement lines of the <STMTTRN> entries of an OFX file (SGML 1.x or XML 2.x)."""
+    lines = []
+    for block in re.findall(r'<STMTTRN>(.*?)</STMTTRN>', text, re.S | re.I):
+        tags = {name.upper(): value.strip() for name, value in re.findall(r'<(\w+)>([^<\r\n]*)', block)}
+        if 'DTPOSTED' not in tags or 'TRNAMT' not in tags:
+            continue
+        description = ' '.join(filter(None, (tags.get('NAME'), tags.get('MEMO'))))
+        lines.append(StatementLine(
+            date=datetime.strptime(tags['DTPOSTED'][:8], '%Y%m%d').date(),
+            amount=_amount(tags['TRNAMT']),
+            document=_document_in(description),
+            description=description,
+            transaction_id=f"ofx:{tags['FITID']}" if tags.get('FITID') else '',
+        ))
+    return _line_ids(lines)
+
+
+def parse_statement(data: bytes, filename: str = '') -> list:
+    """Parses an OFX or CSV bank statement (by extension, or by content when it has none)."""
+    text = _decode(data)
+    if filename.lower().endswith('.ofx') or '<OFX>' in text[:4096].upper():
+        return parse_ofx(text)
+    return parse_csv(text)
+
+
+class BankStatementImporter:
+    """
+    Reconciles the credits of a bank statement with the user's open
+    RegistroFinanceiro records and records them as Pagamento rows.
+
+    The open records are loaded once and indexed in memory by payer document
+    (CPF/CNPJ of the recebedor) and by amount still due, in cents. A credit
+    with a document pays that document's open notas in its date window: the
+    one whose balance it settles exactly or, failing that, the oldest first,
+    spilling over to the next ones. A credit without a known document is
+    matched by amount only when exactly one open nota in the window has that
+    balance. Lines already imported (same bank transaction id) are skipped.
+
+    The payments are written with one bulk_create and the affected records
+    recomputed once (RecomputeService), instead of one save per payment, in
+    the same transaction as the lookup, under a lock on the user's row.
+    """
+
+    def __init__(self, user, days_before: int = DAYS_BEFORE, days_after: int = DAYS_AFTER):
+        self.user = user
+        self.days_before = timedelta(days=days_before)
+        self.days_after = timedelta(days=days_after)
+        self.by_document = defaultdict(list)
+        self.by_amount = defaultdict(list)
+
+    def run(self, lines) -> ImportResult:
+        result = ImportResult(lines=len(lines))
+        with transaction.atomic():
+            # One import per user at a time: the lines already imported and the open balances read
+            # below stay current until the payments are written
+            list(get_user_model().objects.select_for_update().filter(pk=self.user.pk).values_list('pk', flat=True))
+            imported = set(
+                Pagamento.objects.filter(registro_financeiro__nota__created_by=self.user,
+                                         id_transacao_bancaria__in={line.transaction_id for line in lines})
+                .values_list('id_transacao_bancaria', flat=True)
+            )
+            self._index()
+            pagamentos = self._allocate(lines, imported, result)
+
+            # The unique (registro, transaction id) constraint still drops a payment written by another path
+            Pagamento.objects.bulk_create(pagamentos, batch_size=500, ignore_conflicts=True)
+            RecomputeService.recompute(result.notas)
+        result.created = len(pagamentos)
+        result.amount = sum((p.valor for p in pagamentos), Decimal('0.00'))
+        return result
+
+    def _allocate(self, lines, imported: set, result: ImportResult) -> list:
+        """Unsaved Pagamento rows for the credits that are not in imported, tallying the rest in result."""
+        pagamentos = []
+        for line in sorted(lines, key=lambda line: line.date):
+            if line.amount <= 0:
+                result.debits += 1
+                continue
+            if line.transaction_id in imported:
+                result.duplicates += 1
+                continue
+            imported.add(line.transaction_id)
+
+            allocation, reason = self._match(line)
+            if not allocation:
+                result.unmatched.append((line, reason))
+                continue
+
+            allocated = 0
+            for entry, cents in allocation:
+                self._pay(entry, cents)
+                allocated += cents
+                result.notas.add(entry['nota_id'])
+                pagamentos.append(self._pagamento(entry, line, cents))
+            if allocated < _cents(line.amount):
+                result.leftovers.append((line, Decimal(_cents(line.amount) - allocated) / 100))
+        return pagamentos
+
+    def _index(self):
+        rows = (
+            RegistroFinanceiro.objects
+            .filter(nota__created_by=self.user)
+            .exclude(status_pagamento=RegistroFinanceiro.StatusPagamento.PAGO)
+            .order_by('nota__data_criacao', 'pk')
+            .values_list('pk', 'nota_id', 'nota__valor_total', 'valor_pago', 'nota__cpf_cnpj_recebedor',
+                         'nota__data_criacao')
+        )
+        for pk, nota_id, valor_total, valor_pago, document, data_criacao in rows:
+            due = _cents(valor_total or 0) - _cents(valor_pago or 0)
+            if due <= 0:
+                continue
+            entry = {'pk': pk, 'nota_id': nota_id, 'due': due, 'date': timezone.localtime(data_criacao).date()}
+            if only_digits(document):
+                self.by_document[only_digits(document)].append(entry)
+            self.by_amount[due].append(entry)
+
+    def _in_window(self, entry, line) -> bool:
+        return entry['date'] - self.days_before <= line.date <= entry['date'] + self.days_after
+
+    def _match(self, line):
+        """[(entry, cents)] the line pays, or ([], reason)."""
+        cents = _cents(line.amount)
+        candidates = [e for e in self.by_document.get(line.document, ()) if e['due'] > 0 and self._in_window(e, line)]
+        if candidates:
+            exact = next((e for e in candidates if e['due'] == cents), None)
+            if exact:
+                return [(exact, cents)], None
+            allocation = []
+            for entry in candidates:
+                part = min(cents, entry['due'])
+                allocation.append((entry, part))
+                cents -= part
+                if not cents:
+                    break
+            return allocation, None
+
+        candidates = [e for e in self.by_amount.get(cents, ()) if self._in_window(e, line)]
+        if len(candidates) == 1:
+            return [(candidates[0], cents)], None
+        return [], REASON_AMBIGUOUS if candidates else REASON_NO_MATCH
+
+    def _pay(self, entry, cents: int):
+        self.by_amount[entry['due']].remove(entry)
+        entry['due'] -= cents
+        if entry['due'] > 0:
+            self.by_amount[entry['due']].append(entry)
+
+    def _pagamento(self, entry, line, cents: int) -> Pagamento:
+        description = line.description or ''
+        metodo = Pagamento.MetodoPagamento.BOLETO if 'BOLETO' in description.upper() else Pagamento.MetodoPagamento.PIX
+        return Pagamento(
+            registro_financeiro_id=entry['pk'],
+            valor=Decimal(cents) / 100,
+            # Statements only carry the day; noon keeps it on the same day in any timezone conversion
+            data_pagamento=timezone.make_aware(datetime.combine(line.date, time(12))),
+            metodo_pagamento=metodo,
+            observacoes=f"Importado do extrato: {description}".strip(),
+            created_by=self.user,
+            id_transacao_bancaria=line.transaction_id,
+        )
+
+
+def _cents(value) -> int:
+    return int((Decimal(value) * 100).to_integral_value())
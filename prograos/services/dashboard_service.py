@@ -1,11 +1,11 @@
-from django.db.models import Sum, Count, F, ExpressionWrapper, DecimalField
-from django.db.models.functions import TruncMonth, Coalesce
+from django.db.models import Count, Q
 from django.utils import timezone
-from datetime import datetime
+from datetime import date, datetime
 import json
-from decimal import Decimal
 
 from prograos.models import Amostra, PesagemCaminhao, NotaCarregamento, RegistroFinanceiro
+from prograos.services.kpi_engine import GRAO_KEYS, STATUS_KEYS, KpiEngine
+from prograos.services.kpi_rollup import KpiRollup, month_start
 
 
 class DashboardService:
@@ -17,9 +17,14 @@ class DashboardService:
         context = {}
 
         # Counts
-        context["total_amostras"] = Amostra.objects.filter(created_by=user).count()
-        context["amostras_aceitas"] = Amostra.objects.filter(created_by=user, status="ACEITA").count()
-        context["amostras_rejeitadas"] = Amostra.objects.filter(created_by=user, status="REJEITADA").count()
+        counts = Amostra.objects.filter(created_by=user).aggregate(
+            total=Count('id'),
+            aceitas=Count('id', filter=Q(status="ACEITA")),
+            rejeitadas=Count('id', filter=Q(status="REJEITADA")),
+        )
+        context["total_amostras"] = counts['total']
+        context["amostras_aceitas"] = counts['aceitas']
+        context["amostras_rejeitadas"] = counts['rejeitadas']
 
         # Recents
         context["ultimas_pesagens"] = PesagemCaminhao.objects.filter(created_by=user).order_by("-data_final")[:5]
@@ -37,58 +42,47 @@ class DashboardService:
     def get_kpis_and_charts(user, request_GET):
         """
         Calculates KPIs, Charts data, and Monthly report data.
+        Closed months are read from the MonthlyKpi rollup; the current month
+        (series, mixes and selected-month KPIs) comes from a single grouped
+        query (KpiEngine.monthly_rows), whatever the history length.
         """
         context = {}
 
-        # Expressions
-        receita_expr = ExpressionWrapper(
-            F('quantidade_sacos') * F('preco_por_saco'),
-            output_field=DecimalField(max_digits=18, decimal_places=2),
-        )
-
-        # Aggregations by Month
-        notas_agg = (
-            NotaCarregamento.objects
-            .filter(created_by=user)
-            .annotate(m=TruncMonth('data_criacao'))
-            .values('m')
-            .annotate(receita=Sum(receita_expr))
-            .order_by('m')
-        )
-
-        custos_agg = (
-            RegistroFinanceiro.objects
-            .filter(nota__created_by=user)
-            .annotate(m=TruncMonth('nota__data_criacao'))
-            .values('m')
-            .annotate(custo=Sum('valor_custo_total'))
-            .order_by('m')
-        )
+        # Monthly Selection Logic
+        today = timezone.now().date()
+        try:
+            selected_month = int(request_GET.get('month', today.month))
+            selected_year = int(request_GET.get('year', today.year))
+        except ValueError:
+            selected_month = today.month
+            selected_year = today.year
 
-        frete_agg = (
-            RegistroFinanceiro.objects
-            .filter(nota__created_by=user)
-            .annotate(m=TruncMonth('nota__data_criacao'))
-            .values('m')
-            .annotate(frete=Sum(Coalesce('nota__pesagem__frete_total_calculado', Decimal(0.0)), output_field=DecimalField()))
-            .order_by('m')
-        )
+        import calendar
+        _, last_day = calendar.monthrange(selected_year, selected_month)
+        start_date = datetime(selected_year, selected_month, 1)
+        end_date = datetime(selected_year, selected_month, last_day, 23, 59, 59)
 
-        receita_by_month = {row['m']: float(row['receita'] or 0) for row in notas_agg}
-        custo_by_month = {row['m']: float(row['custo'] or 0) for row in custos_agg}
-        frete_by_month = {row['m']: float(row['frete'] or 0) for row in frete_agg}
+        if timezone.is_aware(timezone.now()):
+            current_timezone = timezone.get_current_timezone()
+            start_date = timezone.make_aware(start_date, current_timezone)
+            end_date = timezone.make_aware(end_date, current_timezone)
 
-        all_months = sorted(set(list(receita_by_month.keys()) +
-                            list(custo_by_month.keys()) + list(frete_by_month.keys())))
+        current_month = KpiRollup.current_month()
+        selected_first = date(selected_year, selected_month, 1)
+        closed_rows = KpiRollup.closed_rows(user, current_month)
+        live_rows = KpiEngine.monthly_rows(user, start_date, end_date, since=month_start(current_month))
+        rows = closed_rows + live_rows
 
         def label_pt(dt):
             meses = ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun', 'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
             return f"{meses[dt.month-1]}/{str(dt.year)[-2:]}"
 
+        # Series by Month
+        all_months = [row['m'] for row in rows]
         monthly_labels = [label_pt(m) for m in all_months]
-        monthly_receita = [receita_by_month.get(m, 0.0) for m in all_months]
-        monthly_custo = [custo_by_month.get(m, 0.0) for m in all_months]
-        monthly_frete = [frete_by_month.get(m, 0.0) for m in all_months]
+        monthly_receita = [float(row['receita'] or 0) for row in rows]
+        monthly_custo = [float(row['custo'] or 0) for row in rows]
+        monthly_frete = [float(row['frete'] or 0) for row in rows]
 
         monthly_custo_base = [c - f for c, f in zip(monthly_custo, monthly_frete)]
         monthly_lucro = [r - c for r, c in zip(monthly_receita, monthly_custo)]
@@ -102,46 +96,23 @@ class DashboardService:
         context['monthly_frete_json'] = json.dumps(monthly_frete, ensure_ascii=False)
 
         # Mix & Status
-        status_counts_map = {'PAGO': 0, 'PARCIAL': 0, 'PENDENTE': 0}
-        for row in (RegistroFinanceiro.objects.filter(nota__created_by=user).values('status_pagamento').annotate(c=Count('id'))):
-            key = (row['status_pagamento'] or '').upper()
-            if key in status_counts_map:
-                status_counts_map[key] = row['c'] or 0
-        context['status_pagamentos_json'] = json.dumps(status_counts_map, ensure_ascii=False)
-
-        mix_map = {'SOJA': 0, 'MILHO': 0}
-        for row in (NotaCarregamento.objects.filter(created_by=user).values('tipo_grao').annotate(c=Count('id'))):
-            tg = (row['tipo_grao'] or '').upper()
-            if tg in mix_map:
-                mix_map[tg] = row['c'] or 0
-        context['mix_graos_json'] = json.dumps(mix_map, ensure_ascii=False)
-
-        # Monthly Selection Logic
-        today = timezone.now().date()
-        try:
-            selected_month = int(request_GET.get('month', today.month))
-            selected_year = int(request_GET.get('year', today.year))
-        except ValueError:
-            selected_month = today.month
-            selected_year = today.year
+        status_counts = KpiEngine.totals(rows, [key.lower() for key in STATUS_KEYS])
+        context['status_pagamentos_json'] = json.dumps(
+            {key: status_counts[key.lower()] for key in STATUS_KEYS}, ensure_ascii=False)
 
-        import calendar
-        _, last_day = calendar.monthrange(selected_year, selected_month)
-        start_date = datetime(selected_year, selected_month, 1)
-        end_date = datetime(selected_year, selected_month, last_day, 23, 59, 59)
-
-        if timezone.is_aware(timezone.now()):
-            current_timezone = timezone.get_current_timezone()
-            start_date = timezone.make_aware(start_date, current_timezone)
-            end_date = timezone.make_aware(end_date, current_timezone)
+        mix = KpiEngine.totals(rows, [grao.lower() for grao in GRAO_KEYS])
+        context['mix_graos_json'] = json.dumps({grao: mix[grao.lower()] for grao in GRAO_KEYS}, ensure_ascii=False)
 
         # KPIs for Selected Month
-        receita_month = NotaCarregamento.objects.filter(created_by=user, data_criacao__range=(
-            start_date, end_date)).aggregate(total=Sum(receita_expr)).get('total') or 0
-        custo_month = RegistroFinanceiro.objects.filter(nota__created_by=user, nota__data_criacao__range=(
-            start_date, end_date)).aggregate(total=Sum('valor_custo_total')).get('total') or 0
-        frete_month = RegistroFinanceiro.objects.filter(nota__created_by=user, nota__data_criacao__range=(start_date, end_date)).aggregate(
-            total=Sum(Coalesce('nota__pesagem__frete_total_calculado', Decimal(0.0)), output_field=DecimalField())).get('total') or 0
+        if selected_first < current_month:
+            periodo = KpiEngine.totals([row for row in closed_rows if row['m'] == selected_first],
+                                       ['receita', 'custo', 'frete'])
+            receita_month, custo_month, frete_month = periodo['receita'], periodo['custo'], periodo['frete']
+        else:
+            periodo = KpiEngine.totals(live_rows, ['periodo_receita', 'periodo_custo', 'periodo_frete'])
+            receita_month = periodo['periodo_receita']
+            custo_month = periodo['periodo_custo']
+            frete_month = periodo['periodo_frete']
         lucro_month = float(receita_month) - float(custo_month)
 
         context['kpis_json'] = json.dumps({
@@ -157,11 +128,8 @@ class DashboardService:
             start_date, end_date)).select_related('pesagem', 'financeiro').order_by('-data_criacao')
 
         # Available Months Dropdown
-        available_months_qs = NotaCarregamento.objects.filter(created_by=user).annotate(
-            m=TruncMonth('data_criacao')).values('m').distinct().order_by('-m')
         available_months = []
-        for item in available_months_qs:
-            dt = item['m']
+        for dt in reversed(all_months):
             if dt:
                 available_months.append({
                     'value': f"{dt.year}-{dt.month}",
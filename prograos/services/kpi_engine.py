@@ -0,0 +1,76 @@
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+
+from prograos.models import NotaCarregamento, RegistroFinanceiro
+
+STATUS_KEYS = {
+    'PAGO': RegistroFinanceiro.StatusPagamento.PAGO,
+    'PARCIAL': RegistroFinanceiro.StatusPagamento.PARCIAL,
+    'PENDENTE': RegistroFinanceiro.StatusPagamento.PENDENTE,
+}
+GRAO_KEYS = ('SOJA', 'MILHO')
+# Monthly totals, as annotated by KpiEngine.monthly_rows and stored in MonthlyKpi
+TOTAL_FIELDS = ('notas', 'receita', 'custo', 'frete', 'pago', 'parcial', 'pendente', 'soja', 'milho')
+
+RECEITA_EXPR = ExpressionWrapper(
+    F('quantidade_sacos') * F('preco_por_saco'),
+    output_field=DecimalField(max_digits=18, decimal_places=2),
+)
+# Only notas with a RegistroFinanceiro carry cost and freight
+COM_FINANCEIRO = Q(financeiro__isnull=False)
+
+
+def _frete(condition):
+    return Sum(Coalesce('pesagem__frete_total_calculado', Decimal(0.0)), filter=condition, output_field=DecimalField())
+
+
+class KpiEngine:
+    @staticmethod
+    def monthly_rows(user, start=None, end=None, since=None, until=None):
+        """
+        One row per month with notas of the user, in a single grouped query
+        over NotaCarregamento joined to its financeiro and pesagem (neither
+        join repeats a nota): receita, custo, frete, the payment status and
+        grain counts and, when start is given, the receita/custo/frete of the
+        notas created within [start, end] as periodo_receita/periodo_custo/
+        periodo_frete. since/until restrict the rows to notas created in
+        [since, until).
+        """
+        notas = NotaCarregamento.objects.filter(created_by=user)
+        if since is not None:
+            notas = notas.filter(data_criacao__gte=since)
+        if until is not None:
+            notas = notas.filter(data_criacao__lt=until)
+
+        annotations = {
+            'notas': Count('id'),
+            'receita': Sum(RECEITA_EXPR),
+            'custo': Sum('financeiro__valor_custo_total'),
+            'frete': _frete(COM_FINANCEIRO),
+        }
+        if start is not None:
+            periodo = Q(data_criacao__range=(start, end))
+            annotations.update(
+                periodo_receita=Sum(RECEITA_EXPR, filter=periodo),
+                periodo_custo=Sum('financeiro__valor_custo_total', filter=periodo),
+                periodo_frete=_frete(COM_FINANCEIRO & periodo),
+            )
+        for key, status in STATUS_KEYS.items():
+            annotations[key.lower()] = Count('financeiro', filter=Q(financeiro__status_pagamento=status))
+        for grao in GRAO_KEYS:
+            annotations[grao.lower()] = Count('id', filter=Q(tipo_grao=grao))
+
+        return list(
+            notas
+            .annotate(m=TruncMonth('data_criacao'))
+            .values('m')
+            .annotate(**annotations)
+            .order_by('m')
+        )
+
+    @staticmethod
+    def totals(rows, fields):
+        """Sums fields over rows (None counts as 0)."""
+        return {field: sum((row[field] or 0 for row in rows), 0) for field in fields}
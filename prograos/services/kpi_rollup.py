@@ -0,0 +1,126 @@
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from prograos.models import MonthlyKpi, NotaCarregamento
+from prograos.services.kpi_engine import TOTAL_FIELDS, KpiEngine
+
+# Decimal places of the MonthlyKpi money fields
+PLACES = {'receita': Decimal('0.00001'), 'custo': Decimal('0.01'), 'frete': Decimal('0.01')}
+
+
+def month_of(dt) -> date:
+    """First day of the month of dt, in the current timezone."""
+    if timezone.is_aware(dt):
+        dt = timezone.localtime(dt)
+    return date(dt.year, dt.month, 1)
+
+
+def month_start(month: date):
+    """Midnight of month's first day, as the datetime data_criacao is compared with."""
+    start = datetime(month.year, month.month, 1)
+    return timezone.make_aware(start) if settings.USE_TZ else start
+
+
+def next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def kpi_keys(notas) -> set:
+    """(user id, month) of each (created_by_id, data_criacao) pair."""
+    return {(user_id, month_of(data_criacao)) for user_id, data_criacao in notas if data_criacao is not None}
+
+
+def _totals(row) -> dict:
+    totals = {field: row[field] or 0 for field in TOTAL_FIELDS}
+    for field, places in PLACES.items():
+        totals[field] = Decimal(totals[field]).quantize(places)
+    return totals
+
+
+class KpiRollup:
+    """
+    MonthlyKpi rows, one per (user, month) with notas. The signals refresh the
+    months a change touches with one KpiEngine query per user; closed months
+    are then read from the table instead of being aggregated again.
+    """
+
+    @staticmethod
+    def current_month() -> date:
+        return month_of(timezone.now())
+
+    @staticmethod
+    def refresh(keys):
+        """Recomputes the MonthlyKpi rows of the given (user id, month) pairs; notas without a user are not rolled up."""
+        months_by_user = defaultdict(set)
+        for user_id, month in keys:
+            if user_id is not None:
+                months_by_user[user_id].add(month)
+
+        with transaction.atomic():
+            for user_id, months in months_by_user.items():
+                rows = {
+                    month_of(row['m']): row
+                    for row in KpiEngine.monthly_rows(user_id, since=month_start(min(months)),
+                                                      until=month_start(next_month(max(months))))
+                }
+                for month in months:
+                    if month in rows:
+                        MonthlyKpi.objects.update_or_create(user_id=user_id, month=month,
+                                                            defaults=_totals(rows[month]))
+                    else:
+                        MonthlyKpi.objects.filter(user_id=user_id, month=month).delete()
+
+    @staticmethod
+    def closed_rows(user, before: date) -> list:
+        """Stored rows of the months before before, in the layout of KpiEngine.monthly_rows (m = month)."""
+        return [
+            {'m': row.pop('month'), **row}
+            for row in MonthlyKpi.objects.filter(user=user, month__lt=before).order_by('month')
+            .values('month', *TOTAL_FIELDS)
+        ]
+
+    @staticmethod
+    def expected() -> dict:
+        """{(user id, month): totals} computed from scratch, one grouped query per user."""
+        user_ids = (NotaCarregamento.objects.exclude(created_by=None).order_by()
+                    .values_list('created_by', flat=True).distinct())
+        return {
+            (user_id, month_of(row['m'])): _totals(row)
+            for user_id in user_ids
+            for row in KpiEngine.monthly_rows(user_id)
+        }
+
+    @staticmethod
+    def stored() -> dict:
+        return {
+            (row.pop('user_id'), row.pop('month')): row
+            for row in MonthlyKpi.objects.values('user_id', 'month', *TOTAL_FIELDS)
+        }
+
+    @staticmethod
+    def rebuild() -> int:
+        """Recomputes the whole table; returns the number of rows written."""
+        expected = KpiRollup.expected()
+        with transaction.atomic():
+            MonthlyKpi.objects.all().delete()
+            MonthlyKpi.objects.bulk_create([
+                MonthlyKpi(user_id=user_id, month=month, **totals)
+                for (user_id, month), totals in expected.items()
+            ])
+        return len(expected)
+
+    @staticmethod
+    def verify() -> list:
+        """Returns (key, expected, stored) for every (user id, month) where the table drifted."""
+        expected = KpiRollup.expected()
+        stored = KpiRollup.stored()
+        return [
+            (key, expected.get(key), stored.get(key))
+            for key in sorted(set(expected) | set(stored))
+            if expected.get(key) != stored.get(key)
+        ]
@@ -0,0 +1,143 @@
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from prograos.models import NotaCarregamento, Pagamento, RegistroFinanceiro
+from prograos.services.kpi_rollup import KpiRollup, kpi_keys
+
+ZERO = Value(Decimal('0.00'))
+CENT = Decimal('0.01')
+BATCH_SIZE = 500
+FIELDS = ('valor_pago', 'valor_custo_total', 'lucro', 'status_pagamento')
+Status = RegistroFinanceiro.StatusPagamento
+
+_state = threading.local()
+
+
+def _financeiro(pago, valor_total, sacos, pesagem_id, custo_por_saco, frete) -> tuple:
+    """FIELDS of one RegistroFinanceiro, as RegistroFinanceiro.atualizar_status computes and stores them."""
+    custo = Decimal('0.00')
+    if pesagem_id is not None:
+        if custo_por_saco is not None:
+            custo += custo_por_saco * sacos
+        if frete is not None:
+            custo += frete
+    lucro = valor_total - custo if valor_total is not None else None
+
+    if valor_total is not None and pago >= valor_total:
+        status = Status.PAGO
+    elif pago > Decimal('0.00'):
+        status = Status.PARCIAL
+    else:
+        status = Status.PENDENTE
+    # DecimalField rounds half-even to its 2 places on save
+    return pago, custo.quantize(CENT), lucro.quantize(CENT) if lucro is not None else None, status
+
+
+class RecomputeService:
+    """
+    Refreshes valor_pago, valor_custo_total, lucro and status_pagamento of any
+    set of notas to the values RegistroFinanceiro.atualizar_status computes,
+    with one SELECT per batch of notas (pagamentos summed in a subquery, nota
+    and pesagem joined) and one bulk UPDATE of the rows that changed.
+    The arithmetic stays in Decimal: SQL would round half-cents differently.
+
+    Within deferred(), the Pagamento and PesagemCaminhao save hooks and the
+    MonthlyKpi signals only collect the notas and months they touch; all of
+    them are recomputed once when the block ends.
+    """
+
+    @staticmethod
+    def recompute(nota_ids) -> int:
+        """Updates the RegistroFinanceiro of the given notas and their MonthlyKpi months; returns the rows updated."""
+        nota_ids = set(nota_ids)
+        with transaction.atomic():
+            updated = RecomputeService._update(nota_ids)
+            # bulk_update sends no signals
+            RecomputeService.refresh_kpis(RecomputeService._kpi_keys(nota_ids))
+        return updated
+
+    @staticmethod
+    def _update(nota_ids) -> int:
+        nota_ids = sorted(nota_ids)
+        pagos = (
+            Pagamento.objects.filter(registro_financeiro=OuterRef('pk')).order_by()
+            .values('registro_financeiro').annotate(total=Sum('valor')).values('total')
+        )
+        updated = 0
+        for i in range(0, len(nota_ids), BATCH_SIZE):
+            rows = (
+                RegistroFinanceiro.objects.filter(nota_id__in=nota_ids[i:i + BATCH_SIZE])
+                .annotate(total_pago=Coalesce(Subquery(pagos), ZERO))
+                .values_list('pk', 'total_pago', 'nota__valor_total', 'nota__quantidade_sacos', 'nota__pesagem_id',
+                             'nota__pesagem__valor_custo_por_saco', 'nota__pesagem__frete_total_calculado', *FIELDS)
+            )
+            changed = []
+            for pk, pago, valor_total, sacos, pesagem_id, custo_por_saco, frete, *current in rows:
+                values = _financeiro(pago, valor_total, sacos, pesagem_id, custo_por_saco, frete)
+                if values != tuple(current):
+                    changed.append(RegistroFinanceiro(pk=pk, **dict(zip(FIELDS, values))))
+            RegistroFinanceiro.objects.bulk_update(changed, FIELDS)
+            updated += len(changed)
+        return updated
+
+    @staticmethod
+    def _kpi_keys(nota_ids) -> set:
+        if not nota_ids:
+            return set()
+        return kpi_keys(NotaCarregamento.objects.filter(pk__in=nota_ids).values_list('created_by_id', 'data_criacao'))
+
+    @staticmethod
+    def is_deferred() -> bool:
+        return getattr(_state, 'pending', None) is not None
+
+    @staticmethod
+    @contextmanager
+    def deferred():
+        """
+        Atomic block in which the recomputations asked through request and
+        refresh_kpis are kept pending and run once, when the outermost block
+        exits. Nested blocks join the outer one.
+        """
+        if RecomputeService.is_deferred():
+            yield
+            return
+
+        _state.pending = {'notas': set(), 'registros': set(), 'kpis': set()}
+        try:
+            with transaction.atomic():
+                yield
+                pending = _state.pending
+                _state.pending = None
+                nota_ids = pending['notas'] | set(
+                    RegistroFinanceiro.objects.filter(pk__in=pending['registros']).values_list('nota_id', flat=True)
+                )
+                RecomputeService._update(nota_ids)
+                KpiRollup.refresh(pending['kpis'] | RecomputeService._kpi_keys(nota_ids))
+        finally:
+            _state.pending = None
+
+    @staticmethod
+    def request(nota_ids=(), registro_ids=()) -> bool:
+        """
+        Defers the recomputation of the notas (given directly or through their
+        RegistroFinanceiro ids) to the active deferred() block; returns False
+        when there is none.
+        """
+        if not RecomputeService.is_deferred():
+            return False
+        _state.pending['notas'].update(nota_ids)
+        _state.pending['registros'].update(registro_ids)
+        return True
+
+    @staticmethod
+    def refresh_kpis(keys):
+        """KpiRollup.refresh, deferred to the end of the active deferred() block."""
+        if RecomputeService.is_deferred():
+            _state.pending['kpis'].update(keys)
+        else:
+            KpiRollup.refresh(keys)
@@ -1,6 +1,9 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
-from .models import NotaCarregamento, RegistroFinanceiro
+from .certificate import CertificateCache
+from .models import CertificateConfig, NotaCarregamento, PesagemCaminhao, RegistroFinanceiro
+from .services.kpi_rollup import kpi_keys
+from .services.recompute_service import RecomputeService
 
 
 @receiver(post_save, sender=NotaCarregamento)
@@ -10,3 +13,56 @@ def criar_registro_financeiro_para_nota(sender, instance, created, **kwargs):
     """
     if created:
         RegistroFinanceiro.objects.create(nota=instance)
+
+
+@receiver(pre_save, sender=NotaCarregamento)
+def lembrar_mes_anterior_da_nota(sender, instance, **kwargs):
+    """
+    Guarda o usuário e a data gravados de uma nota editada, para que o post_save
+    também recalcule o mês de onde ela saiu.
+    """
+    instance._kpi_anterior = set()
+    if instance.pk:
+        instance._kpi_anterior = kpi_keys(
+            NotaCarregamento.objects.filter(pk=instance.pk).values_list('created_by_id', 'data_criacao')
+        )
+
+
+@receiver(post_save, sender=NotaCarregamento)
+@receiver(post_delete, sender=NotaCarregamento)
+def atualizar_kpi_da_nota(sender, instance, **kwargs):
+    keys = kpi_keys([(instance.created_by_id, instance.data_criacao)])
+    RecomputeService.refresh_kpis(keys | getattr(instance, '_kpi_anterior', set()))
+
+
+@receiver(post_save, sender=RegistroFinanceiro)
+@receiver(post_delete, sender=RegistroFinanceiro)
+def atualizar_kpi_do_financeiro(sender, instance, **kwargs):
+    """Custo e status mudam com os pagamentos e com a pesagem (ver RegistroFinanceiro.atualizar_status)."""
+    RecomputeService.refresh_kpis(kpi_keys(
+        NotaCarregamento.objects.filter(pk=instance.nota_id).values_list('created_by_id', 'data_criacao')
+    ))
+
+
+@receiver(pre_delete, sender=PesagemCaminhao)
+def lembrar_notas_da_pesagem(sender, instance, **kwargs):
+    """
+    As notas perdem a pesagem (SET_NULL) sem disparar signals: os meses delas são
+    guardados antes. (Ao salvar, PesagemCaminhao.save já recalcula as notas e o KPI.)
+    """
+    instance._kpi_notas = kpi_keys(instance.notacarregamento_set.values_list('created_by_id', 'data_criacao'))
+
+
+@receiver(post_delete, sender=PesagemCaminhao)
+def atualizar_kpi_da_pesagem_removida(sender, instance, **kwargs):
+    RecomputeService.refresh_kpis(getattr(instance, '_kpi_notas', set()))
+
+
+@receiver(post_save, sender=CertificateConfig)
+@receiver(post_delete, sender=CertificateConfig)
+def invalidar_cache_de_certificado(sender, instance, **kwargs):
+    """
+    Descarta o certificado carregado em cache e o certificado ativo, para que a
+    próxima assinatura use o arquivo e a senha atuais.
+    """
+    CertificateCache.invalidate(instance.pk)
@@ -20,7 +20,7 @@ class PDFSigner:
         Returns:
             bytes: The signed PDF content.
         """
-        # 1. Load Certificate and Key using CertificateManager
+        # 1. Load Certificate and Key using CertificateManager (decrypted once per config version, then cached)
         manager = CertificateManager(certificate_config)
 
         # This returns cryptography objects
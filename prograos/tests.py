@@ -1,13 +1,25 @@
 """
 unit tests for grain classification system
 """
+import io
 import json
+import ssl
+from datetime import datetime, timedelta
 from decimal import Decimal
+from django.db import IntegrityError, transaction
 from django.test import TestCase, Client
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.utils import timezone
 from unittest.mock import patch, MagicMock
-from .models import Amostra, ActivityLog
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from .certificate import CertificateCache, CertificateManager
+from .models import Amostra, ActivityLog, CertificateConfig, MonthlyKpi, NotaCarregamento, Pagamento, PesagemCaminhao, RegistroFinanceiro
+from .services.bank_statement_service import BankStatementImporter, parse_statement
+from .services.dashboard_service import DashboardService
+from .services.kpi_rollup import KpiRollup
+from .services.recompute_service import RecomputeService
 from .utils import GrainCalculator
 from .scale_integration import ScaleIntegration
 from .reports import ReportGenerator
@@ -461,6 +473,305 @@ class IntegrationTest(TestCase):
         self.assertContains(response, 'MILHO')
 
 
+class DashboardServiceTest(TestCase):
+    """tests for dashboard kpis and charts"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.pesagem = PesagemCaminhao.objects.create(
+            placa='ABC1234', tara=Decimal('1000'), peso_carregado=Decimal('7000'), tipo_grao='SOJA',
+            valor_custo_por_saco=Decimal('20.00'), valor_frete_por_tonelada=Decimal('10.00'),
+        )
+        pago = self.criar_nota(datetime(2024, 1, 10), 'SOJA', '10', '50.00', self.pesagem)
+        self.criar_nota(datetime(2024, 1, 20), 'MILHO', '4', '25.00')
+        parcial = self.criar_nota(datetime(2024, 3, 5), 'SOJA', '2', '100.00', self.pesagem)
+        Pagamento.objects.create(registro_financeiro=pago.financeiro, valor=Decimal('500.00'))
+        Pagamento.objects.create(registro_financeiro=parcial.financeiro, valor=Decimal('50.00'))
+
+    def criar_nota(self, data, tipo_grao, sacos, preco, pesagem=None):
+        nota = NotaCarregamento.objects.create(
+            nome_recebedor='Cliente', tipo_grao=tipo_grao, quantidade_sacos=Decimal(sacos),
+            preco_por_saco=Decimal(preco), created_by=self.user, pesagem=pesagem,
+        )
+        nota.data_criacao = timezone.make_aware(data)
+        nota.save(update_fields=['data_criacao'])
+        return nota
+
+    def test_series_and_kpis(self):
+        """tests monthly series, mixes and selected-month kpis"""
+        context = DashboardService.get_kpis_and_charts(self.user, {'month': '3', 'year': '2024'})
+
+        self.assertEqual(json.loads(context['monthly_labels_json']), ['Jan/24', 'Mar/24'])
+        self.assertEqual(json.loads(context['monthly_receita_json']), [600.0, 200.0])
+        self.assertEqual(json.loads(context['monthly_custo_json']), [260.0, 100.0])
+        self.assertEqual(json.loads(context['monthly_frete_json']), [60.0, 60.0])
+        self.assertEqual(json.loads(context['monthly_lucro_json']), [340.0, 100.0])
+        self.assertEqual(json.loads(context['status_pagamentos_json']), {'PAGO': 1, 'PARCIAL': 1, 'PENDENTE': 1})
+        self.assertEqual(json.loads(context['mix_graos_json']), {'SOJA': 2, 'MILHO': 1})
+        self.assertEqual(json.loads(context['kpis_json']), {
+            'receita_30': 200.0, 'custo_30': 100.0, 'lucro_30': 100.0, 'frete_30': 60.0, 'period_label': '(Mar/24)',
+        })
+        self.assertEqual([m['label'] for m in context['available_months'][1:]], ['Mar/24', 'Jan/24'])
+
+    def test_query_count_does_not_grow_with_history(self):
+        """tests that kpis and stats take a fixed number of queries, whatever the history length"""
+        for month in range(1, 13):
+            self.criar_nota(datetime(2023, month, 15), 'MILHO', '1', '10.00', self.pesagem)
+
+        with self.assertNumQueries(2):
+            DashboardService.get_kpis_and_charts(self.user, {})
+        with self.assertNumQueries(1):
+            stats = DashboardService.get_dashboard_stats(self.user)
+        self.assertEqual(stats['total_amostras'], 0)
+
+    def test_monthly_kpi_rollup_follows_changes(self):
+        """tests that signals keep the monthly kpi rollup current"""
+        self.assertEqual(KpiRollup.verify(), [])
+        janeiro = MonthlyKpi.objects.get(user=self.user, month=datetime(2024, 1, 1).date())
+        self.assertEqual((janeiro.notas, janeiro.receita, janeiro.custo, janeiro.frete), (2, 600, 260, 60))
+
+        self.pesagem.valor_frete_por_tonelada = Decimal('20.00')
+        self.pesagem.save()
+        nota = NotaCarregamento.objects.get(tipo_grao='MILHO')
+        nota.data_criacao = timezone.make_aware(datetime(2024, 3, 1, 12))
+        nota.save()
+        Pagamento.objects.create(registro_financeiro=nota.financeiro, valor=Decimal('100.00'))
+
+        self.assertEqual(KpiRollup.verify(), [])
+        janeiro.refresh_from_db()
+        marco = MonthlyKpi.objects.get(user=self.user, month=datetime(2024, 3, 1).date())
+        self.assertEqual((janeiro.notas, janeiro.frete, janeiro.pago), (1, 120, 1))
+        self.assertEqual((marco.notas, marco.receita, marco.pago, marco.milho), (2, 300, 1, 1))
+
+    def test_rebuild_monthly_kpis_command(self):
+        """tests drift detection and rebuild of the monthly kpi rollup"""
+        MonthlyKpi.objects.filter(month=datetime(2024, 3, 1).date()).update(receita=0)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_monthly_kpis', '--verify-only', stdout=io.StringIO())
+
+        call_command('rebuild_monthly_kpis', stdout=io.StringIO())
+        self.assertEqual(KpiRollup.verify(), [])
+
+    def test_monthly_report_of_closed_month(self):
+        """tests the monthly pdf report of a month read from the rollup"""
+        response = ReportGenerator.generate_monthly_report_pdf(self.user, 2024, 1)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content.startswith(b'%PDF'))
+
+
+class RecomputeServiceTest(TestCase):
+    """tests for the set-based financial recompute"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.pesagem = PesagemCaminhao.objects.create(
+            placa='ABC1234', tara=Decimal('1000'), peso_carregado=Decimal('7000'), tipo_grao='SOJA',
+            valor_custo_por_saco=Decimal('20.00'), valor_frete_por_tonelada=Decimal('10.00'),
+        )
+        self.notas = [
+            NotaCarregamento.objects.create(nome_recebedor='Cliente', tipo_grao='SOJA', quantidade_sacos=Decimal('10'),
+                                            preco_por_saco=Decimal('50.00'), created_by=self.user, pesagem=self.pesagem)
+            for _ in range(3)
+        ]
+
+    def test_deferred_payments_are_recomputed_once(self):
+        """tests that payments made in a deferred block update the records when it ends"""
+        with RecomputeService.deferred():
+            for nota, valor in zip(self.notas, ['500.00', '100.00']):
+                Pagamento.objects.create(registro_financeiro=nota.financeiro, valor=Decimal(valor))
+            self.assertEqual(RegistroFinanceiro.objects.filter(status_pagamento='PENDENTE').count(), 3)
+
+        registros = RegistroFinanceiro.objects.order_by('nota_id')
+        self.assertEqual([r.status_pagamento for r in registros], ['PAGO', 'PARCIAL', 'PENDENTE'])
+        self.assertEqual([r.valor_pago for r in registros], [Decimal('500.00'), Decimal('100.00'), Decimal('0.00')])
+        self.assertEqual(KpiRollup.verify(), [])
+
+    def test_pesagem_change_matches_atualizar_status(self):
+        """tests that a pesagem edit recomputes its notas as atualizar_status does"""
+        self.pesagem.valor_custo_por_saco = Decimal('12.35')
+        self.pesagem.valor_frete_por_tonelada = Decimal('7.25')
+        self.pesagem.save()
+        recomputed = list(RegistroFinanceiro.objects.order_by('pk').values_list('valor_custo_total', 'lucro'))
+
+        for registro in RegistroFinanceiro.objects.all():
+            registro.atualizar_status()
+        self.assertEqual(recomputed, list(RegistroFinanceiro.objects.order_by('pk').values_list('valor_custo_total', 'lucro')))
+        self.assertEqual(recomputed[0], (Decimal('167.00'), Decimal('333.00')))
+
+
+class BankStatementImportTest(TestCase):
+    """tests for the bank statement importer"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.notas = [
+            NotaCarregamento.objects.create(nome_recebedor=nome, cpf_cnpj_recebedor=doc, tipo_grao='SOJA',
+                                            quantidade_sacos=Decimal('10'), preco_por_saco=Decimal('50.00'),
+                                            created_by=self.user)
+            for nome, doc in [('Ana', '123.456.789-09'), ('Ana', '123.456.789-09'), ('Bruno', '12.345.678/0001-95')]
+        ]
+        self.hoje = timezone.localdate().strftime('%d/%m/%Y')
+
+    def importar(self, conteudo, nome='extrato.csv'):
+        return BankStatementImporter(self.user).run(parse_statement(conteudo.encode(), nome))
+
+    def test_csv_matches_by_document_and_amount(self):
+        """tests that credits pay notas by document (oldest first) and by unique amount"""
+        csv_text = (
+            "Data;Valor;Documento;Descrição\n"
+            f"{self.hoje};700,00;123.456.789-09;PIX RECEBIDO ANA\n"
+            f"{self.hoje};500,00;;BOLETO LIQUIDADO\n"
+            f"{self.hoje};-80,00;;TARIFA\n"
+            f"{self.hoje};33,00;;PIX DESCONHECIDO\n"
+        )
+        resultado = self.importar(csv_text)
+
+        self.assertEqual((resultado.created, resultado.debits, len(resultado.unmatched)), (3, 1, 1))
+        registros = RegistroFinanceiro.objects.order_by('nota_id')
+        self.assertEqual([r.status_pagamento for r in registros], ['PAGO', 'PARCIAL', 'PAGO'])
+        self.assertEqual([r.valor_pago for r in registros], [Decimal('500.00'), Decimal('200.00'), Decimal('500.00')])
+        self.assertEqual(Pagamento.objects.get(registro_financeiro__nota=self.notas[2]).metodo_pagamento, 'BOLETO')
+        self.assertEqual(KpiRollup.verify(), [])
+
+    def test_reimport_is_skipped(self):
+        """tests that importing the same statement twice creates no new payments"""
+        csv_text = f"data,valor,documento\n{self.hoje},100.00,12345678909\n{self.hoje},100.00,12345678909\n"
+        self.assertEqual(self.importar(csv_text).created, 2)
+
+        resultado = self.importar(csv_text)
+        self.assertEqual((resultado.created, resultado.duplicates), (0, 2))
+        self.assertEqual(Pagamento.objects.count(), 2)
+
+    def test_concurrent_duplicate_is_ignored(self):
+        """tests that a payment written for the same line after the lookup is not duplicated"""
+        linhas = parse_statement(f"data,valor,documento\n{self.hoje},100.00,{self.notas[2].cpf_cnpj_recebedor}\n".encode(),
+                                 'extrato.csv')
+        importer = BankStatementImporter(self.user)
+        index = importer._index
+
+        def index_after_other_import():
+            # Another path recorded the same bank line between the lookup and the write
+            Pagamento.objects.bulk_create([Pagamento(registro_financeiro=self.notas[2].financeiro, valor=Decimal('100.00'),
+                                                     id_transacao_bancaria=linhas[0].transaction_id)])
+            index()
+
+        with patch.object(importer, '_index', side_effect=index_after_other_import):
+            importer.run(linhas)
+
+        self.assertEqual(Pagamento.objects.filter(id_transacao_bancaria=linhas[0].transaction_id).count(), 1)
+        self.assertEqual(RegistroFinanceiro.objects.get(nota=self.notas[2]).valor_pago, Decimal('100.00'))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Pagamento.objects.create(registro_financeiro=self.notas[2].financeiro, valor=Decimal('100.00'),
+                                     id_transacao_bancaria=linhas[0].transaction_id)
+
+    def test_ofx(self):
+        """tests the OFX parser and that an amount shared by several notas is left unmatched"""
+        data = timezone.localdate().strftime('%Y%m%d')
+        ofx = (
+            "OFXHEADER:100\nDATA:OFXSGML\n\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>\n"
+            f"<STMTTRN>\n<TRNTYPE>CREDIT\n<DTPOSTED>{data}120000[-3:BRT]\n<TRNAMT>500.00\n<FITID>A1\n"
+            "<MEMO>PIX 12.345.678/0001-95 BRUNO\n</STMTTRN>\n"
+            f"<STMTTRN>\n<TRNTYPE>CREDIT\n<DTPOSTED>{data}\n<TRNAMT>500.00\n<FITID>A2\n<MEMO>TED\n</STMTTRN>\n"
+            "</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>"
+        )
+        linhas = parse_statement(ofx.encode(), 'extrato.ofx')
+        self.assertEqual([(linha.transaction_id, linha.document) for linha in linhas], [('ofx:A1', '12345678000195'), ('ofx:A2', '')])
+
+        resultado = BankStatementImporter(self.user).run(linhas)
+        self.assertEqual((resultado.created, len(resultado.unmatched)), (1, 1))
+        self.assertEqual(RegistroFinanceiro.objects.get(nota=self.notas[2]).status_pagamento, 'PAGO')
+
+    def test_import_view(self):
+        """tests the statement upload page"""
+        client = Client()
+        client.login(username='testuser', password='testpass123')
+        arquivo = io.BytesIO(f"data;valor;documento\n{self.hoje};500,00;12.345.678/0001-95\n".encode())
+        arquivo.name = 'extrato.csv'
+        response = client.post(reverse('prograos:pagamento_import'), {'arquivo': arquivo, 'dias_apos_nota': 120})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['resultado'].created, 1)
+
+
+def criar_pfx(password):
+    """self-signed A1-like .pfx for the certificate tests"""
+    from datetime import timedelta
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.hazmat.primitives.serialization import pkcs12
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(x509.NameOID.COMMON_NAME, 'PROGRAOS TESTE')])
+    now = datetime.utcnow()
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(x509.random_serial_number()).not_valid_before(now - timedelta(days=1))
+            .not_valid_after(now + timedelta(days=365)).sign(key, hashes.SHA256()))
+    return pkcs12.serialize_key_and_certificates(b'teste', key, cert, None,
+                                                 serialization.BestAvailableEncryption(password.encode()))
+
+
+class CertificateCacheTest(TestCase):
+    """tests for the process-level certificate cache"""
+
+    def setUp(self):
+        import tempfile
+        from django.core.files.base import ContentFile
+        from django.test import override_settings
+
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        CertificateCache.invalidate()
+        self.addCleanup(CertificateCache.invalidate)
+
+        self.config = CertificateConfig(name='A1', password='senha', valid_from='2024-01-01', valid_to='2099-01-01')
+        self.config.certificate_file.save('a1.pfx', ContentFile(criar_pfx('senha')))
+
+    def test_pfx_is_decrypted_once_per_version(self):
+        """tests that the .pfx is loaded once and reloaded after the config is saved"""
+        from cryptography.hazmat.primitives.serialization import pkcs12
+
+        with patch('prograos.certificate.pkcs12.load_key_and_certificates',
+                   wraps=pkcs12.load_key_and_certificates) as load:
+            for _ in range(3):
+                CertificateManager(self.config).load_certificate()
+                CertificateManager(CertificateConfig.objects.get(pk=self.config.pk)).get_key_pem()
+            self.assertEqual(load.call_count, 1)
+
+            context = CertificateManager(self.config).get_ssl_context()
+            self.assertIsInstance(context, ssl.SSLContext)
+            self.assertIs(CertificateManager(self.config).get_ssl_context(), context)
+
+            self.config.name = 'A1 renovado'
+            self.config.save()
+            self.assertIsNot(CertificateManager(self.config).get_ssl_context(), context)
+            self.assertEqual(load.call_count, 2)
+
+    def test_active_config_is_cached_until_saved(self):
+        """tests that the active config is reused while its version is unchanged"""
+        active = CertificateCache.active_config()
+        self.assertEqual(active, self.config)
+        with self.assertNumQueries(1):
+            self.assertIs(CertificateCache.active_config(), active)
+
+        self.config.is_active = False
+        self.config.save()
+        self.assertIsNone(CertificateCache.active_config())
+
+    def test_active_config_follows_changes_from_other_processes(self):
+        """tests that a change made elsewhere (no signal in this process) is seen on the next lookup"""
+        active = CertificateCache.active_config()
+        CertificateConfig.objects.filter(pk=self.config.pk).update(updated_at=active.updated_at + timedelta(seconds=1))
+        renewed = CertificateCache.active_config()
+        self.assertIsNot(renewed, active)
+        self.assertEqual(renewed.updated_at, active.updated_at + timedelta(seconds=1))
+
+        CertificateConfig.objects.filter(pk=self.config.pk).update(is_active=False)
+        self.assertIsNone(CertificateCache.active_config())
+
+
 if __name__ == '__main__':
     import django
     from django.conf import settings
@@ -19,7 +19,7 @@ from .views import (
     NotaListView, NotaDetailView, NotaCreateView, NotaUpdateView, NotaDeleteView,
     generate_nota_carregamento_pdf_view, generate_pesagem_ticket_pdf_view,
     RegistroFinanceiroListView, financeiro_detail_view,
-    PagamentoListView, PagamentoCreateView, PagamentoUpdateView, PagamentoDeleteView,
+    PagamentoListView, PagamentoCreateView, PagamentoUpdateView, PagamentoDeleteView, ExtratoImportView,
     calculadora_frete_view, export_recibo_pdf,
 )
 
@@ -81,6 +81,7 @@ ui_patterns = [
 
     # Pagamentos
     path('pagamentos/', PagamentoListView.as_view(), name='pagamento_list'),
+    path('pagamentos/importar-extrato/', ExtratoImportView.as_view(), name='pagamento_import'),
     path('pagamento/nota/<int:nota_pk>/novo/', PagamentoCreateView.as_view(), name='pagamento_create'),
     path('pagamento/<int:pk>/editar/', PagamentoUpdateView.as_view(), name='pagamento_update'),
     path('pagamento/<int:pk>/excluir/', PagamentoDeleteView.as_view(), name='pagamento_delete'),
@@ -1,4 +1,4 @@
-from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
+from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, FormView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse, reverse_lazy
 from django.shortcuts import redirect, render, get_object_or_404
@@ -9,7 +9,8 @@ from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.auth.decorators import login_required
 
 from prograos.models import NotaCarregamento, RegistroFinanceiro, Pagamento, PesagemCaminhao
-from prograos.forms import NotaCarregamentoForm, PagamentoForm, CalculadoraFreteForm
+from prograos.forms import NotaCarregamentoForm, PagamentoForm, CalculadoraFreteForm, ExtratoImportForm
+from prograos.services.bank_statement_service import BankStatementImporter, DAYS_BEFORE, parse_statement
 from prograos.services.finance_service import FinanceService
 from prograos.services.weighing_service import WeighingService
 from prograos.reports import ReportGenerator
@@ -224,6 +225,29 @@ class PagamentoDeleteView(LoginRequiredMixin, DeleteView):
         return reverse('prograos:financeiro_detail', kwargs={'nota_pk': self.object.registro_financeiro.nota.pk})
 
 
+class ExtratoImportView(LoginRequiredMixin, FormView):
+    form_class = ExtratoImportForm
+    template_name = 'prograos/extrato_import.html'
+
+    def form_valid(self, form):
+        arquivo = form.cleaned_data['arquivo']
+        try:
+            linhas = parse_statement(arquivo.read(), arquivo.name)
+        except ValueError as e:
+            form.add_error('arquivo', str(e))
+            return self.form_invalid(form)
+
+        importer = BankStatementImporter(self.request.user, days_before=DAYS_BEFORE,
+                                         days_after=form.cleaned_data['dias_apos_nota'])
+        resultado = importer.run(linhas)
+        messages.success(
+            self.request,
+            f"{resultado.created} pagamento(s) importado(s) em {len(resultado.notas)} nota(s); "
+            f"{len(resultado.unmatched)} lançamento(s) sem correspondência."
+        )
+        return self.render_to_response(self.get_context_data(form=ExtratoImportForm(), resultado=resultado))
+
+
 # --- CALCULADORA FRETE ---
 
 